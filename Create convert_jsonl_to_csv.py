@@ -1,21 +1,237 @@
-import json, csv, sys
+# Crawl JSONL -> CSV / Parquet / Arrow (id,url,title,excerpt,status,response_time_ms,has_form)
+# Usage: python "Create convert_jsonl_to_csv.py" <in.jsonl[.gz|.zst]> <out.csv|out.parquet|out.arrow|dataset_dir>
+#                [--format csv|parquet|arrow|dataset] [--workers N] [--chunk-mb 64] [--changed-only]
+#
+# Plain JSONL is split into byte ranges parsed in parallel by a process pool;
+# compressed input is streamed and its lines are parsed in parallel blocks.
+# At most 2 x workers tasks are in flight, so a multi-GB input is never queued
+# whole in memory. The input is read once: each task returns its rows numbered
+# from 0 and its line count, and the parent turns them into global ids as the
+# ordered results arrive.
+# id is the line number in the input (bad lines keep their number, as before).
+# A dataset_dir output (no suffix) starts a shared pipeline dataset (see dataset.py)
+# whose "crawl" column group holds these columns.
+
+import argparse, csv, io, os, sys
+from collections import Counter, deque
+from multiprocessing import Pool
 from pathlib import Path
-IN = Path(sys.argv[1])
-OUT = Path(sys.argv[2])
-with IN.open('r', encoding='utf-8') as fh, OUT.open('w', newline='', encoding='utf-8') as fo:
-    w = csv.writer(fo)
-    w.writerow(['id','url','title','excerpt','status','response_time_ms','has_form'])
-    for i,line in enumerate(fh):
+
+from crawl_records import BLOCK_LINES, COLUMNS, parse_lines
+from jsonl_writer import open_jsonl
+from metrics import stage
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Crawl JSONL -> CSV / Parquet / Arrow")
+    p.add_argument("input", help="Crawl JSONL (.jsonl, .jsonl.gz, .jsonl.zst)")
+    p.add_argument("output", help="Output file (.csv, .parquet, .arrow) or dataset directory")
+    p.add_argument("--format", choices=["csv", "parquet", "arrow", "dataset"], default=None,
+                   help="Output format (default: from the output suffix)")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parser processes")
+    p.add_argument("--chunk-mb", type=int, default=64, help="Byte-range size per task (plain JSONL)")
+    p.add_argument("--changed-only", action="store_true",
+                   help="Skip the pages a recrawl marked unchanged (only the delta)")
+    return p.parse_args()
+
+def output_format(path: Path, fmt=None) -> str:
+    if fmt:
+        return fmt
+    suffix = path.suffix.lower()
+    if suffix == "":
+        return "dataset"
+    if suffix in (".parquet", ".pq"):
+        return "parquet"
+    if suffix in (".arrow", ".feather", ".ipc"):
+        return "arrow"
+    return "csv"
+
+def render(rows, fmt: str):
+    """Rows without their id: (CSV text, end offset of each row) or a column dict
+    (for Arrow / Parquet). The parent adds the ids (with_ids)."""
+    if fmt == "csv":
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        ends = []
+        for r in rows:
+            w.writerow(r)
+            ends.append(buf.tell())
+        return buf.getvalue(), ends
+    cols = {c: [] for c in COLUMNS}
+    for r in rows:
+        for c, v in zip(COLUMNS[1:], r):
+            cols[c].append(v)
+    return cols
+
+def with_ids(ids, part, fmt: str, offset: int):
+    """render() output + ids (line numbers in the task) shifted by `offset` -> sink chunk."""
+    if fmt == "csv":
+        text, ends = part
+        out, a = [], 0
+        for i, b in zip(ids, ends):
+            out.append(f"{i + offset},")
+            out.append(text[a:b])
+            a = b
+        return "".join(out)
+    part['id'] = [i + offset for i in ids]
+    return part
+
+# BYTE RANGES (plain JSONL)
+def split_ranges(path: Path, chunk_bytes: int):
+    """[start, end) byte ranges aligned on line starts."""
+    size = path.stat().st_size
+    bounds = [0]
+    with path.open('rb') as fh:
+        pos = chunk_bytes
+        while pos < size:
+            fh.seek(pos)
+            fh.readline()
+            pos = fh.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+            pos += chunk_bytes
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        return fh.read(end - start)
+
+def convert_range(task):
+    """(ids from 0, render() output, dropped, lines in the range)"""
+    path, start, end, fmt, changed_only = task
+    lines = read_range(path, start, end).split(b"\n")
+    if lines and lines[-1] == b"":
+        lines.pop()
+    ids, rows, dropped = parse_lines(lines, 0, changed_only)
+    return ids, render(rows, fmt), dropped, len(lines)
+
+def convert_block(task):
+    lines, fmt, changed_only = task
+    ids, rows, dropped = parse_lines(lines, 0, changed_only)
+    return ids, render(rows, fmt), dropped, len(lines)
+
+def compressed_blocks(path: Path, fmt: str, changed_only: bool = False):
+    with open_jsonl(path) as fh:
+        block = []
+        for line in fh:
+            block.append(line.encode('utf-8'))
+            if len(block) >= BLOCK_LINES:
+                yield block, fmt, changed_only
+                block = []
+        if block:
+            yield block, fmt, changed_only
+
+def ordered_results(pool, fn, tasks, window: int):
+    """fn(task) for each task, in order, with at most `window` tasks submitted and not
+    yet consumed (Pool.imap would drain the task iterator into its queue)."""
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(fn, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+# OUTPUT
+class Sink:
+    def __init__(self, path: Path, fmt: str):
+        self.fmt = fmt
+        self.path = path
+        self.dataset = None
+        if fmt == "dataset":
+            from dataset import Dataset
+            self.dataset = Dataset.create(path)
+            path = path / "crawl.parquet"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if fmt == "csv":
+            self.fo = path.open('w', newline='', encoding='utf-8')
+            csv.writer(self.fo).writerow(COLUMNS)
+            return
         try:
-            obj = json.loads(line)
-        except:
-            continue
-        w.writerow([
-            i,
-            obj.get('url',''),
-            obj.get('title',''),
-            obj.get('excerpt',''),
-            obj.get('status',-1),
-            obj.get('response_time_ms',0.0),
-            int(bool(obj.get('has_form', False)))
+            import pyarrow as pa
+        except ImportError:
+            raise SystemExit(f"[ERR] pyarrow is required for --format {fmt} (pip install pyarrow)")
+        self.pa = pa
+        self.schema = pa.schema([
+            ('id', pa.int64()), ('url', pa.string()), ('title', pa.string()),
+            ('excerpt', pa.string()), ('status', pa.int64()),
+            ('response_time_ms', pa.float64()), ('has_form', pa.int8()),
         ])
+        if fmt in ("parquet", "dataset"):
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(str(path), self.schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(str(path), self.schema)
+
+    def write(self, chunk):
+        if self.fmt == "csv":
+            self.fo.write(chunk)
+        elif chunk['id']:
+            self.writer.write_table(self.pa.Table.from_pydict(chunk, schema=self.schema))
+
+    def close(self):
+        if self.fmt == "csv":
+            self.fo.close()
+        else:
+            self.writer.close()
+        if self.dataset is not None:
+            self.dataset.register_group("crawl", "crawl.parquet")
+
+class _Done:
+    def __init__(self, value):
+        self.value = value
+    def get(self):
+        return self.value
+
+class _Inline:
+    """Pool stand-in for --workers 1 (no subprocess)."""
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def apply_async(self, fn, args):
+        return _Done(fn(*args))
+
+def main():
+    args = parse_args()
+    IN = Path(args.input)
+    OUT = Path(args.output)
+    if not IN.exists():
+        print(f"[ERR] File not found: {IN}")
+        sys.exit(2)
+    fmt = output_format(OUT, args.format)
+    workers = max(1, args.workers)
+    compressed = IN.name.endswith(('.gz', '.zst'))
+
+    if compressed:
+        tasks = compressed_blocks(IN, fmt, args.changed_only)
+        fn = convert_block
+    else:
+        ranges = split_ranges(IN, max(1, args.chunk_mb) << 20)
+        tasks = [(str(IN), s, e, fmt, args.changed_only) for s, e in ranges]
+        fn = convert_range
+
+    print(f"[INFO] {IN} → {OUT} ({fmt}, {workers} workers{', compressed input' if compressed else ''})")
+    n_rows, n_lines, dropped = 0, 0, Counter()
+    with stage("convert") as st:
+        sink = Sink(OUT, fmt)
+        try:
+            with Pool(workers) if workers > 1 else _Inline() as pool:
+                for ids, part, d, lines in ordered_results(pool, fn, tasks, 2 * workers):
+                    sink.write(with_ids(ids, part, fmt, n_lines))
+                    n_rows += len(ids)
+                    n_lines += lines
+                    dropped.update(d)
+        finally:
+            sink.close()
+        n_dropped = sum(dropped.values())
+        st.rows_in, st.rows_out = n_rows + n_dropped, n_rows
+
+    detail = ", ".join(f"{k}={v}" for k, v in sorted(dropped.items()))
+    print(f"[OK] {n_rows} rows written → {OUT}  (dropped {n_dropped} lines{': ' + detail if detail else ''})")
+
+if __name__ == "__main__":
+    main()
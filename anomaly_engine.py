@@ -0,0 +1,250 @@
+# Anomaly scoring engine used by detect_and_merge_git.py
+#
+# - fit on a random subsample of X (IsolationForest only looks at max_samples
+#   rows per tree anyway, so fitting on millions of rows buys nothing)
+# - score X in row chunks, in parallel, in a single pass (X can be a memmap)
+# - predictions come from the decision threshold, not from a second pass:
+#   predict(X) == where(decision_function(X) < 0, -1, 1)
+# - the fitted detector can be saved and reused on a later crawl
+#
+# Detectors (all expose fit(X) / decision_function(X), negative = anomaly):
+#   isolation_forest  sklearn IsolationForest
+#   centroid          distance to the nearest k-means center (the saved `centers`),
+#                     only a distance quantile is "fitted"
+#   lof               LocalOutlierFactor(novelty=True) fitted on at most LOF_SAMPLE rows
+#
+# per_cluster=True fits and scores one detector per k-means cluster, clusters
+# spread over a process pool, so small clusters get their own threshold
+# instead of being judged against the large ones.
+#
+# X may be a scipy.sparse CSR matrix (run_kmeans_sklearn.py --sparse): row slices
+# stay sparse, the centroid distance is computed on the sparse rows, and
+# IsolationForest / LOF take the CSR input as is.
+
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.ensemble import IsolationForest
+from sklearn.neighbors import LocalOutlierFactor
+
+ENGINE_FORMAT = 1
+DETECTORS = ("isolation_forest", "centroid", "lof")
+LOF_SAMPLE = 20_000         # LOF fit cost grows ~quadratically, keep its sample small
+LOF_NEIGHBORS = 20
+MIN_CLUSTER_ROWS = 10       # per-cluster mode: smaller clusters are left unscored (normal)
+
+class CentroidDistance:
+    """Distance to the nearest center; decision = 1 - d / threshold (< 0 beyond the quantile)."""
+    def __init__(self, centers, contamination: float = 0.02):
+        self.centers = np.asarray(centers, dtype=np.float64)
+        self.contamination = contamination
+        self.threshold_ = None
+
+    def distances(self, X):
+        if sp.issparse(X):
+            X = sp.csr_matrix(X, dtype=np.float64)
+            sq = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+        else:
+            X = np.asarray(X, dtype=np.float64)
+            sq = (X * X).sum(axis=1)
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, nearest center per row
+        d2 = sq[:, None] - 2.0 * np.asarray(X @ self.centers.T) + (self.centers ** 2).sum(axis=1)
+        return np.sqrt(np.maximum(d2.min(axis=1), 0.0))
+
+    def fit(self, X):
+        d = self.distances(X)
+        self.threshold_ = float(np.quantile(d, 1.0 - self.contamination)) if len(d) else 0.0
+        return self
+
+    def decision_function(self, X):
+        d = self.distances(X)
+        if self.threshold_ <= 0:
+            return np.where(d > 0, -1.0, 0.0)
+        return 1.0 - d / self.threshold_
+
+def make_detector(name: str, contamination: float, n_estimators: int = 200, centers=None,
+                  n_jobs: int = -1, random_state: int = 42, n_rows: int = None):
+    if name == "isolation_forest":
+        return IsolationForest(n_estimators=n_estimators, contamination=contamination,
+                               random_state=random_state, n_jobs=n_jobs)
+    if name == "centroid":
+        if centers is None:
+            raise ValueError("the centroid detector needs the k-means centers")
+        return CentroidDistance(centers, contamination)
+    if name == "lof":
+        n_neighbors = LOF_NEIGHBORS if n_rows is None else max(1, min(LOF_NEIGHBORS, n_rows - 1))
+        return LocalOutlierFactor(n_neighbors=n_neighbors, contamination=contamination,
+                                  novelty=True, n_jobs=n_jobs)
+    raise ValueError(f"unknown detector '{name}' (expected one of {', '.join(DETECTORS)})")
+
+def _rows(X, idx):
+    """X[idx] read into memory: an array (X may be a memmap) or a CSR matrix."""
+    return X[idx] if sp.issparse(X) else np.asarray(X[idx])
+
+def _decision_chunk(model, X, start: int, stop: int):
+    return model.decision_function(_rows(X, slice(start, stop)))
+
+def _decision(model, X, chunk_size: int):
+    n = X.shape[0]
+    parts = [_decision_chunk(model, X, a, min(n, a + chunk_size)) for a in range(0, n, chunk_size)]
+    return np.concatenate(parts) if parts else np.empty(0)
+
+def _sample_rows(n: int, size: int, random_state: int):
+    if size and n > size:
+        rng = np.random.default_rng(random_state)
+        return np.sort(rng.choice(n, size=size, replace=False))
+    return np.arange(n)
+
+def _cluster_task(params: dict, X_c, model=None):
+    """Fit (unless a fitted `model` is given) and score the rows of one cluster."""
+    if model is None:
+        rows = _sample_rows(X_c.shape[0], params["fit_sample"], params["random_state"])
+        model = make_detector(params["detector"], params["contamination"], params["n_estimators"],
+                              centers=params["centers"], n_jobs=1, random_state=params["random_state"],
+                              n_rows=len(rows))
+        model.fit(_rows(X_c, rows))
+    return model, _decision(model, X_c, params["chunk_size"])
+
+class AnomalyEngine:
+    def __init__(self, contamination: float = 0.02, n_estimators: int = 200,
+                 fit_sample: int = 100_000, chunk_size: int = 50_000, n_jobs: int = -1,
+                 random_state: int = 42, detector: str = "isolation_forest", centers=None,
+                 per_cluster: bool = False):
+        if detector not in DETECTORS:
+            raise ValueError(f"unknown detector '{detector}' (expected one of {', '.join(DETECTORS)})")
+        self.contamination = contamination
+        self.n_estimators = n_estimators
+        self.fit_sample = fit_sample
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.detector = detector
+        self.centers = None if centers is None else np.asarray(centers)
+        self.per_cluster = per_cluster
+        self.model = None           # detector, or {cluster: detector} in per-cluster mode
+        self.meta = {}
+
+    def _fit_sample(self) -> int:
+        if self.detector == "lof":
+            return min(self.fit_sample, LOF_SAMPLE) if self.fit_sample else LOF_SAMPLE
+        return self.fit_sample
+
+    def _params(self, cluster=None) -> dict:
+        centers = self.centers
+        if centers is not None and cluster is not None:
+            centers = centers[cluster:cluster + 1]      # distance to the cluster's own center
+        return {"detector": self.detector, "contamination": self.contamination,
+                "n_estimators": self.n_estimators, "fit_sample": self._fit_sample(),
+                "chunk_size": self.chunk_size, "random_state": self.random_state, "centers": centers}
+
+    def _set_meta(self, X, fit_rows: int):
+        self.meta = {
+            "format": ENGINE_FORMAT,
+            "detector": self.detector,
+            "per_cluster": self.per_cluster,
+            "n_features": int(X.shape[1]),
+            "fit_rows": int(fit_rows),
+            "contamination": self.contamination,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    def fit(self, X, labels=None):
+        """Fit the global detector. Per-cluster detectors are fitted by fit_score()."""
+        if self.per_cluster:
+            self.fit_score(X, labels)
+            return self
+        rows = _sample_rows(X.shape[0], self._fit_sample(), self.random_state)
+        self.model = make_detector(self.detector, self.contamination, self.n_estimators,
+                                   centers=self.centers, n_jobs=self.n_jobs,
+                                   random_state=self.random_state, n_rows=len(rows))
+        self.model.fit(_rows(X, rows))
+        self._set_meta(X, len(rows))
+        return self
+
+    def fit_score(self, X, labels=None):
+        """fit() then score(); in per-cluster mode both happen in one pass over each cluster."""
+        if not self.per_cluster:
+            return self.fit(X).score(X)
+        self.model = None
+        return self._score_clusters(X, labels, fit=True)
+
+    def score(self, X, labels=None):
+        """(decision, pred) in one pass: decision < 0 <=> pred == -1 (anomaly)."""
+        if self.model is None:
+            raise RuntimeError("fit() or load() the engine first")
+        if X.shape[1] != self.meta.get("n_features", X.shape[1]):
+            raise ValueError(f"detector expects {self.meta['n_features']} features, X has {X.shape[1]}")
+        if self.per_cluster:
+            return self._score_clusters(X, labels, fit=False)
+        n = X.shape[0]
+        bounds = [(a, min(n, a + self.chunk_size)) for a in range(0, n, self.chunk_size)]
+        if len(bounds) > 1 and self.n_jobs != 1:
+            parts = Parallel(n_jobs=self.n_jobs)(
+                delayed(_decision_chunk)(self.model, X, a, b) for a, b in bounds)
+        else:
+            parts = [_decision_chunk(self.model, X, a, b) for a, b in bounds]
+        decision = np.concatenate(parts) if parts else np.empty(0)
+        pred = np.where(decision < 0, -1, 1)
+        return decision, pred
+
+    def _score_clusters(self, X, labels, fit: bool):
+        if labels is None:
+            raise ValueError("per-cluster scoring needs the cluster labels")
+        labels = np.asarray(labels)
+        if len(labels) != X.shape[0]:
+            raise ValueError(f"{len(labels)} labels for {X.shape[0]} rows")
+        order = np.argsort(labels, kind="stable")
+        clusters, starts = np.unique(labels[order], return_index=True)
+        groups = np.split(order, starts[1:]) if len(order) else []
+        models = {} if fit else self.model
+        todo, skipped = [], 0
+        for c, rows in zip(clusters.tolist(), groups):
+            if fit and len(rows) < MIN_CLUSTER_ROWS:
+                skipped += 1
+                continue
+            if not fit and c not in models:
+                skipped += 1
+                continue
+            todo.append((c, rows))
+        if skipped:
+            print(f"[WARN] {skipped} cluster(s) left unscored "
+                  f"({'fewer than %d rows' % MIN_CLUSTER_ROWS if fit else 'unknown to the detector'})")
+        # biggest clusters first so the pool is not left waiting on one at the end
+        todo.sort(key=lambda t: -len(t[1]))
+        jobs = (delayed(_cluster_task)(self._params(c), _rows(X, rows), None if fit else models[c])
+                for c, rows in todo)
+        if len(todo) > 1 and self.n_jobs != 1:
+            results = Parallel(n_jobs=self.n_jobs)(jobs)
+        else:
+            results = [f(*a, **kw) for f, a, kw in jobs]
+        decision = np.zeros(X.shape[0], dtype=np.float64)     # unscored rows: normal, on the threshold
+        for (c, rows), (model, dec) in zip(todo, results):
+            decision[rows] = dec
+            models[c] = model
+        if fit:
+            self.model = models
+            self._set_meta(X, sum(min(len(r), self._fit_sample() or len(r)) for _, r in todo))
+        pred = np.where(decision < 0, -1, 1)
+        return decision, pred
+
+    # ---- persistence ----
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump({"meta": self.meta, "model": self.model}, path, compress=3)
+
+    @classmethod
+    def load(cls, path: Path, **kwargs):
+        blob = joblib.load(Path(path))
+        meta = blob.get("meta", {})
+        if meta.get("format") != ENGINE_FORMAT:
+            raise ValueError(f"unsupported detector file: {path}")
+        eng = cls(contamination=meta["contamination"], detector=meta.get("detector", "isolation_forest"),
+                  per_cluster=meta.get("per_cluster", False), **kwargs)
+        eng.model = blob["model"]
+        eng.meta = meta
+        return eng
@@ -0,0 +1,444 @@
+# Benchmarks for the pipeline stages on synthetic WordPress-like crawls
+#
+#   python benchmark.py run  [--sizes 10k,100k,1m,10m] [--work-dir bench/tmp] [--out bench/results.json]
+#                            [--baseline bench/baseline.json] [--save-baseline] [--tolerance 0.25]
+#                            [--repeat 3] [--crawl-pages 500] [--url2vec-path PATH]
+#   python benchmark.py gen  <rows> <out.jsonl>             # synthetic crawl JSONL only
+#   python benchmark.py serve [--port 8089] [--site-pages 5000]   # stand-in WordPress site
+#
+# run: for each size, generate a crawl JSONL (slim records, same fields as
+# crawling.py OUTPUT_MODE="slim"), then run the real scripts on it as
+# subprocesses, dataset directory in / out:
+#   convert -> tokenize -> kmeans (--streaming from --streaming-from rows) -> representatives -> detect
+# Each stage reports its process wall time and, through metrics.py
+# (METRICS_JSON), the stage wall / CPU time and peak RSS. Without
+# --url2vec-path the tokenizer runs its regex fallback.
+#
+# The crawler is benchmarked offline against the stand-in site (a local HTTP
+# server generating WordPress-like pages with links and forms): crawling.crawl()
+# runs unchanged, only the browser is replaced by a plain HTTP fetcher.
+#
+# --baseline compares every (size, stage) with a stored run: a stage is a
+# regression when its wall time or peak RSS grows by more than --tolerance
+# (and by more than NOISE_S seconds / NOISE_MB MB); the exit code is then 1.
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+HERE = Path(__file__).resolve().parent
+CONVERT_SCRIPT = "Create convert_jsonl_to_csv.py"
+GEN_CHUNK = 200_000
+NOISE_S = 0.05      # wall-time differences below this are ignored
+NOISE_MB = 16.0     # peak RSS differences below this are ignored
+
+# --------- SYNTHETIC CORPUS ---------
+POST_TYPES = ["post", "page", "attachment", "product", "wp_block"]
+COLUMNS_SORT = ["title", "date", "author", "comment_count", "modified"]
+ROLES = ["administrator", "editor", "author", "contributor", "subscriber"]
+PLUGINS = ["wpcf7", "woocommerce", "wpseo_dashboard", "jetpack", "akismet", "elementor"]
+TABS = ["general", "advanced", "tools", "status", "settings"]
+WORDS = ["hello", "world", "sample", "news", "release", "guide", "review", "howto", "update", "event",
+         "summer", "team", "product", "about", "contact", "blog", "shop", "faq", "privacy", "terms"]
+AJAX = ["heartbeat", "query-attachments", "wp-remove-post-lock", "closed-postboxes", "get-community-events"]
+ODD = ["/wp-admin/plugin-editor.php?file=akismet/akismet.php", "/xmlrpc.php", "/wp-content/debug.log",
+       "/wp-admin/install.php?step=1", "/wp-config.php.bak", "/wp-admin/setup-config.php",
+       "/wp-includes/wlwmanifest.xml", "/wp-admin/theme-editor.php?file=functions.php"]
+
+def _pick(rng, values, n):
+    return pd.Series(np.asarray(values, dtype=object)[rng.integers(0, len(values), n)])
+
+def _num(rng, lo, hi, n):
+    return pd.Series(rng.integers(lo, hi, n)).astype(str)
+
+# (weight, has_form, url builder); weights are skewed like a real admin crawl
+TEMPLATES = [
+    (0.20, 1, lambda r, n: "/wp-admin/post.php?post=" + _num(r, 1, 50_000, n) + "&action=edit"),
+    (0.14, 0, lambda r, n: "/wp-admin/edit.php?post_type=" + _pick(r, POST_TYPES, n) + "&paged=" + _num(r, 1, 400, n)),
+    (0.08, 0, lambda r, n: "/wp-admin/edit.php?orderby=" + _pick(r, COLUMNS_SORT, n) + "&order=" + _pick(r, ["asc", "desc"], n)),
+    (0.12, 0, lambda r, n: "/?p=" + _num(r, 1, 50_000, n)),
+    (0.10, 0, lambda r, n: "/" + _num(r, 2012, 2026, n) + "/" + _num(r, 10, 13, n) + "/" + _pick(r, WORDS, n) + "-" + _pick(r, WORDS, n) + "/"),
+    (0.08, 0, lambda r, n: "/category/" + _pick(r, WORDS, n) + "/page/" + _num(r, 2, 60, n) + "/"),
+    (0.05, 0, lambda r, n: "/tag/" + _pick(r, WORDS, n) + "/"),
+    (0.04, 1, lambda r, n: "/wp-admin/users.php?role=" + _pick(r, ROLES, n) + "&paged=" + _num(r, 1, 40, n)),
+    (0.05, 1, lambda r, n: "/wp-admin/admin.php?page=" + _pick(r, PLUGINS, n) + "&tab=" + _pick(r, TABS, n)),
+    (0.03, 1, lambda r, n: "/wp-admin/options-" + _pick(r, ["general", "writing", "reading", "discussion", "media", "permalink"], n) + ".php"),
+    (0.03, 0, lambda r, n: "/author/" + _pick(r, ["admin", "editor", "jdoe", "asmith", "guest"], n) + "/"),
+    (0.04, 1, lambda r, n: "/?s=" + _pick(r, WORDS, n) + "+" + _pick(r, WORDS, n)),
+    (0.02, 0, lambda r, n: "/wp-admin/upload.php?item=" + _num(r, 1, 20_000, n)),
+    (0.015, 0, lambda r, n: "/wp-admin/admin-ajax.php?action=" + _pick(r, AJAX, n)),
+    (0.01, 0, lambda r, n: "/wp-json/wp/v2/" + _pick(r, ["posts", "pages", "users", "media", "comments"], n) + "/" + _num(r, 1, 5000, n)),
+    (0.005, 0, lambda r, n: _pick(r, ODD, n)),      # rare, slow / failing endpoints
+]
+
+def synthetic_chunk(rng, n: int, base: str = "http://wp.bench.local") -> pd.Series:
+    """n crawl JSONL lines (slim records) as a string Series, built column-wise."""
+    w = np.array([t[0] for t in TEMPLATES])
+    kind = rng.choice(len(TEMPLATES), size=n, p=w / w.sum())
+    url = pd.Series("", index=range(n), dtype=object)
+    form = np.zeros(n, dtype=np.int8)
+    for i, (_, has_form, build) in enumerate(TEMPLATES):
+        rows = np.flatnonzero(kind == i)
+        if len(rows):
+            url.iloc[rows] = (base + build(rng, len(rows))).to_numpy()
+            form[rows] = has_form
+    odd = kind == len(TEMPLATES) - 1
+    status = np.where(odd, rng.choice([403, 404, 500], n), np.where(rng.random(n) < 0.02, 404, 200))
+    rt = rng.lognormal(mean=5.0, sigma=0.5, size=n) * np.where(odd, 8.0, 1.0)
+    title = _pick(rng, WORDS, n).str.title() + " ‹ Bench Site — WordPress"
+    excerpt = "Lorem " + _pick(rng, WORDS, n) + " " + _pick(rng, WORDS, n) + " ipsum"
+    return ('{"url": "' + url + '", "status": ' + pd.Series(status).astype(str)
+            + ', "title": "' + title + '", "excerpt": "' + excerpt
+            + '", "response_time_ms": ' + pd.Series(np.round(rt, 3)).astype(str)
+            + ', "has_form": ' + pd.Series(np.where(form == 1, "true", "false"))
+            + ', "meta": {}, "params": {}}')
+
+def generate_corpus(rows: int, out: Path, seed: int = 42) -> Path:
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    with out.open("w", encoding="utf-8") as fh:
+        for start in range(0, rows, GEN_CHUNK):
+            lines = synthetic_chunk(rng, min(GEN_CHUNK, rows - start))
+            fh.write("\n".join(lines.tolist()))
+            fh.write("\n")
+    return out
+
+# --------- STAND-IN SITE ---------
+class StandInSite:
+    """Local WordPress-like site: deterministic pages, ~links_per_page links each, some with forms."""
+    def __init__(self, port: int = 0, site_pages: int = 5000, links_per_page: int = 8, latency_ms: float = 0.0):
+        self.site_pages = site_pages
+        self.links_per_page = links_per_page
+        self.latency_ms = latency_ms
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if site.latency_ms:
+                    time.sleep(site.latency_ms / 1000.0)
+                status, body = site.page(self.path)
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _links(self, path: str):
+        h = int(hashlib.sha256(path.encode("utf-8")).hexdigest()[:16], 16)
+        rng = np.random.default_rng(h)
+        out = []
+        for _ in range(self.links_per_page):
+            k, pid = int(rng.integers(0, 6)), int(rng.integers(1, self.site_pages))
+            out.append(["/wp-admin/post.php?post=%d&action=edit" % pid,
+                        "/wp-admin/edit.php?post_type=%s&paged=%d" % (POST_TYPES[pid % 5], pid % 50 + 1),
+                        "/?p=%d" % pid,
+                        "/category/%s/page/%d/" % (WORDS[pid % 20], pid % 30 + 2),
+                        "/wp-admin/admin.php?page=%s&tab=%s" % (PLUGINS[pid % 6], TABS[pid % 5]),
+                        "/wp-admin/users.php?role=%s&paged=%d" % (ROLES[pid % 5], pid % 20 + 1)][k])
+        return out
+
+    def page(self, path: str):
+        if any(path.startswith(o.split("?")[0]) for o in ODD):
+            return 500, "<html><body><h1>Internal Server Error</h1></body></html>"
+        links = "".join(f'<li><a href="{l}">{l}</a></li>' for l in self._links(path))
+        form = ""
+        if "action=edit" in path or "admin.php" in path or "users.php" in path:
+            form = ('<form method="post" action="/wp-admin/post.php"><input name="post_title">'
+                    '<input type="hidden" name="_wpnonce" value="x"><button>Save</button></form>')
+        title = f"{path.strip('/').split('?')[0] or 'Dashboard'} ‹ Bench Site — WordPress"
+        return 200, (f"<html><head><title>{title}</title></head><body id=\"wpadminbar\">"
+                     f"<h1>{title}</h1><ul>{links}</ul>{form}<p>Lorem ipsum dolor sit amet.</p></body></html>")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+HREF_RE = re.compile(r'href="([^"]+)"')
+TITLE_RE = re.compile(r"<title>(.*?)</title>", re.S)
+
+class HttpFetcher:
+    """Browser stand-in with the AsyncWebCrawler.arun() surface crawling.crawl() uses."""
+    def _get(self, url: str):
+        try:
+            with urllib.request.urlopen(url, timeout=30) as resp:
+                status, final, html = resp.status, resp.geturl(), resp.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            status, final, html = e.code, url, e.read().decode("utf-8", "replace")
+        title = TITLE_RE.search(html)
+        return SimpleNamespace(
+            url=final, status_code=status, html=html,
+            metadata={"title": title.group(1) if title else None},
+            markdown=re.sub(r"<[^>]+>", " ", html),
+            links={"internal": [{"href": h} for h in HREF_RE.findall(html)]},
+        )
+
+    async def arun(self, url: str, config=None):
+        return await asyncio.to_thread(self._get, url)
+
+def bench_crawl(pages: int, concurrency: int, work_dir: Path, latency_ms: float = 0.0) -> dict:
+    try:
+        import crawling
+    except ImportError as e:
+        print(f"[WARN] crawl benchmark skipped (crawling.py needs {e.name})")
+        return {}
+    import metrics
+    from crawl_state import CrawlState
+    from jsonl_writer import JsonlWriter
+
+    site = StandInSite(site_pages=max(1000, pages * 4), latency_ms=latency_ms).start()
+    try:
+        crawling.BASE_SCOPE = site.base
+        crawling.ADMIN_URL = f"{site.base}/wp-admin/"
+        crawling.MAX_PAGES = pages
+        crawling.MAX_DEPTH = 50
+        crawling.DELAY_S = 0.0
+        crawling.VERBOSE = False
+        crawling.OUTPUT_MODE = "slim"
+        tmp = Path(tempfile.mkdtemp(dir=work_dir))
+        store = CrawlState(tmp / "state.sqlite")
+        t0 = time.perf_counter()
+        with JsonlWriter(tmp / "crawl.jsonl", mode="w", batch_size=crawling.WRITE_BATCH) as fout:
+            written = asyncio.run(crawling.crawl(HttpFetcher(), None, fout, store, concurrency=concurrency))
+        wall = time.perf_counter() - t0
+        store.close()
+    finally:
+        site.stop()
+    lat = metrics.METRICS.histograms.get("crawl_fetch_latency_ms")
+    q = metrics.METRICS.gauges.get("crawl_queue_depth")
+    return {"pages": written, "concurrency": concurrency, "wall_s": round(wall, 4),
+            "pages_per_s": round(written / wall, 2) if wall else None,
+            "fetch_latency_mean_ms": round(lat.sum / lat.count, 3) if lat and lat.count else None,
+            "queue_depth_max": q.max if q else None}
+
+# --------- STAGES ---------
+def parse_size(s: str) -> int:
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1:], 1)
+    return int(float(s[:-1] if mult > 1 else s) * mult)
+
+def run_stage(name: str, script: str, argv, metrics_dir: Path) -> dict:
+    metrics_json = metrics_dir / f"{name}.json"
+    env = dict(os.environ, METRICS_JSON=str(metrics_json))
+    env.pop("METRICS_PROM", None)
+    env.pop("METRICS_PROFILE", None)
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, str(HERE / script)] + [str(a) for a in argv],
+                          env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        tail = "\n".join((proc.stdout + proc.stderr).strip().splitlines()[-5:])
+        print(f"[ERR] {name} failed (exit {proc.returncode}):\n{tail}")
+        return {"error": proc.returncode, "wall_s": round(wall, 4)}
+    res = {"wall_s": round(wall, 4)}
+    if metrics_json.exists():
+        m = json.loads(metrics_json.read_text(encoding="utf-8"))
+        top = [s for s in m["stages"] if "/" not in s["stage"]]
+        if top:
+            res.update(stage_s=round(sum(s["wall_s"] for s in top), 4),
+                       cpu_s=round(sum(s["cpu_s"] for s in top), 4),
+                       peak_rss_mb=max(s["peak_rss_mb"] for s in top))
+        res["substages"] = {s["stage"]: s["wall_s"] for s in m["stages"] if "/" in s["stage"]}
+    return res
+
+def bench_size(rows: int, work_dir: Path, args) -> dict:
+    d = work_dir / f"n{rows}"
+    d.mkdir(parents=True, exist_ok=True)
+    jsonl, ds, mdir = d / "crawl.jsonl", d / "dataset", d / "metrics"
+    mdir.mkdir(exist_ok=True)
+    if not jsonl.exists() or args.regen:
+        print(f"[STEP] generating {rows} rows → {jsonl}")
+        t0 = time.perf_counter()
+        generate_corpus(rows, jsonl, seed=args.seed)
+        print(f"[OK] generated in {time.perf_counter() - t0:.1f}s")
+    u2v = args.url2vec_path
+    if not u2v:
+        u2v = d / "no_url2vec"      # empty dir: the tokenizer falls back to its regex split
+        u2v.mkdir(exist_ok=True)
+    streaming = rows >= args.streaming_from
+    plan = [
+        ("convert", CONVERT_SCRIPT, [jsonl, ds]),
+        ("tokenize", "tokenise_with_url2vec.py", [ds, ds, "--url2vec-path", u2v]),
+        # streaming and in-memory k-means are different stages for the baseline comparison
+        ("kmeans_streaming" if streaming else "kmeans", "run_kmeans_sklearn.py",
+         [ds, args.k, ds] + (["--streaming"] if streaming else [])),
+        ("representatives", "select_representatives_git.py", [ds, ds, d / "reps.json"]),
+        ("detect", "detect_and_merge_git.py", ["--csv", ds, "--npz", ds, "--reps", d / "reps.json",
+                                               "--out", d / "seeds.json"]),
+    ]
+    out = {}
+    for rep in range(max(1, args.repeat)):
+        if ds.exists():
+            for f in sorted(ds.rglob("*"), reverse=True):
+                f.unlink() if f.is_file() else f.rmdir()
+            ds.rmdir()
+        for name, script, argv in plan:
+            res = run_stage(name, script, argv, mdir)
+            # keep the fastest run of each stage (least disturbed by the rest of the machine)
+            if name not in out or "error" in res or res["wall_s"] < out[name]["wall_s"]:
+                out[name] = res
+            extra = f", peak {res['peak_rss_mb']} MB" if "peak_rss_mb" in res else ""
+            print(f"[BENCH] n={rows:<9} {name:<16} {res['wall_s']:8.2f}s{extra}"
+                  + (f"  (run {rep + 1}/{args.repeat})" if args.repeat > 1 else ""))
+            if "error" in res:
+                return out
+    return out
+
+# --------- BASELINE ---------
+def compare(results: dict, baseline: dict, tolerance: float):
+    """[(size, stage, metric, base, new, ratio)] of the regressions; prints the comparison table."""
+    regressions = []
+    print(f"[BENCH] comparison with baseline ({baseline.get('created_at', '?')}), tolerance {tolerance:.0%}")
+    for size, stages in results["stages"].items():
+        base_stages = baseline.get("stages", {}).get(size)
+        if not base_stages:
+            print(f"[INFO] n={size}: no baseline")
+            continue
+        for stage, res in stages.items():
+            base = base_stages.get(stage)
+            if not base or "error" in res or "error" in base:
+                continue
+            for metric, noise in (("wall_s", NOISE_S), ("peak_rss_mb", NOISE_MB)):
+                if metric not in res or metric not in base:
+                    continue
+                b, v = base[metric], res[metric]
+                ratio = v / b if b else float("inf")
+                flag = ""
+                if v - b > noise and ratio > 1 + tolerance:
+                    flag = "  << REGRESSION"
+                    regressions.append((size, stage, metric, b, v, ratio))
+                print(f"  n={size:<9} {stage:<16} {metric:<12} {b:10.3f} → {v:10.3f}  x{ratio:5.2f}{flag}")
+    crawl, base_crawl = results.get("crawl") or {}, baseline.get("crawl") or {}
+    if crawl.get("pages_per_s") and base_crawl.get("pages_per_s"):
+        ratio = base_crawl["pages_per_s"] / crawl["pages_per_s"]
+        flag = "  << REGRESSION" if ratio > 1 + tolerance else ""
+        if flag:
+            regressions.append(("crawl", "crawl", "pages_per_s", base_crawl["pages_per_s"], crawl["pages_per_s"], ratio))
+        print(f"  crawl pages/s {base_crawl['pages_per_s']:10.2f} → {crawl['pages_per_s']:10.2f}{flag}")
+    return regressions
+
+def run_main(args):
+    work_dir = Path(args.work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "k": args.k,
+        "stages": {},
+    }
+    for size in [parse_size(s) for s in args.sizes.split(",") if s.strip()]:
+        results["stages"][str(size)] = bench_size(size, work_dir, args)
+    if args.crawl_pages > 0:
+        print(f"[STEP] crawl benchmark: {args.crawl_pages} pages on the stand-in site ...")
+        results["crawl"] = bench_crawl(args.crawl_pages, args.concurrency, work_dir, args.latency_ms)
+        if results["crawl"]:
+            print(f"[BENCH] crawl {results['crawl']['pages']} pages in {results['crawl']['wall_s']:.2f}s "
+                  f"({results['crawl']['pages_per_s']} pages/s)")
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"[OK] results → {out}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"[OK] baseline saved → {baseline_path}")
+    elif baseline_path.exists():
+        regressions = compare(results, json.loads(baseline_path.read_text(encoding="utf-8")), args.tolerance)
+        if regressions:
+            print(f"[ERR] {len(regressions)} regression(s) against {baseline_path}")
+            sys.exit(1)
+        print("[OK] no regression")
+    else:
+        print(f"[INFO] no baseline at {baseline_path} (use --save-baseline)")
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Pipeline benchmarks on synthetic WordPress-like corpora")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="Benchmark every stage (and the crawler)")
+    r.add_argument("--sizes", default="10k,100k", help="Corpus sizes, e.g. 10k,100k,1m,10m")
+    r.add_argument("--work-dir", default="bench/tmp", help="Generated corpora and stage outputs")
+    r.add_argument("--out", default="bench/results.json", help="Results JSON")
+    r.add_argument("--baseline", default="bench/baseline.json", help="Baseline to compare with")
+    r.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    r.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown / memory growth")
+    r.add_argument("--k", type=int, default=20, help="k for run_kmeans_sklearn.py")
+    r.add_argument("--streaming-from", type=parse_size, default=parse_size("1m"),
+                   help="Use run_kmeans_sklearn.py --streaming from this many rows")
+    r.add_argument("--url2vec-path", default=None, help="url2vec checkout (default: regex fallback)")
+    r.add_argument("--repeat", type=int, default=1, help="Runs per size; the fastest run of each stage is kept")
+    r.add_argument("--seed", type=int, default=42)
+    r.add_argument("--regen", action="store_true", help="Regenerate corpora already in --work-dir")
+    r.add_argument("--crawl-pages", type=int, default=500, help="Crawl benchmark size (0 = skip)")
+    r.add_argument("--concurrency", type=int, default=8, help="Crawl benchmark workers")
+    r.add_argument("--latency-ms", type=float, default=0.0, help="Stand-in site response delay")
+    g = sub.add_parser("gen", help="Write a synthetic crawl JSONL")
+    g.add_argument("rows", type=parse_size)
+    g.add_argument("out")
+    g.add_argument("--seed", type=int, default=42)
+    s = sub.add_parser("serve", help="Run the stand-in WordPress site")
+    s.add_argument("--port", type=int, default=8089)
+    s.add_argument("--site-pages", type=int, default=5000)
+    s.add_argument("--latency-ms", type=float, default=0.0)
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if args.cmd == "run":
+        run_main(args)
+    elif args.cmd == "gen":
+        t0 = time.perf_counter()
+        out = generate_corpus(args.rows, Path(args.out), seed=args.seed)
+        print(f"[OK] {args.rows} rows → {out} ({time.perf_counter() - t0:.1f}s)")
+    else:
+        site = StandInSite(port=args.port, site_pages=args.site_pages, latency_ms=args.latency_ms)
+        print(f"[START] stand-in site on {site.base}/wp-admin/ (Ctrl-C to stop)")
+        try:
+            site.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            site.server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# Fitted URL clustering pipeline (vectorizer -> reducer -> KMeans) saved as a
+# versioned artifact by run_kmeans_sklearn.py (--save-model) and reused by its
+# `assign` mode to label new URLs without refitting.
+#
+#   <model_dir>/v0001/model.joblib   the ClusterModel
+#   <model_dir>/v0001/model.json     metadata + baseline statistics for drift
+#   <model_dir>/LATEST               name of the newest version
+
+import json
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import sklearn
+from sklearn.preprocessing import normalize
+
+MODEL_FORMAT = 1
+FAR_QUANTILE = 0.95        # distance quantile kept as the "cluster radius" baseline
+PSI_REFIT = 0.2            # population stability index above which a refit is advised
+FAR_SHARE_REFIT = 2.0      # refit if points beyond the radius are > 2x the expected share
+EMPTY_SHARE_REFIT = 0.10   # refit if > 10% of the URLs have no known token
+
+class HashingTfidf:
+    """Hashing TF-IDF with a fixed IDF vector (vectorizer of the streaming fit)."""
+    def __init__(self, hasher, idf):
+        self.hasher = hasher
+        self.idf = np.asarray(idf, dtype=np.float32)
+
+    def transform(self, texts):
+        X = self.hasher.transform(texts).astype(np.float32)
+        return normalize(X.multiply(self.idf).tocsr())
+
+class Projection:
+    """Linear reduction X @ V (reducer of the streaming fit)."""
+    def __init__(self, components):
+        self.components = np.asarray(components, dtype=np.float32)   # (n_features, n_comp)
+
+    def transform(self, X):
+        return np.asarray(X @ self.components)
+
+class ClusterModel:
+    def __init__(self, vectorizer, reducer, kmeans):
+        self.vectorizer = vectorizer
+        self.reducer = reducer
+        self.kmeans = kmeans
+
+    @property
+    def k(self) -> int:
+        return int(self.kmeans.n_clusters)
+
+    def transform(self, texts):
+        """Reduced features (n, n_comp), or the CSR TF-IDF without reducer, and the
+        number of rows with an empty vector."""
+        X = self.vectorizer.transform(texts)
+        n_empty = int((X.getnnz(axis=1) == 0).sum())
+        if self.reducer is None:        # sparse model (--sparse): clustered on the TF-IDF itself
+            return X, n_empty
+        return self.reducer.transform(X), n_empty
+
+    def predict(self, X_red):
+        """(labels, distance to the assigned center)."""
+        d = self.kmeans.transform(X_red)
+        labels = d.argmin(axis=1).astype(np.int32)
+        return labels, d[np.arange(len(d)), labels]
+
+# ---- baseline / drift ----
+def cluster_stats(labels, dist, k: int, n_empty: int = 0) -> dict:
+    labels = np.asarray(labels)
+    dist = np.asarray(dist, dtype=np.float64)
+    counts = np.bincount(labels, minlength=k)
+    sums = np.bincount(labels, weights=dist, minlength=k)
+    mean_d = np.divide(sums, counts, out=np.zeros(k), where=counts > 0)
+    n = max(1, len(labels))
+    return {
+        "n": int(len(labels)),
+        "proportions": (counts / n).tolist(),
+        "mean_distance": mean_d.tolist(),
+        "mean_distance_all": float(dist.mean()) if len(dist) else 0.0,
+        "radius": float(np.quantile(dist, FAR_QUANTILE)) if len(dist) else 0.0,
+        "empty_share": n_empty / n,
+    }
+
+def drift_report(baseline: dict, labels, dist, k: int, n_empty: int = 0) -> dict:
+    cur = cluster_stats(labels, dist, k, n_empty)
+    eps = 1e-6
+    p = np.asarray(baseline["proportions"]) + eps
+    q = np.asarray(cur["proportions"]) + eps
+    psi = float(np.sum((q - p) * np.log(q / p)))
+    far_share = float((np.asarray(dist) > baseline["radius"]).mean()) if len(dist) else 0.0
+    expected_far = 1.0 - FAR_QUANTILE
+    reasons = []
+    if psi > PSI_REFIT:
+        reasons.append(f"cluster sizes shifted (PSI={psi:.3f} > {PSI_REFIT})")
+    if far_share > FAR_SHARE_REFIT * expected_far:
+        reasons.append(f"{far_share:.1%} of URLs beyond the fit radius (expected {expected_far:.0%})")
+    if cur["empty_share"] > EMPTY_SHARE_REFIT:
+        reasons.append(f"{cur['empty_share']:.1%} of URLs have no token known to the model")
+    base_d = np.asarray(baseline["mean_distance"])
+    ratio = np.divide(np.asarray(cur["mean_distance"]), base_d,
+                      out=np.ones_like(base_d), where=base_d > 0)
+    return {
+        "psi": psi,
+        "far_share": far_share,
+        "empty_share": cur["empty_share"],
+        "mean_distance_ratio": cur["mean_distance_all"] / baseline["mean_distance_all"]
+                               if baseline["mean_distance_all"] else 1.0,
+        "per_cluster": [
+            {"cluster": c, "fit_share": baseline["proportions"][c], "share": cur["proportions"][c],
+             "distance_ratio": float(ratio[c])}
+            for c in range(k)
+        ],
+        "refit_recommended": bool(reasons),
+        "reasons": reasons,
+    }
+
+# ---- artifact I/O ----
+def save_model(model_dir: Path, model: ClusterModel, baseline: dict, params: dict) -> Path:
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    versions = sorted(int(p.name[1:]) for p in model_dir.glob("v[0-9]*") if p.name[1:].isdigit())
+    version = (versions[-1] + 1) if versions else 1
+    vdir = model_dir / f"v{version:04d}"
+    vdir.mkdir()
+    joblib.dump(model, vdir / "model.joblib", compress=3)
+    meta = {
+        "format": MODEL_FORMAT,
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sklearn": sklearn.__version__,
+        "k": model.k,
+        "params": params,
+        "baseline": baseline,
+    }
+    (vdir / "model.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    (model_dir / "LATEST").write_text(vdir.name, encoding="utf-8")
+    return vdir
+
+def load_model(path: Path):
+    """(ClusterModel, metadata) from a version dir, or from the LATEST version of a model dir."""
+    path = Path(path)
+    if (path / "LATEST").exists():
+        path = path / (path / "LATEST").read_text(encoding="utf-8").strip()
+    meta = json.loads((path / "model.json").read_text(encoding="utf-8"))
+    if meta.get("format") != MODEL_FORMAT:
+        raise ValueError(f"unsupported model format {meta.get('format')} in {path}")
+    if meta.get("sklearn") != sklearn.__version__:
+        print(f"[WARN] model fitted with scikit-learn {meta.get('sklearn')}, running {sklearn.__version__}")
+    return joblib.load(path / "model.joblib"), meta
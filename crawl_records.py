@@ -0,0 +1,99 @@
+# Crawl JSONL records -> converter rows (id,url,title,excerpt,status,response_time_ms,has_form)
+# Shared by "Create convert_jsonl_to_csv.py" (parallel, file to file) and
+# pipeline.py (in memory, records_frame()).
+
+import json
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+from jsonl_writer import open_jsonl
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+COLUMNS = ['id','url','title','excerpt','status','response_time_ms','has_form']
+BLOCK_LINES = 20000   # lines per task for compressed input
+
+def to_row(obj: dict):
+    # slim records (crawling.py OUTPUT_MODE="slim") carry these fields directly;
+    # full crawl4ai dumps keep them under status_code / metadata / markdown
+    status = obj.get('status')
+    if status is None:
+        status = obj.get('status_code')
+    title = obj.get('title')
+    if title is None and isinstance(obj.get('metadata'), dict):
+        title = obj['metadata'].get('title')
+    excerpt = obj.get('excerpt')
+    if excerpt is None:
+        md = obj.get('markdown')
+        if isinstance(md, dict):
+            md = md.get('raw_markdown')
+        excerpt = md[:500] if isinstance(md, str) else ''
+    rt = obj.get('response_time_ms')
+    try:
+        status = int(status) if status is not None else -1
+    except (TypeError, ValueError):
+        status = -1
+    try:
+        rt = float(rt) if rt is not None else 0.0
+    except (TypeError, ValueError):
+        rt = 0.0
+    return (
+        obj.get('url') or '',
+        title or '',
+        excerpt or '',
+        status,
+        rt,
+        int(bool(obj.get('has_form', False))),
+    )
+
+def parse_lines(lines, first_id: int, changed_only: bool = False):
+    """Parse raw JSONL lines (bytes). Returns (ids, rows, dropped Counter).
+
+    changed_only: skip the pages a recrawl wrote from its cache ("unchanged": true).
+    """
+    ids, rows, dropped = [], [], Counter()
+    for i, line in enumerate(lines, start=first_id):
+        if not line.strip():
+            dropped['empty'] += 1
+            continue
+        try:
+            obj = loads(line)
+        except ValueError:
+            dropped['json_error'] += 1
+            continue
+        if not isinstance(obj, dict):
+            dropped['not_object'] += 1
+            continue
+        if changed_only and obj.get('unchanged'):
+            dropped['unchanged'] += 1
+            continue
+        ids.append(i)
+        rows.append(to_row(obj))
+    return ids, rows, dropped
+
+def records_frame(path: Path, changed_only: bool = False) -> pd.DataFrame:
+    """Whole crawl JSONL (plain / .gz / .zst) as a DataFrame with COLUMNS."""
+    path = Path(path)
+    ids, rows, dropped = [], [], Counter()
+    # plain files are read as bytes so lines split exactly like the converter's byte ranges
+    with open_jsonl(path) if path.name.endswith(('.gz', '.zst')) else path.open('rb') as fh:
+        block, first_id = [], 0
+        for line in fh:
+            block.append(line)
+            if len(block) >= BLOCK_LINES:
+                i, r, d = parse_lines(block, first_id, changed_only)
+                ids += i; rows += r; dropped.update(d)
+                first_id += len(block)
+                block = []
+        i, r, d = parse_lines(block, first_id, changed_only)
+        ids += i; rows += r; dropped.update(d)
+    df = pd.DataFrame(rows, columns=COLUMNS[1:])
+    df.insert(0, 'id', ids)
+    df.attrs['dropped'] = dict(dropped)
+    return df
@@ -0,0 +1,127 @@
+# Priority scheduling of the crawl frontier (crawling.py, SCHEDULER = "priority")
+#
+# Each queued URL gets a score from the signals detect_and_merge_git.py later
+# uses for the seed _score, estimated per URL template (path with ids folded,
+# sorted query keys) from the pages of that template fetched so far:
+#   1 + 1.5 x form rate (or 1.5 for a GET form target)
+#     + 1.5 x error rate (status >= 400 or failed fetch)
+#     + min(mean response time / 1000, 2)
+#     + 0.25 per query parameter (at most 4)
+#     + 2 / (1 + pages of the template fetched)         novelty
+#     - 0.1 x depth
+# The frontier is an asyncio.PriorityQueue (a binary heap) of
+# (-score, seq, url, depth): pushes and pops are O(log n), and seq keeps the
+# BFS order among equal scores. Scores are updated lazily: when a template
+# turns out better than estimated its queued URLs are pushed again with the
+# higher score, and a URL whose score dropped since it was queued is pushed
+# back when popped. The worker skips the leftover copies as already visited.
+
+import asyncio
+import itertools
+import re
+from urllib.parse import parse_qsl, urlsplit
+
+FORM_BONUS = 1.5
+ERROR_BONUS = 1.5
+RT_CAP = 2.0
+PARAM_BONUS = 0.25
+MAX_PARAMS = 4
+NOVELTY_BONUS = 2.0
+DEPTH_PENALTY = 0.1
+RESCORE_DELTA = 0.5     # score change that moves an already queued URL
+
+_ID_RE = re.compile(r"^(\d+|[0-9a-f]{8,}|[0-9a-f-]{36})$", re.I)
+
+def url_template(url: str) -> str:
+    """/wp-admin/post.php?post=12&action=edit -> /wp-admin/post.php?action&post"""
+    parts = urlsplit(url)
+    path = "/".join("{id}" if _ID_RE.match(seg) else seg for seg in parts.path.split("/"))
+    keys = sorted({k for k, _ in parse_qsl(parts.query, keep_blank_values=True)})
+    return f"{parts.netloc}{path}?{'&'.join(keys)}" if keys else f"{parts.netloc}{path}"
+
+class TemplateStats:
+    def __init__(self):
+        self.fetched = 0
+        self.errors = 0
+        self.rt_sum = 0.0
+        self.forms = 0
+        self.form_known = 0
+        self.queued = {}        # url -> (depth, form_target) of the URLs waiting in the frontier
+
+    def form_rate(self) -> float:
+        return self.forms / self.form_known if self.form_known else 0.0
+
+    def estimate(self) -> float:
+        """Score part learnt from the fetched pages of the template (forms aside)."""
+        if not self.fetched:
+            return NOVELTY_BONUS
+        return (ERROR_BONUS * self.errors / self.fetched
+                + min(self.rt_sum / self.fetched / 1000.0, RT_CAP)
+                + NOVELTY_BONUS / (1 + self.fetched))
+
+    def learnt(self) -> float:
+        return self.estimate() + FORM_BONUS * self.form_rate()
+
+class CrawlScheduler:
+    """Frontier shared by the crawl workers; priority=False keeps the plain BFS order."""
+    def __init__(self, priority: bool = True):
+        self.priority = priority
+        self.templates = {}
+        self._seq = itertools.count()
+        self.q = asyncio.PriorityQueue()
+
+    def _stats(self, url: str) -> TemplateStats:
+        t = url_template(url)
+        st = self.templates.get(t)
+        if st is None:
+            st = self.templates[t] = TemplateStats()
+        return st
+
+    def score(self, url: str, depth: int, form_target: bool = False) -> float:
+        if not self.priority:
+            return 0.0
+        st = self._stats(url)
+        n_params = len(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+        form = 1.0 if form_target else st.form_rate()
+        return (1.0 + FORM_BONUS * form + st.estimate() + PARAM_BONUS * min(n_params, MAX_PARAMS)
+                - DEPTH_PENALTY * depth)
+
+    def push(self, url: str, depth: int, form_target: bool = False):
+        self._stats(url).queued[url] = (depth, form_target)
+        s = self.score(url, depth, form_target)
+        self.q.put_nowait((-s, next(self._seq), url, depth))
+
+    async def pop(self):
+        """(url, depth) of the best queued URL; call q.task_done() once it is handled."""
+        while True:
+            neg, _, url, depth = await self.q.get()
+            st = self._stats(url)
+            info = st.queued.get(url)
+            if info is not None and self.priority:
+                now = self.score(url, depth, info[1])
+                if now < -neg - RESCORE_DELTA:
+                    # estimate dropped since it was queued: back in the heap at its new rank
+                    self.q.put_nowait((-now, next(self._seq), url, depth))
+                    self.q.task_done()
+                    continue
+            st.queued.pop(url, None)
+            return url, depth
+
+    def observe(self, url: str, status=None, elapsed_ms=None, has_form=None, error: bool = False):
+        """Record a fetched page; queued URLs of its template that gained score are pushed again."""
+        st = self._stats(url)
+        before = st.learnt()
+        st.fetched += 1
+        if error or (status is not None and status >= 400):
+            st.errors += 1
+        if elapsed_ms is not None:
+            st.rt_sum += elapsed_ms
+        if has_form is not None:
+            st.form_known += 1
+            st.forms += bool(has_form)
+        if self.priority and st.queued and st.learnt() > before + RESCORE_DELTA:
+            for u, (depth, form_target) in list(st.queued.items()):
+                self.q.put_nowait((-self.score(u, depth, form_target), next(self._seq), u, depth))
+
+    def qsize(self) -> int:
+        return self.q.qsize()
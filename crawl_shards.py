@@ -0,0 +1,198 @@
+# Sharded crawl: several targets, one crawler process per target, shards merged at the end
+#
+# Usage:
+#   python crawl_shards.py <targets.json> <out.jsonl> [--processes 4] [--shard-dir out/shards] [--no-merge]
+#
+# targets.json is a list of targets; every key but name / start_url is optional
+# and overrides the matching crawling.py constant for that target only:
+#   [
+#     {"name": "wp", "start_url": "http://192.168.64.2/wordpress_instrumented/wp-admin/",
+#      "scope": "http://192.168.64.2/wordpress_instrumented",
+#      "login_url": "http://192.168.64.2/wordpress_instrumented/wp-login.php",
+#      "username": "wpuser", "password": "password123!", "max_pages": 200},
+#     {"name": "app1", "start_url": "http://127.0.0.1:8001/index.php?nom=a&age=1", "max_pages": 20},
+#     {"name": "app2", "start_url": "http://127.0.0.1:8002/index.php", "max_pages": 20}
+#   ]
+# (the PHP stand-ins: php -S 127.0.0.1:8001 -t "Application 1", php -S 127.0.0.1:8002 -t "Application 2").
+# Without login_url the target is crawled anonymously; scope defaults to the
+# start URL's origin.
+#
+# Each target runs crawling.main() in its own spawned process (own event loop,
+# own browser), with its shard, crawl state and recrawl cache under --shard-dir:
+# <shard-dir>/<name>.jsonl[.gz|.zst], <name>.state.sqlite, ... A stopped run
+# resumes per target (crawling.RESUME). The shards are then concatenated in
+# target order into <out.jsonl> (gzip members / zstd frames concatenate too),
+# and <out.jsonl>.shards.json records pages, time and errors per target.
+
+import argparse
+import json
+import multiprocessing as mp
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from jsonl_writer import compressed_path
+
+# target key -> crawling.py constant
+TARGET_KEYS = {
+    "start_url": "ADMIN_URL",
+    "scope": "BASE_SCOPE",
+    "login_url": "LOGIN_URL",
+    "username": "USERNAME",
+    "password": "PASSWORD",
+    "max_pages": "MAX_PAGES",
+    "max_depth": "MAX_DEPTH",
+    "delay_s": "DELAY_S",
+    "concurrency": "CONCURRENCY",
+    "fetch_mode": "FETCH_MODE",
+    "scheduler": "SCHEDULER",
+    "output_mode": "OUTPUT_MODE",
+    "recrawl_cache": "RECRAWL_CACHE",
+    "headless": "HEADLESS",
+    "verbose": "VERBOSE",
+}
+NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Crawl several targets in parallel processes, one shard each")
+    p.add_argument("targets", help="JSON list of targets (see the header of this file)")
+    p.add_argument("output", help="Merged crawl JSONL (suffix .gz / .zst added with crawling.OUT_COMPRESSION)")
+    p.add_argument("--processes", type=int, default=4, help="Targets crawled at the same time")
+    p.add_argument("--shard-dir", default=None, help="Per-target shards and state (default: <output>.shards/)")
+    p.add_argument("--no-merge", action="store_true", help="Keep the shards only")
+    return p.parse_args()
+
+def load_targets(path: Path) -> list:
+    targets = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not isinstance(targets, list) or not targets:
+        raise ValueError(f"{path}: expected a non-empty JSON list of targets")
+    names = set()
+    for i, t in enumerate(targets):
+        name = t.get("name") if isinstance(t, dict) else None
+        if not name or not NAME_RE.match(name):
+            raise ValueError(f"target #{i}: 'name' is required ([A-Za-z0-9_.-]+)")
+        if name in names:
+            raise ValueError(f"target {name}: duplicate name")
+        names.add(name)
+        if not t.get("start_url"):
+            raise ValueError(f"target {name}: 'start_url' is required")
+        unknown = set(t) - set(TARGET_KEYS) - {"name"}
+        if unknown:
+            raise ValueError(f"target {name}: unknown keys {sorted(unknown)} (known: {sorted(TARGET_KEYS)})")
+    return targets
+
+def apply_target(crawling, target: dict, shard_dir: Path):
+    """Point the crawling module constants at `target` (in the target's own process)."""
+    parts = urlsplit(target["start_url"])
+    crawling.BASE_SCOPE = f"{parts.scheme}://{parts.netloc}"
+    crawling.LOGIN_URL = None
+    for key, const in TARGET_KEYS.items():
+        if key in target:
+            setattr(crawling, const, target[key])
+    # in_scope() is a prefix test on canonical URLs: an origin needs its "/" (and the
+    # canonical host / port), or http://h:8001 would also take http://h:80010/
+    scope = urlsplit(crawling.BASE_SCOPE)
+    if scope.path in ("", "/"):
+        crawling.BASE_SCOPE = crawling.normalize_url(f"{scope.scheme}://{scope.netloc}/").rstrip("/") + "/"
+    crawling.BROWSER_SESSIONS = crawling.CONCURRENCY
+    name = target["name"]
+    crawling.OUT_JSONL = shard_dir / f"{name}.jsonl"
+    crawling.STATE_DB = shard_dir / f"{name}.state.sqlite"
+    crawling.RECRAWL_DB = shard_dir / f"{name}.recrawl.sqlite"
+    crawling.BLOB_DIR = shard_dir / f"{name}.blobs"
+
+def shard_metrics(m, name: str):
+    """One metrics file per target: "{script}" expands to <script>.<name>, and a fixed
+    METRICS_JSON / METRICS_PROM path gets .<name> before its suffix."""
+    m.script = f"{m.script}.{name}"
+    for attr in ("json_path", "prom_path"):
+        template = getattr(m, attr)
+        if template and "{script}" not in template:
+            p = Path(template)
+            setattr(m, attr, str(p.with_name(f"{p.stem}.{name}{p.suffix}")))
+
+def run_target(task) -> dict:
+    """Worker process: crawl one target into its shard."""
+    target, shard_dir = task
+    name = target["name"]
+    t0 = time.perf_counter()
+    try:
+        import asyncio
+        import crawling
+        import metrics
+        apply_target(crawling, target, Path(shard_dir))
+        shard_metrics(metrics.METRICS, name)
+        pages = asyncio.run(crawling.main())
+        shard = compressed_path(crawling.OUT_JSONL, crawling.OUT_COMPRESSION)
+        return {"name": name, "ok": True, "pages": pages, "shard": str(shard),
+                "seconds": round(time.perf_counter() - t0, 3)}
+    except Exception as e:      # a failed target must not take the others down
+        return {"name": name, "ok": False, "error": f"{type(e).__name__}: {e}",
+                "seconds": round(time.perf_counter() - t0, 3)}
+
+def merge_shards(shards, out_path: Path, block: int = 1 << 20) -> int:
+    """Concatenate the shard files into out_path; returns the bytes written."""
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    n = 0
+    with tmp.open("wb") as fo:
+        for shard in shards:
+            with Path(shard).open("rb") as fi:
+                shutil.copyfileobj(fi, fo, block)
+                n += fi.tell()
+    tmp.replace(out_path)
+    return n
+
+def main():
+    args = parse_args()
+    try:
+        targets = load_targets(Path(args.targets))
+    except (OSError, ValueError) as e:
+        print(f"[ERR] {e}")
+        sys.exit(2)
+    out = Path(args.output)
+    shard_dir = Path(args.shard_dir) if args.shard_dir else out.with_name(out.name + ".shards")
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    processes = max(1, min(args.processes, len(targets)))
+
+    print(f"[INIT] {len(targets)} targets, {processes} processes → {shard_dir}")
+    t0 = time.perf_counter()
+    # spawn: a fresh interpreter per target (no inherited event loop / browser / module state)
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(processes, maxtasksperchild=1) as pool:
+        results = {}
+        for r in pool.imap_unordered(run_target, [(t, str(shard_dir)) for t in targets]):
+            results[r["name"]] = r
+            if not r["ok"]:
+                print(f"[ERR] {r['name']}: {r['error']}")
+            elif not r["pages"]:
+                print(f"[WARN] {r['name']}: no page written (start URL unreachable or out of scope?)")
+            else:
+                print(f"[OK] {r['name']}: {r['pages']} pages in {r['seconds']:.1f}s → {r['shard']}")
+        pool.close()
+        pool.join()     # let the workers exit normally (their metrics are written at exit)
+    results = [results[t["name"]] for t in targets]
+    failed = [r["name"] for r in results if not r["ok"]]
+
+    merged = None
+    shards = [r["shard"] for r in results if r["ok"] and Path(r["shard"]).exists()]
+    if not args.no_merge and shards:
+        suffix = "".join(s for s in (".gz", ".zst") if shards[0].endswith(s))
+        merged = out if not suffix or out.name.endswith(suffix) else out.with_name(out.name + suffix)
+        size = merge_shards(shards, merged)
+        print(f"[OK] {len(shards)} shards merged → {merged} ({size / 2 ** 20:.1f} MB)")
+
+    base = merged or out
+    report = base.with_name(base.name + ".shards.json")
+    report.write_text(json.dumps({"targets": results, "merged": str(merged) if merged else None,
+                                  "seconds": round(time.perf_counter() - t0, 3)}, indent=2), encoding="utf-8")
+    print(f"[END] {sum(r.get('pages') or 0 for r in results)} pages from {len(results) - len(failed)}"
+          f"/{len(results)} targets ({time.perf_counter() - t0:.1f}s), report → {report}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
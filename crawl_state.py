@@ -0,0 +1,132 @@
+# Persistent crawl state (SQLite) : frontier, visited set and per-URL status
+# Used by crawling.py so that an interrupted crawl can resume without refetching pages.
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# URL status values
+QUEUED  = "queued"    # in the frontier, not fetched yet
+DONE    = "done"      # fetched and written to the JSONL
+ERROR   = "error"     # fetch failed (not retried on resume)
+SKIPPED = "skipped"   # dequeued but out of scope / too deep
+ALIAS   = "alias"     # redirect target of a fetched URL (never fetched on its own)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url        TEXT PRIMARY KEY,
+    depth      INTEGER NOT NULL,
+    status     TEXT NOT NULL,
+    seq        INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    fetch_url  TEXT
+);
+CREATE INDEX IF NOT EXISTS urls_status ON urls(status, seq);
+"""
+
+class CrawlState:
+    """SQLite-backed crawl state. One row per URL ever enqueued.
+
+    `url` is the canonical URL (dedup key); `fetch_url` the URL as discovered,
+    the one actually requested (NULL = same as `url`).
+
+    Thread-safe: the JSONL writer marks pages done from its flush thread.
+    """
+
+    def __init__(self, path: Path, commit_every: int = 50):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.lock = threading.RLock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        cols = {r[1] for r in self.db.execute("PRAGMA table_info(urls)")}
+        if "fetch_url" not in cols:     # state written before fetch_url existed
+            self.db.execute("ALTER TABLE urls ADD COLUMN fetch_url TEXT")
+        self.commit_every = commit_every
+        self._pending = 0
+        row = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM urls").fetchone()
+        self._seq = int(row[0])
+
+    # ---- lifecycle ----
+    def reset(self):
+        with self.lock:
+            self.db.execute("DELETE FROM urls")
+            self.db.commit()
+            self._seq = 0
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM urls LIMIT 1").fetchone() is None
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+            self._pending = 0
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    def _touch(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    # ---- frontier ----
+    def enqueue(self, url: str, depth: int, fetch_url: str = None) -> bool:
+        """Add a URL to the frontier; returns False if it was already known."""
+        with self.lock:
+            self._seq += 1
+            cur = self.db.execute(
+                "INSERT OR IGNORE INTO urls(url, depth, status, seq, updated_at, fetch_url) VALUES (?,?,?,?,?,?)",
+                (url, depth, QUEUED, self._seq, time.time(), fetch_url if fetch_url != url else None),
+            )
+            self._touch()
+            return cur.rowcount == 1
+
+    def mark(self, url: str, status: str, commit: bool = False):
+        with self.lock:
+            self.db.execute(
+                "UPDATE urls SET status=?, updated_at=? WHERE url=?",
+                (status, time.time(), url),
+            )
+            if commit:
+                self.commit()
+            else:
+                self._touch()
+
+    def alias(self, url: str, depth: int):
+        """Record `url` as already covered by another fetch (e.g. a redirect target)."""
+        with self.lock:
+            self._seq += 1
+            self.db.execute(
+                "INSERT INTO urls(url, depth, status, seq, updated_at) VALUES (?,?,?,?,?) "
+                "ON CONFLICT(url) DO UPDATE SET status=excluded.status, updated_at=excluded.updated_at",
+                (url, depth, ALIAS, self._seq, time.time()),
+            )
+            self._touch()
+
+    def frontier(self):
+        """Queued URLs in insertion (BFS) order, as (url, depth, fetch_url) tuples."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT url, depth, COALESCE(fetch_url, url) FROM urls WHERE status=? ORDER BY seq", (QUEUED,)
+            ).fetchall()
+
+    def visited(self) -> set:
+        with self.lock:
+            rows = self.db.execute("SELECT url FROM urls WHERE status!=?", (QUEUED,))
+            return {r[0] for r in rows}
+
+    def known(self) -> set:
+        """Every URL ever enqueued, whatever its status (frontier dedup index)."""
+        with self.lock:
+            return {r[0] for r in self.db.execute("SELECT url FROM urls")}
+
+    def count(self, status: str) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM urls WHERE status=?", (status,)).fetchone()[0]
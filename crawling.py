@@ -1,15 +1,23 @@
 import asyncio, json, time
 from pathlib import Path
-from collections import deque
-from urllib.parse import urlparse, urljoin, urlunparse
+from urllib.parse import urlparse, urljoin, urldefrag
 
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
 from playwright.async_api import Page, BrowserContext
 
+from crawl_state import CrawlState, DONE, ERROR, SKIPPED
+from url_canon import make_canonicalizer, DROP_PARAMS, DROP_PREFIXES
+from jsonl_writer import JsonlWriter, BlobStore, compressed_path
+from metrics import stage, observe, set_gauge, inc
+from fetchers import BrowserPool, HttpFetcher, HybridFetcher, JS_URL_PATTERNS
+from recrawl_cache import ConditionalFetcher, RecrawlCache
+from crawl_scheduler import CrawlScheduler
+import page_forms
+
 # CONFIG
 WP_URL      = "http://192.168.64.2/wordpress_instrumented"
-LOGIN_URL   = f"{WP_URL}/wp-login.php"
-ADMIN_URL   = f"{WP_URL}/wp-admin/"
+LOGIN_URL   = f"{WP_URL}/wp-login.php"   # None = no login (public site)
+ADMIN_URL   = f"{WP_URL}/wp-admin/"       # start URL of the crawl
 USERNAME    = "wpuser"
 PASSWORD    = "password123!"
 
@@ -19,23 +27,82 @@ VERBOSE     = True
 
 MAX_PAGES   = 200
 MAX_DEPTH   = 5
-DELAY_S     = 0.3
+DELAY_S     = 0.3   # min interval between two requests to the same host
+CONCURRENCY = 4     # async workers sharing the frontier (1 = sequential BFS)
+SCHEDULER   = "priority"   # "priority" = best-scored URL first (see crawl_scheduler.py), "bfs" = FIFO
+
+# Fetching (see fetchers.py)
+FETCH_MODE       = "browser"       # "browser" = every page through Chromium, "hybrid" = plain HTTP
+                                   # with the login cookies, the browser only for JS pages
+HTTP_POOL_SIZE   = 16              # keep-alive connections of the HTTP client
+BROWSER_SESSIONS = CONCURRENCY     # reused browser pages for the JS pages
+JS_PATTERNS      = JS_URL_PATTERNS # URLs always rendered in the browser
+
+# Output
+OUTPUT_MODE     = "full"   # "full" = result.model_dump_json(), "slim" = only the fields the pipeline reads
+OUT_COMPRESSION = None     # None | "gzip" | "zstd" (adds .gz / .zst to OUT_JSONL)
+WRITE_BATCH     = 50       # lines buffered before a background flush
+EXCERPT_CHARS   = 500
+STORE_BODIES    = False    # slim mode: keep raw HTML in the content-addressed blob store
+BLOB_DIR        = OUT_JSONL.parent / "blobs"
+
+# Crawl state (frontier, visited, per-URL status) persisted next to the JSONL
+STATE_DB    = OUT_JSONL.with_suffix(".state.sqlite")
+RESUME      = True  # False = start from scratch (wipes STATE_DB and OUT_JSONL)
+
+# Page extraction (see page_forms.py): has_form / forms / params / meta of each record
+EXTRACT_FORMS    = True
+FOLLOW_GET_FORMS = True    # add GET form targets (inputs filled in) to the frontier
+FORM_FILL_VALUE  = page_forms.FILL_VALUE
+
+# Recrawl cache (see recrawl_cache.py): pages unchanged since the last crawl
+# (304 / same body hash) are written from the cache with "unchanged": true
+RECRAWL_CACHE = False
+RECRAWL_DB    = OUT_JSONL.with_suffix(".recrawl.sqlite")   # kept when RESUME = False
 
 # Restrict the scope
 BASE_SCOPE  = "http://192.168.64.2/wordpress_instrumented"
 
+# URL canonicalization (see url_canon.py)
+CANON_DROP_PARAMS    = DROP_PARAMS        # volatile params removed from every URL
+CANON_DROP_PREFIXES  = DROP_PREFIXES      # e.g. utm_*
+CANON_SORT_QUERY     = True
+CANON_STRIP_SLASH    = True               # /wp-admin/ == /wp-admin
+
 # UTILS
+_canonicalize = make_canonicalizer(
+    drop_params=CANON_DROP_PARAMS,
+    drop_prefixes=CANON_DROP_PREFIXES,
+    sort_query=CANON_SORT_QUERY,
+    strip_trailing_slash=CANON_STRIP_SLASH,
+)
+
 def normalize_url(u: str) -> str:
-    if not u: return ""
-    p = urlparse(u)
-    p = p._replace(fragment="")
-    return urlunparse(p)
+    return _canonicalize(u)
 
 def in_scope(u: str) -> bool:
     return u.startswith(BASE_SCOPE)
 
-def extract_links(obj, base: str):
-    links = set()
+class HostRateLimiter:
+    """Per-host rate limit shared by every worker (non-blocking replacement for time.sleep)."""
+    def __init__(self, delay_s: float):
+        self.delay_s = delay_s
+        self._next_slot = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, url: str):
+        host = urlparse(url).netloc.lower()
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = slot + self.delay_s
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+def extract_links(obj, base: str) -> dict:
+    """{canonical URL: URL as found in the page (absolute, no fragment)}; the canonical
+    form is the dedup key, the found form is the one fetched (nonces, trailing slash)."""
+    links = {}
     if not obj:
         return links
     raw = getattr(obj, "links", None)
@@ -56,14 +123,33 @@ def extract_links(obj, base: str):
             continue
         if not href.startswith("http"):
             href = urljoin(base, href)
-        links.add(normalize_url(href))
+        href = urldefrag(href)[0]
+        links.setdefault(normalize_url(href), href)
     return links
 
-def result_to_jsonl_line(result, fallback_url: str):
+PAGE_FIELDS = ("has_form", "forms", "params", "meta")
+
+def extract_page(result, fallback_url: str):
+    """page_forms.extract() of the fetched HTML (None when EXTRACT_FORMS is off)."""
+    if not EXTRACT_FORMS:
+        return None
+    url = getattr(result, "url", None) or fallback_url
+    return page_forms.extract(getattr(result, "html", None) or "", url, fill=FORM_FILL_VALUE)
+
+def _page_fields(page) -> dict:
+    if page is None:
+        return {"meta": {}, "params": {}, "has_form": False}
+    return {k: page[k] for k in PAGE_FIELDS}
+
+def result_to_jsonl_line(result, fallback_url: str, page=None):
 
     if hasattr(result, "model_dump_json"):
         try:
-            return result.model_dump_json()
+            line = result.model_dump_json()
+            if page is not None and line.endswith("}") and line.rstrip("}").strip("{ "):
+                # append the page fields without re-parsing the (large) dump
+                line = line[:-1] + ", " + json.dumps(_page_fields(page), ensure_ascii=False)[1:]
+            return line
         except Exception:
             pass
     # build a minimal payload
@@ -71,9 +157,7 @@ def result_to_jsonl_line(result, fallback_url: str):
         "url": getattr(result, "url", None) or fallback_url,
         "status": getattr(result, "status", None),
         "title": getattr(result, "title", None),
-        "meta": {},  # placeholder if you want to enrich
-        "params": {},  # placeholder
-        "has_form": False,  # placeholder
+        **_page_fields(page),
         "response_time_ms": getattr(result, "response_time_ms", None),
         "response_size": getattr(result, "response_size", None),
     }
@@ -83,6 +167,230 @@ def result_to_jsonl_line(result, fallback_url: str):
         payload["excerpt"] = md[:500]
     return json.dumps(payload, ensure_ascii=False)
 
+def _markdown_text(result) -> str:
+    md = getattr(result, "markdown", None)
+    if isinstance(md, str):
+        return md
+    # crawl4ai >= 0.5 : MarkdownGenerationResult
+    return getattr(md, "raw_markdown", None) or ""
+
+def result_to_slim_record(result, fallback_url: str, elapsed_ms=None, body_sha256=None, page=None) -> dict:
+    """Only the fields read downstream (convert -> tokenise -> ... -> detect_and_merge)."""
+    meta = getattr(result, "metadata", None) or {}
+    html = getattr(result, "html", None) or ""
+    status = getattr(result, "status_code", None)
+    if status is None:
+        status = getattr(result, "status", None)
+    record = {
+        "url": getattr(result, "url", None) or fallback_url,
+        "status": status,
+        "title": meta.get("title") or getattr(result, "title", None),
+        "excerpt": _markdown_text(result)[:EXCERPT_CHARS],
+        "response_time_ms": elapsed_ms if elapsed_ms is not None else getattr(result, "response_time_ms", None),
+        "response_size": len(html) if html else getattr(result, "response_size", None),
+        **_page_fields(page),
+    }
+    if body_sha256:
+        record["body_sha256"] = body_sha256
+    return record
+
+# --------- CONCURRENT BFS ---------
+async def crawl(crawler, run_config, fout: JsonlWriter, store: CrawlState,
+                concurrency: int = CONCURRENCY, blobs: BlobStore = None, recrawl: RecrawlCache = None) -> int:
+    """Crawl the frontier with `concurrency` workers; returns the total number of lines written.
+
+    The next URL is the best-scored one (SCHEDULER = "priority": forms, params, errors,
+    slow responses, unseen URL templates) or the oldest one (SCHEDULER = "bfs").
+
+    A page slot is reserved before each fetch and released if the fetch fails, so the
+    crawl stops exactly at MAX_PAGES even with several requests in flight.
+    Every enqueue / status change goes through `store`, so a restarted crawl picks up
+    the remaining frontier and never refetches a page already written to `fout`
+    (a page is marked done by the writer once its line is flushed to disk).
+    URLs are canonicalized when enqueued and again when visited; `seen` (queued or
+    visited) keeps each canonical URL in the frontier at most once. The canonical
+    URL is only the key (frontier, `seen` / `visited`, store): the page is fetched
+    with the URL as it was found (trailing slash, nonce, ...), kept in `fetch_urls`.
+    With `recrawl`, every line written is cached with its links; `crawler` is then a
+    ConditionalFetcher, whose unchanged pages come back with their cached line.
+    """
+    sched = CrawlScheduler(priority=SCHEDULER == "priority")
+    q = sched.q
+    if store.is_empty():
+        store.enqueue(normalize_url(ADMIN_URL), 0, fetch_url=ADMIN_URL)
+    fetch_urls = {}     # canonical URL -> URL to request, for the queued URLs
+    for url, depth, fetch_url in store.frontier():
+        fetch_urls[url] = fetch_url
+        sched.push(url, depth)
+    visited = store.visited()
+    seen = store.known()
+    limiter = HostRateLimiter(DELAY_S)
+    budget = asyncio.Condition()
+    counts = {"written": store.count(DONE), "inflight": 0}
+
+    async def reserve_slot() -> bool:
+        async with budget:
+            await budget.wait_for(
+                lambda: counts["written"] + counts["inflight"] < MAX_PAGES or counts["inflight"] == 0
+            )
+            if counts["written"] >= MAX_PAGES:
+                return False
+            counts["inflight"] += 1
+            return True
+
+    async def release_slot(written: bool):
+        async with budget:
+            counts["inflight"] -= 1
+            if written:
+                counts["written"] += 1
+            budget.notify_all()
+
+    async def worker(wid: int):
+        while True:
+            url, depth = await sched.pop()
+            set_gauge("crawl_queue_depth", q.qsize())
+            try:
+                raw, url = url, normalize_url(url)
+                fetch_url = fetch_urls.get(raw, raw)
+                if raw != url:
+                    # entry queued under older canonicalization rules (resumed state)
+                    store.mark(raw, SKIPPED)
+                    store.enqueue(url, depth, fetch_url=fetch_url)
+                if url in visited:
+                    continue
+                if depth > MAX_DEPTH or not in_scope(url):
+                    visited.add(url)
+                    store.mark(url, SKIPPED)
+                    continue
+                if not await reserve_slot():
+                    continue   # budget exhausted: the URL stays queued in the store
+                # From here on the slot is released whatever happens (finally)
+                written = False
+                try:
+                    if url in visited:
+                        # another copy of the URL was taken while this one waited for a slot
+                        continue
+                    visited.add(url)
+                    fetch_urls.pop(raw, None)
+
+                    await limiter.wait(fetch_url)
+                    if VERBOSE: print(f"[FETCH][w={wid}][d={depth}] {fetch_url}")
+
+                    t0 = time.perf_counter()
+                    try:
+                        result = await crawler.arun(fetch_url, config=run_config)
+                        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+                        observe("crawl_fetch_latency_ms", elapsed_ms)
+                    except Exception as e:
+                        print(f"[ERR] arun({fetch_url}) : {e}")
+                        inc("crawl_fetch_errors")
+                        sched.observe(url, elapsed_ms=(time.perf_counter() - t0) * 1000.0, error=True)
+                        store.mark(url, ERROR)
+                        continue
+
+                    # Redirect target (e.g. wp-admin -> wp-admin/ -> ...) counts as visited too
+                    page_url = getattr(result, "url", None) or fetch_url
+                    final = normalize_url(page_url)
+                    if final and final != url and final not in visited:
+                        visited.add(final)
+                        seen.add(final)
+                        store.alias(final, depth)
+
+                    # Non-HTML response (HTTP path): not written, not counted against MAX_PAGES
+                    skipped = getattr(result, "skipped", None)
+                    if skipped:
+                        if VERBOSE: print(f"[SKIP] {fetch_url} ({skipped})")
+                        inc(f"crawl_skipped_{skipped}")
+                        store.mark(url, SKIPPED)
+                        if recrawl is not None:
+                            recrawl.discard(url)
+                        continue
+
+                    # Write one JSON line per page; its status is committed once the line is on disk
+                    unchanged = getattr(result, "unchanged", False)
+                    page = None
+                    try:
+                        if not unchanged:
+                            page = extract_page(result, fetch_url)
+                            if page is not None and page["has_form"]:
+                                inc("crawl_pages_with_forms")
+                        status = getattr(result, "status_code", None)
+                        sched.observe(url, status if status is not None else getattr(result, "status", None),
+                                      None if unchanged else elapsed_ms,
+                                      None if page is None else page["has_form"])
+                        if unchanged:
+                            line = result.line
+                        elif OUTPUT_MODE == "slim":
+                            digest = None
+                            html = getattr(result, "html", None)
+                            if blobs is not None and html:
+                                digest = await asyncio.to_thread(blobs.put, html)
+                            line = json.dumps(result_to_slim_record(result, fetch_url, elapsed_ms, digest, page),
+                                              ensure_ascii=False)
+                        else:
+                            line = result_to_jsonl_line(result, fallback_url=fetch_url, page=page)
+                        fout.write(line, on_flush=lambda u=url: store.mark(u, DONE, commit=True))
+                        written = True
+                        inc("crawl_pages_written")
+                    except Exception as e:
+                        print(f"[WARN] JSONL write failed for {url}: {e}")
+                        store.mark(url, ERROR)
+                except Exception as e:
+                    print(f"[ERR] {url}: {e}")
+                    inc("crawl_worker_errors")
+                    if not written:
+                        store.mark(url, ERROR)
+                    continue
+                finally:
+                    await release_slot(written)
+
+                try:
+                    links = extract_links(result, base=page_url)
+                except Exception as e:
+                    links = {}
+                    if VERBOSE: print(f"[WARN] extract_links: {e}")
+                targets = {}
+                if FOLLOW_GET_FORMS and page is not None:
+                    targets = {normalize_url(t): t for t in page["targets"]}
+                    links = {**targets, **links}
+                if recrawl is not None and not unchanged:
+                    if written:
+                        recrawl.put(url, line, links.values())
+                    else:
+                        recrawl.discard(url)
+
+                # Enqueue new links
+                if depth < MAX_DEPTH and counts["written"] < MAX_PAGES:
+                    for ln, href in links.items():
+                        if ln in seen or not in_scope(ln):
+                            continue
+                        try:
+                            store.enqueue(ln, depth + 1, fetch_url=href)
+                        except Exception as e:
+                            print(f"[WARN] enqueue({ln}) failed: {e}")
+                            continue
+                        seen.add(ln)
+                        fetch_urls[ln] = href
+                        sched.push(ln, depth + 1, form_target=ln in targets)
+            except Exception as e:
+                # never let a worker die silently: log and take the next URL
+                print(f"[ERR] worker {wid}: {url}: {e}")
+                inc("crawl_worker_errors")
+            finally:
+                q.task_done()
+
+    workers = [asyncio.create_task(worker(i)) for i in range(max(1, concurrency))]
+    try:
+        await q.join()
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        store.commit()
+        if recrawl is not None:
+            recrawl.commit()
+    return counts["written"]
+
 # --------- MAIN ---------
 async def main():
     print("[INIT] \u2192 Crawl4AI login + BFS \u2192 JSONL")
@@ -100,9 +408,17 @@ async def main():
         verbose=VERBOSE
     )
     crawler = AsyncWebCrawler(config=browser_config)
+    http = None
+    if FETCH_MODE == "hybrid" or RECRAWL_CACHE:
+        try:
+            http = HttpFetcher(pool_size=HTTP_POOL_SIZE, user_agent=getattr(browser_config, "user_agent", None))
+        except RuntimeError as e:
+            print(f"[WARN] No HTTP client, every page goes through the browser (no revalidation): {e}")
 
     # Login hook
     async def on_page_context_created(page: Page, context: BrowserContext, **kwargs):
+        if not LOGIN_URL:
+            return page
         try:
             await page.goto(LOGIN_URL, timeout=30000)
             await page.wait_for_selector("#user_login", timeout=5000)
@@ -113,6 +429,11 @@ async def main():
             if VERBOSE: print("[HOOK] Login OK (wpadminbar detected).")
         except Exception as e:
             if VERBOSE: print(f"[HOOK] Login not performed (already logged in ?) : {e}")
+        if http is not None:
+            try:
+                http.set_cookies(await context.cookies())
+            except Exception as e:
+                print(f"[WARN] Session cookies not copied to the HTTP client: {e}")
         try:
             await page.set_viewport_size({"width": 1200, "height": 900})
         except: pass
@@ -128,52 +449,52 @@ async def main():
             print("[WARN] Unable to attach hook :", e)
 
     await crawler.start()
-    print("[START] Crawler started. BFS on:", ADMIN_URL)
+    fetcher = crawler
+    pool = None
+    if http is not None:
+        await http.start()
+        if not LOGIN_URL:
+            http.has_cookies = True     # nothing to log into: anonymous requests are the session
+        if FETCH_MODE == "hybrid":
+            pool = BrowserPool(crawler, BROWSER_SESSIONS)
+            fetcher = HybridFetcher(pool, http, js_patterns=JS_PATTERNS)
+    recrawl = None
+    if RECRAWL_CACHE:
+        recrawl = RecrawlCache(RECRAWL_DB, mode=OUTPUT_MODE)
+        fetcher = ConditionalFetcher(fetcher, http, recrawl, key=normalize_url)
+        print(f"[CACHE] {recrawl.count()} pages cached for revalidation ({RECRAWL_DB})")
+    print(f"[START] Crawler started. BFS on: {ADMIN_URL} ({CONCURRENCY} workers, fetch: "
+          f"{'hybrid' if pool is not None else 'browser'})")
 
-    visited = set()
-    q = deque([(normalize_url(ADMIN_URL), 0)])
-    pages_written = 0
+    out_path = compressed_path(OUT_JSONL, OUT_COMPRESSION)
+    blobs = BlobStore(BLOB_DIR) if OUTPUT_MODE == "slim" and STORE_BODIES else None
+    store = CrawlState(STATE_DB)
+    if not RESUME:
+        store.reset()
+    mode = "w"
+    if not store.is_empty():
+        mode = "a"
+        print(f"[RESUME] {store.count(DONE)} pages already written, "
+              f"{len(store.frontier())} URLs left in the frontier ({STATE_DB})")
 
-    with OUT_JSONL.open("w", encoding="utf-8") as fout:
-        while q and pages_written < MAX_PAGES:
-            url, depth = q.popleft()
-            if url in visited:
-                continue
-            if depth > MAX_DEPTH:
-                continue
-            if not in_scope(url):
-                continue
-
-            time.sleep(DELAY_S)
-            if VERBOSE: print(f"[FETCH][d={depth}] {url}")
-
-            try:
-                result = await crawler.arun(url, config=crawler_run_config)
-            except Exception as e:
-                print(f"[ERR] arun({url}) : {e}")
-                visited.add(url)
-                continue
-
-            # Write one JSON line per page
-            try:
-                line = result_to_jsonl_line(result, fallback_url=url)
-                fout.write(line + "\n")
-                pages_written += 1
-            except Exception as e:
-                print(f"[WARN] JSONL write failed for {url}: {e}")
-
-            visited.add(url)
-
-            # Enqueue new links
-            try:
-                for ln in extract_links(result, base=url):
-                    if ln not in visited and ln.startswith(BASE_SCOPE):
-                        q.append((ln, depth + 1))
-            except Exception as e:
-                if VERBOSE: print(f"[WARN] extract_links: {e}")
+    try:
+        with stage("crawl") as st, \
+                JsonlWriter(out_path, mode=mode, compression=OUT_COMPRESSION, batch_size=WRITE_BATCH) as fout:
+            pages_written = await crawl(fetcher, crawler_run_config, fout, store, concurrency=CONCURRENCY,
+                                        blobs=blobs, recrawl=recrawl)
+            st.rows_out = pages_written
+    finally:
+        store.close()
+        if recrawl is not None:
+            recrawl.close()
+        if http is not None:
+            await http.close()
+        if pool is not None:
+            await pool.close()
 
     await crawler.close()
-    print(f"[END] Wrote {pages_written} lines to {OUT_JSONL}")
+    print(f"[END] Wrote {pages_written} lines to {out_path}")
+    return pages_written
 
 if __name__ == "__main__":
     asyncio.run(main())
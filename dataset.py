@@ -0,0 +1,298 @@
+# Shared on-disk dataset used by every pipeline stage
+#
+#   <dir>/manifest.json   row count, row-id fingerprint, column groups, feature arrays
+#   <dir>/<group>.parquet column groups: same rows in the same order, each with the "id" column
+#   <dir>/<name>.npy      feature arrays (memory-mapped on load)
+#   <dir>/<name>.npz      sparse feature arrays (scipy.sparse CSR, X of `run_kmeans_sklearn.py --sparse`)
+#
+# Stages add what they produce (convert -> "crawl" group, tokenise -> "tokens" group,
+# kmeans -> X / labels / centers arrays) and read only the columns they need.
+# A dataset path is a directory (no file suffix); .csv / .parquet / .npz paths are
+# still accepted by load_frame() / load_features() for the legacy file-per-stage layout.
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+MANIFEST = "manifest.json"
+ROW_ID = "id"
+VERSION = 1
+NPZ_NOT_ROW_ALIGNED = {"centers"}   # legacy .npz arrays that are not one row per sample
+
+class AlignmentError(ValueError):
+    """Rows of a table and of a feature array do not match."""
+
+def is_dataset(path) -> bool:
+    p = Path(path)
+    return (p / MANIFEST).exists() or (p.suffix == "" and not p.is_file())
+
+def ids_fingerprint(ids) -> str:
+    ids = np.ascontiguousarray(np.asarray(ids, dtype=np.int64))
+    return hashlib.sha1(ids.tobytes()).hexdigest()
+
+class Dataset:
+    def __init__(self, path):
+        self.path = Path(path)
+        mf = self.path / MANIFEST
+        if mf.exists():
+            self.manifest = json.loads(mf.read_text(encoding="utf-8"))
+        else:
+            self.manifest = {"version": VERSION, "n_rows": None, "rows": None, "groups": {}, "arrays": {}}
+
+    @classmethod
+    def create(cls, path):
+        """Start a new dataset at `path` (a previous manifest there is replaced)."""
+        ds = cls.__new__(cls)
+        ds.path = Path(path)
+        ds.manifest = {"version": VERSION, "n_rows": None, "rows": None, "groups": {}, "arrays": {}}
+        ds._save()
+        return ds
+
+    # ---- manifest ----
+    @property
+    def n_rows(self):
+        return self.manifest["n_rows"]
+
+    @property
+    def fingerprint(self):
+        return self.manifest["rows"]
+
+    def columns(self) -> dict:
+        """column -> group (first group wins when a column appears twice)."""
+        out = {}
+        for g, meta in self.manifest["groups"].items():
+            for c in meta["columns"]:
+                out.setdefault(c, g)
+        return out
+
+    def _save(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / (MANIFEST + ".tmp")
+        tmp.write_text(json.dumps(self.manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path / MANIFEST)
+
+    def _check_rows(self, n: int, fp: str, what: str):
+        if self.n_rows is None:
+            self.manifest["n_rows"], self.manifest["rows"] = n, fp
+        elif n != self.n_rows or fp != self.fingerprint:
+            raise AlignmentError(
+                f"{what}: {n} rows do not match the dataset rows ({self.n_rows}) in {self.path}")
+
+    # ---- tables ----
+    def register_group(self, name: str, filename: str):
+        """Record a parquet file already written in the dataset directory as a column group."""
+        import pyarrow.parquet as pq
+        f = self.path / filename
+        ids = pq.read_table(f, columns=[ROW_ID]).column(ROW_ID).to_numpy()
+        self._check_rows(len(ids), ids_fingerprint(ids), f"group '{name}'")
+        cols = [c for c in pq.read_schema(f).names if c != ROW_ID]
+        self.manifest["groups"][name] = {"file": filename, "columns": cols}
+        self._save()
+
+    def write_group(self, name: str, df: pd.DataFrame):
+        if ROW_ID not in df.columns:
+            raise ValueError(f"column group '{name}' needs a '{ROW_ID}' column")
+        self._check_rows(len(df), ids_fingerprint(df[ROW_ID].to_numpy()), f"group '{name}'")
+        self.path.mkdir(parents=True, exist_ok=True)
+        filename = f"{name}.parquet"
+        df.to_parquet(self.path / filename, index=False, compression="zstd")
+        self.register_group(name, filename)
+
+    def read(self, columns=None) -> pd.DataFrame:
+        """Read `columns` (missing ones are ignored; None = all) plus the id column."""
+        import pyarrow.parquet as pq
+        where = self.columns()
+        wanted = list(where) if columns is None else [c for c in columns if c in where and c != ROW_ID]
+        by_group = {}
+        for c in wanted:
+            by_group.setdefault(where[c], []).append(c)
+        if not by_group and self.manifest["groups"]:
+            by_group[next(iter(self.manifest["groups"]))] = []
+        frames = []
+        for i, (g, cols) in enumerate(by_group.items()):
+            f = self.path / self.manifest["groups"][g]["file"]
+            t = pq.read_table(f, columns=([ROW_ID] if i == 0 else []) + cols, memory_map=True)
+            frames.append(t.to_pandas())
+        if not frames:
+            return pd.DataFrame({ROW_ID: np.empty(0, dtype=np.int64)})
+        return pd.concat(frames, axis=1) if len(frames) > 1 else frames[0]
+
+    def iter_batches(self, columns, batch_size: int):
+        """Stream `columns` (+ id) as DataFrames of at most `batch_size` rows.
+
+        The columns must live in a single group (each group file has its own row groups,
+        so batches of different files do not line up).
+        """
+        import pyarrow.parquet as pq
+        where = self.columns()
+        groups = {where[c] for c in columns if c in where and c != ROW_ID}
+        if len(groups) > 1:
+            raise ValueError(f"columns {columns} span several groups: {sorted(groups)}")
+        g = groups.pop() if groups else next(iter(self.manifest["groups"]))
+        cols = [ROW_ID] + [c for c in columns if c in where and c != ROW_ID]
+        pf = pq.ParquetFile(self.path / self.manifest["groups"][g]["file"], memory_map=True)
+        for batch in pf.iter_batches(batch_size=batch_size, columns=cols):
+            yield batch.to_pandas()
+
+    def group_writer(self, name: str):
+        """Write a column group batch by batch: `with ds.group_writer("g") as w: w.write(df)`."""
+        return _GroupWriter(self, name)
+
+    # ---- arrays ----
+    def write_array(self, name: str, arr, row_aligned: bool = True):
+        """Dense arrays as <name>.npy, scipy.sparse matrices as a CSR <name>.npz."""
+        sparse = sp.issparse(arr)
+        arr = arr.tocsr() if sparse else np.asarray(arr)
+        if row_aligned and self.n_rows is not None and arr.shape[0] != self.n_rows:
+            raise AlignmentError(f"array '{name}' has {arr.shape[0]} rows, dataset has {self.n_rows}")
+        self.path.mkdir(parents=True, exist_ok=True)
+        filename = f"{name}.npz" if sparse else f"{name}.npy"
+        if sparse:
+            sp.save_npz(self.path / filename, arr, compressed=False)
+        else:
+            np.save(self.path / filename, arr, allow_pickle=False)
+        old = self.manifest["arrays"].get(name)
+        if old and old["file"] != filename:
+            (self.path / old["file"]).unlink(missing_ok=True)     # dense <-> sparse rewrite
+        self.manifest["arrays"][name] = {
+            "file": filename, "shape": list(arr.shape), "dtype": str(arr.dtype),
+            "row_aligned": row_aligned, "rows": self.fingerprint if row_aligned else None,
+        }
+        if sparse:
+            self.manifest["arrays"][name].update(format="csr", nnz=int(arr.nnz))
+        self._save()
+
+    def create_array(self, name: str, shape, dtype, row_aligned: bool = True):
+        """New .npy array opened as a writable memmap (filled in place by out-of-core stages)."""
+        shape = tuple(int(d) for d in shape)
+        if row_aligned and self.n_rows is not None and shape[0] != self.n_rows:
+            raise AlignmentError(f"array '{name}' has {shape[0]} rows, dataset has {self.n_rows}")
+        self.path.mkdir(parents=True, exist_ok=True)
+        filename = f"{name}.npy"
+        mm = np.lib.format.open_memmap(self.path / filename, mode="w+", dtype=dtype, shape=shape)
+        old = self.manifest["arrays"].get(name)
+        if old and old["file"] != filename:
+            (self.path / old["file"]).unlink(missing_ok=True)
+        self.manifest["arrays"][name] = {
+            "file": filename, "shape": list(shape), "dtype": str(np.dtype(dtype)),
+            "row_aligned": row_aligned, "rows": self.fingerprint if row_aligned else None,
+        }
+        self._save()
+        return mm
+
+    def has_array(self, name: str) -> bool:
+        return name in self.manifest["arrays"]
+
+    def load_array(self, name: str, mmap: bool = True):
+        meta = self.manifest["arrays"].get(name)
+        if meta is None:
+            raise KeyError(f"array '{name}' not found in {self.path}")
+        if meta["row_aligned"] and meta["rows"] != self.fingerprint:
+            raise AlignmentError(f"array '{name}' was computed on other rows than the current dataset")
+        if meta.get("format") == "csr":
+            return sp.load_npz(self.path / meta["file"]).tocsr()
+        return np.load(self.path / meta["file"], mmap_mode="r" if mmap else None, allow_pickle=False)
+
+class _GroupWriter:
+    def __init__(self, ds: Dataset, name: str):
+        self.ds, self.name, self.filename = ds, name, f"{name}.parquet"
+        self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def write(self, df: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if ROW_ID not in df.columns:
+            raise ValueError(f"column group '{self.name}' needs a '{ROW_ID}' column")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.ds.path.mkdir(parents=True, exist_ok=True)
+            self.writer = pq.ParquetWriter(str(self.ds.path / self.filename), table.schema,
+                                           compression="zstd")
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def __exit__(self, exc_type, *exc):
+        if self.writer is not None:
+            self.writer.close()
+            if exc_type is None:
+                self.ds.register_group(self.name, self.filename)
+        return False
+
+# ---- helpers shared by the stage scripts (dataset dir or legacy files) ----
+def load_frame(path, columns=None) -> pd.DataFrame:
+    """Table from a dataset dir, a parquet/arrow file or a CSV; only `columns` when given."""
+    p = Path(path)
+    if is_dataset(p):
+        return Dataset(p).read(columns)
+    if p.suffix.lower() in (".parquet", ".pq"):
+        import pyarrow.parquet as pq
+        names = pq.read_schema(p).names
+        cols = None if columns is None else [c for c in [ROW_ID] + list(columns) if c in names]
+        return pq.read_table(p, columns=list(dict.fromkeys(cols)) if cols else None,
+                             memory_map=True).to_pandas()
+    if p.suffix.lower() in (".arrow", ".feather", ".ipc"):
+        df = pd.read_feather(p)
+    elif columns is not None:
+        wanted = {ROW_ID, *columns}
+        df = pd.read_csv(p, usecols=lambda c: c in wanted)
+    else:
+        df = pd.read_csv(p)
+    if columns is not None:
+        keep = [c for c in dict.fromkeys([ROW_ID] + list(columns)) if c in df.columns]
+        df = df[keep]
+    return df
+
+def iter_frames(path, columns, chunksize: int):
+    """Like load_frame(), but streamed as DataFrames of at most `chunksize` rows."""
+    p = Path(path)
+    if is_dataset(p):
+        yield from Dataset(p).iter_batches(columns, chunksize)
+        return
+    wanted = list(dict.fromkeys([ROW_ID] + list(columns)))
+    if p.suffix.lower() in (".parquet", ".pq"):
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(p, memory_map=True)
+        cols = [c for c in wanted if c in pf.schema_arrow.names]
+        for batch in pf.iter_batches(batch_size=chunksize, columns=cols):
+            yield batch.to_pandas()
+        return
+    if p.suffix.lower() in (".arrow", ".feather", ".ipc"):
+        df = load_frame(p, columns)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+        return
+    yield from pd.read_csv(p, usecols=lambda c: c in wanted, chunksize=chunksize)
+
+def load_features(path, names, df: pd.DataFrame = None) -> dict:
+    """Arrays `names` from a dataset dir or a legacy .npz, checked against the rows of `df`."""
+    p = Path(path)
+    if is_dataset(p):
+        ds = Dataset(p)
+        if df is not None and ROW_ID in df.columns and ds.fingerprint is not None \
+                and ids_fingerprint(df[ROW_ID].to_numpy()) != ds.fingerprint:
+            raise AlignmentError(f"table rows do not match the rows of {p}")
+        return {n: ds.load_array(n) for n in names if ds.has_array(n)}
+    arr = np.load(p, allow_pickle=False)
+    out = {n: arr[n] for n in names if n in arr.files}
+    if "X" in names and "X" not in arr.files and "indptr" in arr.files:
+        out["X"] = sp.load_npz(p).tocsr()      # sparse X (scipy.sparse.save_npz keys)
+    if df is not None:
+        ids = arr["ids"] if "ids" in arr.files else None
+        for n, a in out.items():
+            if n not in NPZ_NOT_ROW_ALIGNED:
+                check_alignment(df, a.shape[0], ids, what=f"'{n}' in {p.name}")
+    return out
+
+def check_alignment(df: pd.DataFrame, n_rows: int, ids=None, what: str = "features"):
+    if len(df) != n_rows:
+        raise AlignmentError(f"{what} has {n_rows} rows but the table has {len(df)}")
+    if ids is not None and ROW_ID in df.columns and \
+            not np.array_equal(df[ROW_ID].to_numpy(dtype=np.int64), np.asarray(ids, dtype=np.int64)):
+        raise AlignmentError(f"{what}: row ids differ from the table ids")
@@ -0,0 +1,87 @@
+# Collapse near-duplicate pages before tokenization (see near_dup.py)
+# Usage: python dedup_near_duplicates.py <in.csv|in.parquet|dataset_dir> <out.csv|out.parquet|dataset_dir>
+#                [--threshold 0.8] [--num-perm 128] [--groups groups.csv]
+#
+# Runs between "Create convert_jsonl_to_csv.py" and tokenise_with_url2vec.py.
+# Near-duplicates (same admin list sorted or paged differently, same excerpt
+# with small changes, ...) are found with MinHash LSH on the URL tokens plus
+# the excerpt; the first row of each group is kept, with a dup_count column
+# (rows it stands for), so the later stages see far fewer rows and the seed
+# scoring still knows the group sizes. Ids are kept as they are.
+# A dataset_dir output is a new dataset (see dataset.py) whose "crawl" group
+# holds the kept rows; --groups writes id -> kept id for every input row.
+
+import argparse
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from dataset import Dataset, is_dataset, load_frame
+from metrics import stage
+from near_dup import COUNT_COLUMN, NUM_PERM, THRESHOLD, collapse
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Collapse near-duplicate pages (MinHash LSH)")
+    p.add_argument("input", help="Converted crawl (.csv, .parquet) or dataset directory")
+    p.add_argument("output", help="Output file (.csv, .parquet) or a new dataset directory")
+    p.add_argument("--threshold", type=float, default=THRESHOLD,
+                   help="Estimated Jaccard similarity above which two pages are duplicates")
+    p.add_argument("--num-perm", type=int, default=NUM_PERM, help="MinHash permutations")
+    p.add_argument("--text-column", default="excerpt", help="Text shingled with the URL tokens")
+    p.add_argument("--groups", default=None, help="CSV (id, kept_id) for every input row")
+    args = p.parse_args()
+    if not 0.0 < args.threshold <= 1.0:
+        p.error("--threshold must be in (0, 1]")
+    if args.num_perm < 1:
+        p.error("--num-perm must be >= 1")
+    return args
+
+def write_frame(df: pd.DataFrame, path: Path):
+    if is_dataset(path):
+        Dataset.create(path).write_group("crawl", df)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix.lower() in (".parquet", ".pq"):
+        df.to_parquet(path, index=False, compression="zstd")
+    else:
+        df.to_csv(path, index=False)
+
+def main():
+    args = parse_args()
+    IN = Path(args.input)
+    OUT = Path(args.output)
+    if not IN.exists():
+        print(f"[ERR] File not found: {IN}")
+        sys.exit(2)
+    if is_dataset(OUT) and OUT.resolve() == IN.resolve():
+        print("[ERR] Write the deduplicated rows to a new dataset dir (the input rows are kept as they are)")
+        sys.exit(2)
+
+    df = load_frame(IN)
+    if "url" not in df.columns:
+        print("[ERR] Column 'url' is missing from the input")
+        sys.exit(3)
+    if "id" not in df.columns:
+        df.insert(0, "id", range(len(df)))
+
+    with stage("dedup", rows_in=len(df)) as st:
+        kept, group = collapse(df, args.threshold, args.num_perm, args.text_column)
+        st.rows_out = len(kept)
+    write_frame(kept, OUT)
+
+    n_dups = len(df) - len(kept)
+    print(f"[INFO] {kept.attrs['candidate_pairs']} candidate pairs, "
+          f"{int((kept[COUNT_COLUMN] > 1).sum())} groups with duplicates, largest {int(kept[COUNT_COLUMN].max() if len(kept) else 0)}")
+    print(f"[OK] {len(kept)} rows written → {OUT}  ({n_dups} near-duplicates collapsed, "
+          f"{n_dups / max(1, len(df)):.1%})")
+
+    if args.groups:
+        kept_id = kept["id"].to_numpy()[pd.factorize(group)[0]]
+        groups_path = Path(args.groups)
+        groups_path.parent.mkdir(parents=True, exist_ok=True)
+        pd.DataFrame({"id": df["id"].to_numpy(), "kept_id": kept_id}).to_csv(groups_path, index=False)
+        print(f"[OK] Group membership → {groups_path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+"""
 Usage :
   python detect_and_merge_git.py \
     --csv pipeline/tmp/data.tokens.csv \
@@ -5,7 +6,9 @@ Usage :
     --reps outputs/seeds_cluster_reps.json \
     --out outputs/seeds_selected.json \
     --top-anomalies 20 \
-    --contamination 0.02
+    --contamination 0.02 \
+    [--method isolation_forest|centroid|lof] [--per-cluster] \
+    [--fit-sample 100000] [--save-detector models/iforest.joblib | --detector models/iforest.joblib]
 """
 
 import json
@@ -14,17 +17,28 @@ from pathlib import Path
 import numpy as np
 import pandas as pd
 
-# GitHub code using scikit-learn: IsolationForest
-from sklearn.ensemble import IsolationForest
+# GitHub code using scikit-learn: IsolationForest (see anomaly_engine.py)
+from anomaly_engine import DETECTORS, AnomalyEngine
+from dataset import AlignmentError, load_frame, load_features
+from metrics import stage
 
 def parse_args():
     p = argparse.ArgumentParser()
-    p.add_argument("--csv", required=True, help="Tokenised CSV (id,url,(url_tokens|tokens), ...)")
-    p.add_argument("--npz", required=True, help="features.npz (X, labels, centers)")
+    p.add_argument("--csv", required=True, help="Tokenised CSV (id,url,(url_tokens|tokens), ...) or dataset dir")
+    p.add_argument("--npz", required=True, help="features.npz (X, labels, centers) or dataset dir")
     p.add_argument("--reps", required=True, help="JSON representatives (step F)")
     p.add_argument("--out", required=True, help="Output JSON (final seeds)")
     p.add_argument("--top-anomalies", type=int, default=20, help="Number of anomalies to add")
     p.add_argument("--contamination", type=float, default=0.02, help="Presumed anomaly rate (IsolationForest)")
+    p.add_argument("--method", choices=DETECTORS, default="isolation_forest",
+                   help="Anomaly detector (centroid = distance to the k-means centers, no training)")
+    p.add_argument("--per-cluster", action="store_true",
+                   help="One detector per k-means cluster, clusters scored in parallel")
+    p.add_argument("--fit-sample", type=int, default=100_000, help="Rows used to fit the detector (0 = all)")
+    p.add_argument("--chunk-size", type=int, default=50_000, help="Rows per scoring chunk")
+    p.add_argument("--jobs", type=int, default=-1, help="Parallel scoring chunks / clusters (-1 = all cores)")
+    p.add_argument("--save-detector", default=None, help="Save the fitted detector (joblib)")
+    p.add_argument("--detector", default=None, help="Reuse a saved detector instead of fitting")
     return p.parse_args()
 
 def main():
@@ -34,120 +48,155 @@ def main():
     reps_path = Path(args.reps)
     out_path = Path(args.out)
 
-    # Load data
-    df = pd.read_csv(csv_path)
-    arr = np.load(npz_path, allow_pickle=True)
+    # Load data (only the columns used below; rows of X / labels must match the table)
+    df = load_frame(csv_path, columns=["url", "url_tokens", "tokens",
+                                       "has_form", "status", "response_time_ms", "dup_count"])
+    try:
+        arr = load_features(npz_path, ["X", "labels", "centers"], df=df)
+    except AlignmentError as e:
+        raise SystemExit(f"[ERR] {e}")
     X = arr["X"]            # (n_samples, n_features)
     labels = arr["labels"]  # (n_samples,)
-    # centers = arr["centers"]  # not needed here
+    centers = arr.get("centers")  # (k, n_features), used by the centroid detector
+
+    # Representatives (step F)
+    with reps_path.open("r", encoding="utf-8") as fh:
+        reps = json.load(fh)
+
+    with stage("detect", rows_in=len(df)) as st:
+        final_sorted = merge_seeds(df, X, labels, centers, reps, top_anomalies=args.top_anomalies,
+                                   contamination=args.contamination, method=args.method,
+                                   per_cluster=args.per_cluster, fit_sample=args.fit_sample,
+                                   chunk_size=args.chunk_size, jobs=args.jobs,
+                                   detector=args.detector, save_detector=args.save_detector)
+        st.rows_out = len(final_sorted)
+
+    # Write output
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with out_path.open("w", encoding="utf-8") as fh:
+        json.dump(final_sorted, fh, ensure_ascii=False, indent=2)
 
-    # Synchronize if necessary
-    if len(df) != len(labels):
-        n = min(len(df), len(labels))
-        df = df.iloc[:n].reset_index(drop=True)
-        X = X[:n]
-        labels = labels[:n]
+    print(f"[OK] {len(final_sorted)} final seeds written → {out_path}")
 
+def merge_seeds(df, X, labels, centers, reps, top_anomalies=20, contamination=0.02,
+                method="isolation_forest", per_cluster=False, fit_sample=100_000, chunk_size=50_000,
+                jobs=-1, detector=None, save_detector=None) -> list:
+    """Representatives + top anomalies of X, scored and sorted (the final seed list)."""
     # Token column (supports 'url_tokens' or 'tokens')
     tok_col = "url_tokens" if "url_tokens" in df.columns else ("tokens" if "tokens" in df.columns else None)
     if tok_col is None:
         raise SystemExit("[ERR] CSV must contain 'url_tokens' or 'tokens'.")
 
-    # 2) IsolationForest
-    print(f"[ANOM] IsolationForest (contamination={args.contamination}) …")
-    iso = IsolationForest(
-        n_estimators=200,
-        contamination=args.contamination,
-        random_state=42,
-        n_jobs=-1
-    )
+    # 2) Anomaly detector: fit on a subsample (or reuse a saved one), score X once in chunks
     # decision_function: larger = more "normal", smaller = more "abnormal"
-    iso.fit(X)
-    scores = iso.decision_function(X)          # array shape (n_samples,)
-    pred = iso.predict(X)                      # 1 = normal, -1 = anomaly
+    with stage("anomaly", rows_in=X.shape[0]) as st:
+        try:
+            if detector:
+                engine = AnomalyEngine.load(detector, chunk_size=chunk_size, n_jobs=jobs)
+                print(f"[ANOM] {engine.detector}{' (per cluster)' if engine.per_cluster else ''} loaded from "
+                      f"{detector} (fitted {engine.meta['created_at']} on {engine.meta['fit_rows']} rows) …")
+                scores, pred = engine.score(X, labels)
+            else:
+                print(f"[ANOM] {method}{' per cluster' if per_cluster else ''} "
+                      f"(contamination={contamination}) …")
+                engine = AnomalyEngine(contamination=contamination, fit_sample=fit_sample,
+                                       chunk_size=chunk_size, n_jobs=jobs, detector=method,
+                                       centers=centers, per_cluster=per_cluster)
+                scores, pred = engine.fit_score(X, labels)  # pred: 1 = normal, -1 = anomaly
+                if save_detector:
+                    engine.save(save_detector)
+                    print(f"[ANOM] Detector saved → {save_detector}")
+        except ValueError as e:
+            raise SystemExit(f"[ERR] {e}")
+        st.rows_out = int((pred == -1).sum())
     df["_anomaly_pred"] = pred
     df["_anomaly_score"] = -scores             # invert: larger => more anomalous
 
-    # 3) Load representatives and create a set to avoid duplicates
-    with reps_path.open("r", encoding="utf-8") as fh:
-        reps = json.load(fh)
+    # 3) Set of representative URLs to avoid duplicates
     selected_urls = set([r.get("url","") for r in reps])
 
-    # 4) Select top anomalies (excluding representatives)
-    anomalies = df[df["_anomaly_pred"] == -1].copy()
-    # Sort by anomaly score (descending, most anomalous first),
-    # and fallback on response_time_ms if available.
-    if "response_time_ms" in df.columns:
-        anomalies["_rt"] = pd.to_numeric(anomalies["response_time_ms"], errors="coerce").fillna(0.0)
-    else:
-        anomalies["_rt"] = 0.0
-
-    anomalies = anomalies.sort_values(["_anomaly_score", "_rt"], ascending=[False, False])
-
-    topN = max(0, args["top_anomalies"] if isinstance(args, dict) else args.top_anomalies)
-    add_list = []
-    for _, row in anomalies.iterrows():
-        if len(add_list) >= topN:
-            break
-        url = row.get("url", "")
-        if not url or url in selected_urls:
-            continue
-        add_list.append({
-            "cluster": int(row.name if "cluster" in row else -1),  # cluster not essential here
-            "id": int(row.get("id", -1)) if "id" in row else None,
-            "url": url,
-            "tokens": row.get(tok_col, ""),
-            "_anomaly": 1
-        })
-        selected_urls.add(url)
+    # 4) Select top anomalies (excluding representatives), vectorized:
+    # filter -> sort -> first occurrence of each URL -> head(topN)
+    with stage("select_anomalies", rows_in=len(df)) as st:
+        anomalies = df[df["_anomaly_pred"] == -1].copy()
+        # Sort by anomaly score (descending, most anomalous first),
+        # and fallback on response_time_ms if available.
+        if "response_time_ms" in df.columns:
+            anomalies["_rt"] = pd.to_numeric(anomalies["response_time_ms"], errors="coerce").fillna(0.0)
+        else:
+            anomalies["_rt"] = 0.0
+
+        topN = max(0, top_anomalies)
+        urls = anomalies["url"].fillna("").astype(str) if "url" in anomalies.columns else pd.Series("", index=anomalies.index)
+        anomalies = anomalies[(urls != "") & ~urls.isin(selected_urls)]
+        anomalies = anomalies.sort_values(["_anomaly_score", "_rt"], ascending=[False, False], kind="stable")
+        anomalies = anomalies.drop_duplicates("url").head(topN)
+
+        add_list = [
+            {
+                "cluster": int(c),
+                "id": int(i) if i is not None else None,
+                "url": u,
+                "tokens": t,
+                "_anomaly": 1,
+            }
+            for c, i, u, t in zip(
+                anomalies["cluster"] if "cluster" in anomalies.columns else [-1] * len(anomalies),  # cluster not essential here
+                anomalies["id"] if "id" in anomalies.columns else [None] * len(anomalies),
+                anomalies["url"],
+                anomalies[tok_col].fillna(""),
+            )
+        ]
+        st.rows_out = len(add_list)
 
     print(f"[ANOM] Added {len(add_list)} anomalies to {len(reps)} representatives.")
 
     # 5) Scoring / prioritization
-    # We combine: anomaly, has_form, status>=400, response_time_ms, and a bonus if representative
+    # We combine: anomaly, has_form, status>=400, response_time_ms, near-duplicate group size
+    # (dup_count), and a bonus if representative
     # (Columns may be missing: we handle defaults.)
-    def to_num(s):
-        try:
-            return float(s)
-        except Exception:
-            return 0.0
-
-    def score_entry(e):
-        # Find the corresponding row in df to enrich
-        row = df[df["url"] == e["url"]].head(1)
-        has_form = int(row["has_form"].iloc[0]) if "has_form" in df.columns and not row.empty else 0
-        status = int(row["status"].iloc[0]) if "status" in df.columns and not row.empty else -1
-        rt = to_num(row["response_time_ms"].iloc[0]) if "response_time_ms" in df.columns and not row.empty else 0.0
-
-        anomaly_bonus = 2.0 if e.get("_anomaly", 0) == 1 else 0.0
-        error_bonus = 1.5 if status >= 400 else 0.0
-        form_bonus = 1.5 if has_form == 1 else 0.0
-        rt_bonus = min(rt / 1000.0, 2.0)  # rough normalization (<= 2)
-
-        base = 1.0  # all seeds start at 1
-        return base + anomaly_bonus + error_bonus + form_bonus + rt_bonus
-
-    final = []
-    # Mark representatives
-    for r in reps:
-        r = dict(r)
-        r["_anomaly"] = 0
-        r["_score"] = score_entry(r)
-        final.append(r)
-    # Add anomalies
-    for a in add_list:
-        a = dict(a)
-        a["_score"] = score_entry(a)
-        final.append(a)
+    # One URL-indexed lookup (first row per URL) joined to all seeds, scores computed column-wise.
+    with stage("score_seeds") as st:
+        final = [dict(r, _anomaly=0) for r in reps] + [dict(a) for a in add_list]
+        feats = pd.DataFrame(index=df.index)
+        feats["has_form"] = pd.to_numeric(df["has_form"], errors="coerce").fillna(0) if "has_form" in df.columns else 0
+        feats["status"] = pd.to_numeric(df["status"], errors="coerce").fillna(-1) if "status" in df.columns else -1
+        feats["rt"] = pd.to_numeric(df["response_time_ms"], errors="coerce").fillna(0.0) \
+            if "response_time_ms" in df.columns else 0.0
+        feats["url"] = df["url"]
+        if "dup_count" in df.columns:       # near-duplicate group size (dedup_near_duplicates.py)
+            feats["dup_count"] = pd.to_numeric(df["dup_count"], errors="coerce").fillna(1)
+        lookup = feats.drop_duplicates("url").set_index("url")
+
+        seeds = pd.DataFrame({
+            "url": [e.get("url", "") for e in final],
+            "_anomaly": [e.get("_anomaly", 0) for e in final],
+        })
+        # missing URL -> defaults (has_form 0, status -1, rt 0)
+        seeds = seeds.join(lookup, on="url")
+        has_form = seeds["has_form"].fillna(0).astype(int)
+        status = seeds["status"].fillna(-1)
+        rt = seeds["rt"].fillna(0.0)
+
+        anomaly_bonus = np.where(seeds["_anomaly"] == 1, 2.0, 0.0)
+        error_bonus = np.where(status >= 400, 1.5, 0.0)
+        form_bonus = np.where(has_form == 1, 1.5, 0.0)
+        rt_bonus = np.minimum(rt.to_numpy(dtype=float) / 1000.0, 2.0)  # rough normalization (<= 2)
+        # a page standing for many near-duplicates covers more of the site: log10, <= 1 (10+ pages)
+        dup = seeds["dup_count"].fillna(1).to_numpy(dtype=float) if "dup_count" in seeds.columns \
+            else np.ones(len(seeds))
+        dup_bonus = np.minimum(np.log10(np.maximum(dup, 1.0)), 1.0)
+        scores = 1.0 + anomaly_bonus + error_bonus + form_bonus + rt_bonus + dup_bonus  # all seeds start at 1
+
+        for e, sc in zip(final, scores):
+            e["_score"] = float(sc)
+        if "dup_count" in seeds.columns:
+            for e, d in zip(final, seeds["dup_count"].fillna(1)):
+                e["_dup_count"] = int(d)
+        st.rows_in = st.rows_out = len(final)
 
     final_sorted = sorted(final, key=lambda x: x["_score"], reverse=True)
-
-    # Write output
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    with out_path.open("w", encoding="utf-8") as fh:
-        json.dump(final_sorted, fh, ensure_ascii=False, indent=2)
-
-    print(f"[OK] {len(final_sorted)} final seeds written → {out_path}")
+    return final_sorted
 
 if __name__ == "__main__":
     main()
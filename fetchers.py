@@ -0,0 +1,223 @@
+# Page fetchers for crawling.py (FETCH_MODE = "hybrid")
+#
+#   HttpFetcher    pooled aiohttp session (keep-alive connections) carrying the
+#                  browser's logged-in cookies; parses title / links / text itself
+#   BrowserPool    a fixed set of crawl4ai session ids, so JS pages reuse a few
+#                  long-lived browser pages instead of a fresh context per URL
+#   HybridFetcher  arun(url, config) like AsyncWebCrawler: plain HTTP first, and
+#                  the browser only for URLs / responses that need JavaScript
+#                  (JS_URL_PATTERNS, script-only shells, lost session)
+#
+# Results of the HTTP path expose the CrawlResult fields crawling.py reads
+# (url, status_code, html, metadata, markdown, links, model_dump_json).
+
+import asyncio
+import copy
+import html as htmllib
+import json
+import re
+import time
+from urllib.parse import urljoin, urlparse
+
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:     # hybrid mode unavailable, crawling.py falls back to the browser
+    aiohttp = None
+
+from metrics import inc, observe
+
+# URLs rendered by JavaScript in a stock WordPress admin (block editor, customizer, ...)
+JS_URL_PATTERNS = (
+    "post-new.php", "action=edit", "site-editor.php", "customize.php", "widgets.php",
+    "admin.php?page=wc-admin",
+)
+JS_MIN_TEXT = 200           # an HTML page with scripts but less visible text than this is a JS shell
+JS_SHELL_MARKERS = ('<div id="root"></div>', '<div id="app"></div>', "You need to enable JavaScript")
+MAX_BODY_BYTES = 5 << 20    # bodies of larger (or binary) responses are not kept
+
+# links are <a href> / <area href> only (scripts, stylesheets, images are not pages)
+HREF_RE = re.compile(r"""<(?:a|area)\b[^>]*?\bhref\s*=\s*["']([^"'#]+)""", re.I)
+TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.I | re.S)
+SCRIPT_RE = re.compile(r"<(script|style)\b.*?</\1\s*>", re.I | re.S)
+TAG_RE = re.compile(r"<[^>]+>")
+WS_RE = re.compile(r"\s+")
+
+class HttpResult:
+    """Subset of crawl4ai's CrawlResult for a page fetched without the browser.
+    `skipped` names why the response is not a page to write ("non_html"), else None."""
+    def __init__(self, url, status_code, html, headers, links, title, text, skipped=None):
+        self.url = url
+        self.status_code = status_code
+        self.html = html
+        self.response_headers = headers
+        self.links = links
+        self.metadata = {"title": title}
+        self.markdown = text
+        self.success = skipped is None and status_code is not None and status_code < 400
+        self.skipped = skipped
+        self.fetched_with = "http"
+
+    def model_dump_json(self) -> str:
+        return json.dumps({
+            "url": self.url, "html": self.html, "success": self.success,
+            "status_code": self.status_code, "response_headers": self.response_headers,
+            "metadata": self.metadata, "links": self.links, "markdown": self.markdown,
+            "fetched_with": self.fetched_with,
+        }, ensure_ascii=False)
+
+def parse_html(url: str, html: str):
+    """(links {"internal": [...], "external": [...]}, title, visible text)"""
+    host = urlparse(url).netloc.lower()
+    internal, external = [], []
+    for raw in HREF_RE.findall(html):
+        href = urljoin(url, htmllib.unescape(raw.strip()))
+        if not href.startswith("http"):
+            continue
+        (internal if urlparse(href).netloc.lower() == host else external).append({"href": href})
+    m = TITLE_RE.search(html)
+    title = WS_RE.sub(" ", htmllib.unescape(m.group(1))).strip() if m else None
+    text = WS_RE.sub(" ", htmllib.unescape(TAG_RE.sub(" ", SCRIPT_RE.sub(" ", html)))).strip()
+    return {"internal": internal, "external": external}, title, text
+
+def url_needs_js(url: str, patterns=JS_URL_PATTERNS) -> bool:
+    return any(p in url for p in patterns)
+
+def page_needs_js(result: HttpResult) -> bool:
+    """Script-driven shell: markers of a JS app, or scripts and almost no text."""
+    html = result.html or ""
+    if any(m in html for m in JS_SHELL_MARKERS):
+        return True
+    return "<script" in html.lower() and len(result.markdown or "") < JS_MIN_TEXT
+
+class HttpFetcher:
+    def __init__(self, pool_size: int = 16, timeout_s: float = 30.0, user_agent: str = None):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is not installed (pip install aiohttp)")
+        self.pool_size = pool_size
+        self.timeout_s = timeout_s
+        self.user_agent = user_agent
+        self.session = None
+        self.has_cookies = False
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size),
+            cookie_jar=aiohttp.CookieJar(unsafe=True),      # cookies for IP hosts too
+            timeout=aiohttp.ClientTimeout(total=self.timeout_s),
+            headers={"User-Agent": self.user_agent} if self.user_agent else None,
+        )
+        return self
+
+    def set_cookies(self, cookies):
+        """Playwright context.cookies() -> the session's cookie jar."""
+        for c in cookies or []:
+            domain = (c.get("domain") or "").lstrip(".")
+            if not domain or not c.get("name"):
+                continue
+            scheme = "https" if c.get("secure") else "http"
+            self.session.cookie_jar.update_cookies({c["name"]: c.get("value", "")},
+                                                   URL(f"{scheme}://{domain}{c.get('path') or '/'}"))
+            self.has_cookies = True
+
+    async def fetch(self, url: str, headers: dict = None) -> HttpResult:
+        async with self.session.get(url, headers=headers, allow_redirects=True) as resp:
+            ctype = resp.headers.get("Content-Type", "")
+            body = await resp.content.read(MAX_BODY_BYTES + 1)
+            final = str(resp.url)
+            html, links, title, text = "", {"internal": [], "external": []}, None, ""
+            if ctype and "html" not in ctype:
+                # CSS, JS, images, downloads: nothing to write or follow
+                return HttpResult(final, resp.status, html, dict(resp.headers), links, title, text,
+                                  skipped="non_html")
+            if len(body) <= MAX_BODY_BYTES:
+                html = body.decode(resp.charset or "utf-8", errors="replace")
+                links, title, text = parse_html(final, html)
+            return HttpResult(final, resp.status, html, dict(resp.headers), links, title, text)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+class BrowserPool:
+    """N reusable crawl4ai sessions (one browser page each) lent to one fetch at a time."""
+    def __init__(self, crawler, size: int = 4, prefix: str = "pool"):
+        self.crawler = crawler
+        self.ids = [f"{prefix}-{i}" for i in range(max(1, size))]
+        self._free = asyncio.Queue()
+        for sid in self.ids:
+            self._free.put_nowait(sid)
+
+    @staticmethod
+    def _with_session(config, sid: str):
+        if config is None:
+            return None
+        try:
+            return config.clone(session_id=sid)
+        except AttributeError:      # older crawl4ai without clone()
+            cfg = copy.copy(config)
+            cfg.session_id = sid
+            return cfg
+
+    async def arun(self, url: str, config=None):
+        sid = await self._free.get()
+        try:
+            return await self.crawler.arun(url, config=self._with_session(config, sid))
+        finally:
+            self._free.put_nowait(sid)
+
+    async def close(self):
+        kill = getattr(getattr(self.crawler, "crawler_strategy", None), "kill_session", None)
+        if kill is None:
+            return
+        for sid in self.ids:
+            try:
+                await kill(sid)
+            except Exception:
+                pass
+
+class HybridFetcher:
+    """AsyncWebCrawler.arun() replacement: HTTP fast path, browser pool for JS pages."""
+    def __init__(self, browser: BrowserPool, http: HttpFetcher, js_patterns=JS_URL_PATTERNS,
+                 login_marker: str = "wp-login.php"):
+        self.browser = browser
+        self.http = http
+        self.js_patterns = js_patterns
+        self.login_marker = login_marker
+
+    async def _browser(self, url, config, reason: str):
+        inc(f"crawl_fetch_browser_{reason}")
+        t0 = time.perf_counter()
+        result = await self.browser.arun(url, config=config)
+        observe("crawl_browser_latency_ms", (time.perf_counter() - t0) * 1000.0)
+        return result
+
+    async def arun(self, url: str, config=None, prefetched: HttpResult = None):
+        """`prefetched`: an HTTP response of `url` already in hand (recrawl revalidation)."""
+        # no session cookies yet (login happens in the first browser context) or a JS URL
+        if not self.http.has_cookies:
+            return await self._browser(url, config, "no_session")
+        if url_needs_js(url, self.js_patterns):
+            return await self._browser(url, config, "js_url")
+        result = prefetched
+        if result is None:
+            t0 = time.perf_counter()
+            try:
+                result = await self.http.fetch(url)
+            except Exception:
+                inc("crawl_fetch_http_errors")
+                return await self._browser(url, config, "http_error")
+            observe("crawl_http_latency_ms", (time.perf_counter() - t0) * 1000.0)
+        if result.skipped:
+            return result       # not a page: the browser would not make it one
+        if self.login_marker in result.url and self.login_marker not in url:
+            return await self._browser(url, config, "session_lost")
+        if page_needs_js(result):
+            return await self._browser(url, config, "js_page")
+        inc("crawl_fetch_http")
+        return result
+
+    async def close(self):
+        await self.http.close()
+        await self.browser.close()
@@ -0,0 +1,165 @@
+# Streaming JSONL writer (batched, background flush, optional gzip/zstd)
+# and content-addressed blob store for raw page bodies.
+#
+# Each flushed batch is written as an independent gzip member / zstd frame, so the
+# file stays readable as a single stream, can be appended to on resume, and a crash
+# loses at most the batch being written.
+
+import gzip
+import hashlib
+import io
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import zstandard  # optional
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = (None, "gzip", "zstd")
+SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+def compressed_path(path: Path, compression) -> Path:
+    """OUT_JSONL path with the suffix matching `compression` (x.jsonl -> x.jsonl.gz)."""
+    path = Path(path)
+    suffix = SUFFIXES[compression]
+    if suffix and not path.name.endswith(suffix):
+        path = path.with_name(path.name + suffix)
+    return path
+
+def open_jsonl(path: Path):
+    """Open a (possibly compressed) JSONL file for text reading, based on its suffix."""
+    path = Path(path)
+    if path.name.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed (pip install zstandard)")
+        fh = path.open("rb")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(fh, read_across_frames=True),
+                                encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+class JsonlWriter:
+    """Buffer lines in memory and flush them in batches from a background thread.
+
+    write() never blocks on disk I/O, so it is safe to call from the crawler event loop.
+    `on_flush` callbacks passed to write() run (in the writer thread) once the line is on disk.
+    """
+
+    def __init__(self, path: Path, mode: str = "w", compression=None,
+                 batch_size: int = 100, flush_interval: float = 1.0, level: int = 3):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"compression must be one of {COMPRESSIONS}, got {compression!r}")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstandard is not installed (pip install zstandard)")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.compression = compression
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.level = level
+        self._fh = self.path.open("ab" if mode == "a" else "wb")
+        self._zstd = zstandard.ZstdCompressor(level=level) if compression == "zstd" else None
+        self._buf = []
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self._error = None
+        self.lines_written = 0
+        self._thread = threading.Thread(target=self._run, name="jsonl-writer", daemon=True)
+        self._thread.start()
+
+    # ---- producer side ----
+    def write(self, line: str, on_flush=None):
+        if self._error is not None:
+            raise RuntimeError(f"JSONL writer failed: {self._error}")
+        with self._cond:
+            if self._closed:
+                raise ValueError("write to closed JsonlWriter")
+            self._buf.append((line if line.endswith("\n") else line + "\n", on_flush))
+            if len(self._buf) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self):
+        """Block until everything written so far is on disk."""
+        self._drain()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- writer thread ----
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._buf) < self.batch_size:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                closed = self._closed
+            try:
+                self._drain()
+            except Exception as e:
+                self._error = e
+                return
+            if closed:
+                return
+
+    def _drain(self):
+        # io_lock is held from the swap to the write so batches reach the file in order
+        with self._io_lock:
+            with self._cond:
+                batch, self._buf = self._buf, []
+            if not batch:
+                return
+            data = "".join(line for line, _ in batch).encode("utf-8")
+            if self.compression == "gzip":
+                data = gzip.compress(data, compresslevel=min(9, max(1, self.level)))
+            elif self.compression == "zstd":
+                data = self._zstd.compress(data)
+            self._fh.write(data)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self.lines_written += len(batch)
+        for _, cb in batch:
+            if cb is not None:
+                cb()
+
+class BlobStore:
+    """Content-addressed store: <root>/<h[:2]>/<h[2:4]>/<sha256>.gz, written once per content."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / f"{digest}.gz"
+
+    def put(self, data) -> str:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        p = self.path_for(digest)
+        if not p.exists():
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_name(f"{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(gzip.compress(data))
+            os.replace(tmp, p)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        return gzip.decompress(self.path_for(digest).read_bytes())
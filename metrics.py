@@ -0,0 +1,266 @@
+# Stage timings and metrics for the pipeline scripts
+#
+#   with stage("tfidf", rows_in=len(texts)) as st:
+#       ...
+#       st.rows_out = X.shape[0]
+#   observe("fetch_latency_ms", elapsed_ms)     # histogram
+#   set_gauge("queue_depth", q.qsize())         # last / max / mean
+#
+# Per stage: calls, wall and CPU time (this process + reaped children such as
+# Pool workers), peak RSS during the stage, rows in / out. Nested stages are
+# recorded as "parent/child".
+#
+# Nothing is written unless asked for, through environment variables (or the
+# matching pipeline.py flags); "{script}" in a path is replaced by the script name:
+#   METRICS_JSON=metrics/{script}.json    JSON metrics file, written at exit
+#   METRICS_PROM=metrics/{script}.prom    Prometheus text exposition format
+#   METRICS_PROFILE=profiles/             cProfile of each top-level stage → <dir>/<script>.<stage>.prof
+
+import atexit
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+PROM_PREFIX = "pipeline"
+
+def _rss_peak_bytes():
+    """Peak RSS since the last _reset_rss_peak() (VmHWM), else since process start."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    ru = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return ru if sys.platform == "darwin" else ru * 1024
+
+def _reset_rss_peak() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as fh:
+            fh.write("5")       # Linux >= 4.0: reset VmHWM to the current RSS
+        return True
+    except OSError:
+        return False
+
+def _cpu_seconds() -> float:
+    ch = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + ch.ru_utime + ch.ru_stime
+
+class StageRecord:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.peak_rss = 0
+        self.rows_in = None
+        self.rows_out = None
+
+    def as_dict(self) -> dict:
+        return {"stage": self.name, "calls": self.calls, "wall_s": round(self.wall_s, 6),
+                "cpu_s": round(self.cpu_s, 6), "peak_rss_mb": round(self.peak_rss / 2 ** 20, 1),
+                "rows_in": self.rows_in, "rows_out": self.rows_out}
+
+class _Run:
+    """What one `with stage(...)` sees: rows_out can be set inside the block."""
+    def __init__(self, rows_in=None):
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.child_peak = 0
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # last = +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, v: float):
+        i = 0
+        while i < len(self.buckets) and v > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += v
+        self.min = v if self.min is None else min(self.min, v)
+        self.max = v if self.max is None else max(self.max, v)
+
+    def as_dict(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max,
+                "mean": self.sum / self.count if self.count else None,
+                "buckets": {str(b): c for b, c in zip(list(self.buckets) + ["+Inf"], self.counts)}}
+
+class Gauge:
+    def __init__(self):
+        self.last = self.max = None
+        self.n = 0
+        self.sum = 0.0
+
+    def set(self, v: float):
+        self.last = v
+        self.max = v if self.max is None else max(self.max, v)
+        self.n += 1
+        self.sum += v
+
+    def as_dict(self) -> dict:
+        return {"last": self.last, "max": self.max, "mean": self.sum / self.n if self.n else None,
+                "samples": self.n}
+
+class Metrics:
+    def __init__(self, script: str = None):
+        self.script = script or Path(sys.argv[0] or "python").stem.replace(" ", "_")
+        self.pid = os.getpid()
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.stages = {}            # path -> StageRecord, in first-seen order
+        self.histograms = {}
+        self.gauges = {}
+        self.counters = {}
+        self.json_path = os.environ.get("METRICS_JSON")
+        self.prom_path = os.environ.get("METRICS_PROM")
+        self.profile_dir = os.environ.get("METRICS_PROFILE")
+        self._stack = []            # (path, _Run) of the open stages
+        self._hwm_reset = None      # None = not tried yet
+
+    # ---- recording ----
+    @contextmanager
+    def stage(self, name: str, rows_in=None):
+        path = f"{self._stack[-1][0]}/{name}" if self._stack else name
+        run = _Run(rows_in)
+        if self._stack:
+            # the parent's peak so far, before the counter is reset for this stage
+            parent = self._stack[-1][1]
+            parent.child_peak = max(parent.child_peak, _rss_peak_bytes())
+        if self._hwm_reset is None or self._hwm_reset:
+            self._hwm_reset = _reset_rss_peak()
+        prof = None
+        if self.profile_dir and not self._stack:
+            prof = cProfile.Profile()
+        self._stack.append((path, run))
+        wall0, cpu0 = time.perf_counter(), _cpu_seconds()
+        if prof is not None:
+            prof.enable()
+        try:
+            yield run
+        finally:
+            if prof is not None:
+                prof.disable()
+            wall, cpu = time.perf_counter() - wall0, _cpu_seconds() - cpu0
+            self._stack.pop()
+            peak = max(_rss_peak_bytes(), run.child_peak)
+            if self._stack:
+                parent = self._stack[-1][1]
+                parent.child_peak = max(parent.child_peak, peak)
+            rec = self.stages.setdefault(path, StageRecord(path))
+            rec.calls += 1
+            rec.wall_s += wall
+            rec.cpu_s += cpu
+            rec.peak_rss = max(rec.peak_rss, peak)
+            if run.rows_in is not None:
+                rec.rows_in = (rec.rows_in or 0) + int(run.rows_in)
+            if run.rows_out is not None:
+                rec.rows_out = (rec.rows_out or 0) + int(run.rows_out)
+            if prof is not None:
+                out = Path(self.profile_dir) / f"{self.script}.{name}.prof"
+                out.parent.mkdir(parents=True, exist_ok=True)
+                prof.dump_stats(str(out))
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS_MS):
+        h = self.histograms.get(name)
+        if h is None:
+            h = self.histograms[name] = Histogram(buckets)
+        h.observe(value)
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges.setdefault(name, Gauge()).set(value)
+
+    def inc(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # ---- export ----
+    def empty(self) -> bool:
+        return not (self.stages or self.histograms or self.gauges or self.counters)
+
+    def as_dict(self) -> dict:
+        return {
+            "script": self.script,
+            "pid": self.pid,
+            "started_at": self.started_at,
+            "stages": [r.as_dict() for r in self.stages.values()],
+            "histograms": {k: h.as_dict() for k, h in self.histograms.items()},
+            "gauges": {k: g.as_dict() for k, g in self.gauges.items()},
+            "counters": dict(self.counters),
+        }
+
+    def to_prometheus(self) -> str:
+        p = PROM_PREFIX
+        job = f'script="{self.script}"'
+        lines = []
+        series = [("stage_wall_seconds", "wall_s"), ("stage_cpu_seconds", "cpu_s"),
+                  ("stage_peak_rss_bytes", "peak_rss"), ("stage_calls", "calls"),
+                  ("stage_rows_in", "rows_in"), ("stage_rows_out", "rows_out")]
+        for metric, attr in series:
+            recs = [r for r in self.stages.values() if getattr(r, attr) is not None]
+            if not recs:
+                continue
+            lines.append(f"# TYPE {p}_{metric} gauge")
+            for r in recs:
+                lines.append(f'{p}_{metric}{{{job},stage="{r.name}"}} {getattr(r, attr)}')
+        for name, h in self.histograms.items():
+            lines.append(f"# TYPE {p}_{name} histogram")
+            cum = 0
+            for b, c in zip(list(h.buckets) + ["+Inf"], h.counts):
+                cum += c
+                lines.append(f'{p}_{name}_bucket{{{job},le="{b}"}} {cum}')
+            lines.append(f"{p}_{name}_sum{{{job}}} {h.sum}")
+            lines.append(f"{p}_{name}_count{{{job}}} {h.count}")
+        for name, g in self.gauges.items():
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name}{{{job}}} {g.last}")
+            lines.append(f"# TYPE {p}_{name}_max gauge")
+            lines.append(f"{p}_{name}_max{{{job}}} {g.max}")
+        for name, v in self.counters.items():
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f"{p}_{name}_total{{{job}}} {v}")
+        return "\n".join(lines) + "\n"
+
+    def _path(self, template: str) -> Path:
+        return Path(template.replace("{script}", self.script))
+
+    def export(self):
+        """Write the JSON / Prometheus files that were asked for (nothing from worker processes)."""
+        if os.getpid() != self.pid or self.empty():
+            return
+        for template, render in ((self.json_path, lambda: json.dumps(self.as_dict(), indent=2)),
+                                 (self.prom_path, self.to_prometheus)):
+            if not template:
+                continue
+            out = self._path(template)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            out.write_text(render(), encoding="utf-8")
+            print(f"[METRICS] {out}")
+
+METRICS = Metrics()
+atexit.register(METRICS.export)
+
+stage = METRICS.stage
+observe = METRICS.observe
+set_gauge = METRICS.set_gauge
+inc = METRICS.inc
+
+def configure(json_path=None, prom_path=None, profile_dir=None):
+    """Set the outputs from code (pipeline.py flags); None keeps the environment value."""
+    if json_path:
+        METRICS.json_path = str(json_path)
+    if prom_path:
+        METRICS.prom_path = str(prom_path)
+    if profile_dir:
+        METRICS.profile_dir = str(profile_dir)
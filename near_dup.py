@@ -0,0 +1,165 @@
+# Near-duplicate page collapsing used by dedup_near_duplicates.py and pipeline.py --dedup
+#
+# Each row is turned into a set of shingles: the URL tokens (the regex split of
+# url_tokenizer.py, host included, scheme left out) plus the word 3-grams of its
+# excerpt. The sets are hashed into a 2^24 feature space (HashingVectorizer)
+# and summarized by a MinHash signature of NUM_PERM values. Each permutation is
+# a multiply-add-shift hash h(x) = ((a x + b) mod 2^64) >> 32 (a odd), computed
+# one permutation at a time over the distinct features of a row chunk and
+# reduced per row with np.minimum.reduceat.
+#
+# LSH: the signature is cut into `bands` bands of `rows` values; rows sharing a
+# band bucket are candidates. A candidate pair is kept when its signatures agree
+# on >= threshold of the values (estimated Jaccard), and the kept pairs are
+# joined into groups (connected components). Components can chain pages that
+# are not alike (A ~ B ~ C), so every row is then checked against the first row
+# of its group; the rows below the threshold are grouped again among themselves
+# until each row is within the threshold of its group's first row.
+# The band layout is the one whose S-curve midpoint (1/bands)^(1/rows) is the
+# highest one below the threshold, so the verification removes the false
+# positives instead of LSH missing pairs.
+#
+# collapse() keeps the first row of each group (table order, i.e. crawl order)
+# and a dup_count column with the number of rows it stands for (summed when the
+# input was already collapsed).
+
+import re
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from url_tokenizer import SPLIT_RE
+
+NUM_PERM = 128
+THRESHOLD = 0.8
+SHINGLE_WORDS = 3
+N_FEATURES = 2 ** 24
+CHUNK_ROWS = 10_000
+PAIR_BLOCK = 100_000    # candidate pairs verified at once
+COUNT_COLUMN = "dup_count"
+
+_WORD_RE = re.compile(r"\w+")
+
+def shingles(url: str, text: str = "") -> list:
+    """URL tokens + word n-grams of `text`, prefixed so the two never collide."""
+    out = ["u:" + t for t in SPLIT_RE.split(url.lower().partition("://")[2] or url.lower()) if t]
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        out.extend("w:" + w for w in words)
+    else:
+        out.extend("w:" + " ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1))
+    return out
+
+def _as_is(doc):
+    return doc
+
+def minhash_signatures(urls, texts, num_perm: int = NUM_PERM, seed: int = 42,
+                       chunk_rows: int = CHUNK_ROWS):
+    """(signatures (n, num_perm) uint32, mask of the rows that have at least one shingle)."""
+    hasher = HashingVectorizer(analyzer=_as_is, n_features=N_FEATURES, alternate_sign=False,
+                               norm=None, binary=True)
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2)
+    shift = np.uint64(32)
+    n = len(urls)
+    sig = np.zeros((n, num_perm), dtype=np.uint32)
+    valid = np.zeros(n, dtype=bool)
+    for start in range(0, n, chunk_rows):
+        stop = min(n, start + chunk_rows)
+        H = hasher.transform(shingles(u, t) for u, t in zip(urls[start:stop], texts[start:stop]))
+        H = H.tocsr()
+        H.sort_indices()
+        nonempty = np.diff(H.indptr) > 0
+        if not nonempty.any():
+            continue
+        rows = start + np.flatnonzero(nonempty)
+        valid[rows] = True
+        starts = H.indptr[:-1][nonempty]
+        # hash each distinct feature of the chunk once, then gather per shingle
+        feats, inv = np.unique(H.indices, return_inverse=True)
+        x = feats.astype(np.uint64)
+        block = np.empty((num_perm, len(rows)), dtype=np.uint32)
+        for p in range(num_perm):       # 1-D passes: small temporaries, uint64 products wrap
+            h = ((x * a[p] + b[p]) >> shift).astype(np.uint32)
+            block[p] = np.minimum.reduceat(h[inv], starts)
+        sig[rows] = block.T
+    return sig, valid
+
+def lsh_params(threshold: float, num_perm: int):
+    """(bands, rows): highest S-curve midpoint (1/bands)^(1/rows) <= threshold."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        mid = (1.0 / bands) ** (1.0 / rows)
+        if mid <= threshold and (best is None or mid > best[0]):
+            best = (mid, bands, rows)
+    if best is None:            # threshold below every layout: one value per band
+        return num_perm, 1
+    return best[1], best[2]
+
+def _candidate_pairs(sig, idx, bands: int, rows: int):
+    """(row, bucket leader) pairs: rows sharing a bucket in some band, leader = first row of the bucket."""
+    # bucket key = band values folded into one uint64 (a collision only adds a pair to verify)
+    mult = np.random.default_rng(0).integers(0, 1 << 63, rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    n = sig.shape[0]
+    codes = []
+    for band in range(bands):
+        key = np.zeros(len(idx), dtype=np.uint64)
+        for j in range(rows):
+            key += sig[idx, band * rows + j].astype(np.uint64) * mult[j]
+        order = np.argsort(key, kind="stable")
+        k = key[order]
+        first = np.r_[True, k[1:] != k[:-1]]
+        leader = order[np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))]
+        codes.append(idx[order[~first]].astype(np.int64) * n + idx[leader[~first]])
+    pairs = np.unique(np.concatenate(codes)) if codes else np.empty(0, dtype=np.int64)
+    return pairs // n, pairs % n
+
+def _similar(sig, a, b, threshold: float):
+    """Estimated Jaccard(a[i], b[i]) >= threshold, pair by pair."""
+    out = np.zeros(len(a), dtype=bool)
+    for i in range(0, len(a), PAIR_BLOCK):
+        out[i:i + PAIR_BLOCK] = (sig[a[i:i + PAIR_BLOCK]] == sig[b[i:i + PAIR_BLOCK]]).mean(axis=1) >= threshold
+    return out
+
+def near_duplicate_groups(sig, valid, threshold: float = THRESHOLD):
+    """Group per row, as the row index of the group's first row (rows without shingles
+    are groups of their own), and the number of candidate pairs examined."""
+    n, num_perm = sig.shape
+    bands, rows = lsh_params(threshold, num_perm)
+    group = np.arange(n)
+    todo = np.flatnonzero(valid)
+    n_pairs = 0
+    while len(todo):
+        src, dst = _candidate_pairs(sig, todo, bands, rows)
+        n_pairs += len(src)
+        keep = _similar(sig, src, dst, threshold)
+        graph = sp.coo_matrix((np.ones(int(keep.sum()), dtype=np.int8), (src[keep], dst[keep])), shape=(n, n))
+        _, comp = connected_components(graph, directed=False)
+        comp = comp[todo]
+        _, first = np.unique(comp, return_index=True)      # todo is sorted: first row of each component
+        lead = todo[first][np.searchsorted(comp[first], comp)]
+        ok = _similar(sig, todo, lead, threshold)
+        group[todo[ok]] = lead[ok]
+        todo = todo[~ok]
+    return group, n_pairs
+
+def collapse(df: pd.DataFrame, threshold: float = THRESHOLD, num_perm: int = NUM_PERM,
+             text_column: str = "excerpt", seed: int = 42):
+    """(one row per near-duplicate group with a dup_count column, group id per input row)."""
+    urls = df["url"].fillna("").astype(str).tolist()
+    texts = df[text_column].fillna("").astype(str).tolist() if text_column in df.columns else [""] * len(df)
+    sig, valid = minhash_signatures(urls, texts, num_perm, seed)
+    group, n_pairs = near_duplicate_groups(sig, valid, threshold)
+    weights = pd.to_numeric(df[COUNT_COLUMN], errors="coerce").fillna(1).to_numpy() \
+        if COUNT_COLUMN in df.columns else None
+    counts = np.bincount(group, weights=weights).astype(np.int64)
+    first = ~pd.Series(group).duplicated().to_numpy()
+    out = df[first].copy()
+    out[COUNT_COLUMN] = counts[group[first]]
+    out.attrs["candidate_pairs"] = n_pairs
+    return out, group
@@ -0,0 +1,138 @@
+# Forms, parameters and <meta> tags of a fetched page, in one streaming HTMLParser pass
+# Used by crawling.py to fill has_form / forms / params / meta in each JSONL record.
+#
+#   extract(html, url) -> {"has_form": bool,
+#                          "forms":  [{"action": abs URL, "method": "get"|"post", "inputs": [names]}],
+#                          "params": {query param: value} of the page URL,
+#                          "meta":   {<meta name|property>: content},
+#                          "targets": URLs of the GET forms with their inputs filled in,
+#                                     for the crawl frontier (e.g. page2.php?first=test&last=test)}
+#
+# A target is what a browser would submit: unchecked checkboxes / radios are left
+# out (they stay in "inputs"), empty text-like fields get FILL_VALUE, and hidden
+# fields, selects and checked boxes keep their own value.
+
+from html.parser import HTMLParser
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+FILL_VALUE = "test"     # value of an empty text field in a GET form target
+SKIP_TYPES = frozenset({"submit", "button", "image", "reset", "file", "password"})
+FILL_TYPES = frozenset({"text", "search", "email", "number", "textarea"})
+MAX_FORMS = 50          # per page (WordPress list tables repeat inline-edit forms)
+META_KEYS = frozenset({"generator", "description", "robots", "og:type", "og:title", "csrf-token"})
+
+class _PageParser(HTMLParser):
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.forms = []
+        self.meta = {}
+        self._form = None       # form being read
+        self._select = None     # [name, value, from a selected option] of the open <select>
+        self._option = None     # [value attribute, selected, text parts] of the open <option>
+
+    def _field(self, name, value, kind):
+        """value None = not submitted (unchecked checkbox / radio)."""
+        if self._form is None or not name or kind in SKIP_TYPES:
+            return
+        fields = self._form["_fields"]
+        if name not in fields:
+            self._form["inputs"].append(name)
+            fields[name] = [value, kind]
+            return
+        old = fields[name][0]
+        if value is not None and (old is None or (value and not old and kind not in ("checkbox", "radio"))):
+            fields[name] = [value, kind]
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        if tag == "form":
+            if len(self.forms) >= MAX_FORMS:
+                return
+            self._form = {
+                "action": urljoin(self.base_url, (a.get("action") or "").strip()),
+                "method": (a.get("method") or "get").strip().lower(),
+                "inputs": [],
+                "_fields": {},
+            }
+            self.forms.append(self._form)
+        elif tag == "input":
+            kind = (a.get("type") or "text").lower()
+            if kind in ("checkbox", "radio"):
+                # a checked box without a value attribute submits "on"
+                value = (a.get("value") or "on") if "checked" in a else None
+                self._field(a.get("name"), value, kind)
+            else:
+                self._field(a.get("name"), a.get("value") or "", kind)
+        elif tag == "textarea":
+            self._field(a.get("name"), "", "textarea")
+        elif tag == "select":
+            self._select = [a.get("name"), None, False]
+        elif tag == "option" and self._select is not None:
+            self._end_option()      # </option> is optional
+            self._option = [a.get("value"), "selected" in a, []]
+        elif tag == "meta":
+            key = (a.get("name") or a.get("property") or "").lower()
+            if key in META_KEYS and a.get("content") is not None:
+                self.meta[key] = a["content"]
+
+    def handle_data(self, data):
+        if self._option is not None:
+            self._option[2].append(data)
+
+    def _end_option(self):
+        """Like a browser: an option submits its value, else its text; the selected
+        option (the last one if several) wins over the first one."""
+        if self._option is None:
+            return
+        value, selected, text = self._option
+        self._option = None
+        if value is None:
+            value = " ".join("".join(text).split())
+        if selected:
+            self._select[1], self._select[2] = value, True
+        elif self._select[1] is None:
+            self._select[1] = value
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+        elif tag == "option" and self._select is not None:
+            self._end_option()
+        elif tag == "select" and self._select is not None:
+            self._end_option()
+            self._field(self._select[0], self._select[1] or "", "select")
+            self._select = None
+
+def _target(form: dict, fill: str) -> str:
+    """URL a GET form submits to, with empty text-like fields set to `fill`.
+
+    Like a browser, the form data replaces the query string of the action.
+    """
+    parts = urlsplit(form["action"])
+    query = []
+    for name in form["inputs"]:
+        value, kind = form["_fields"][name]
+        if value is None:
+            continue        # unchecked checkbox / radio: not submitted
+        query.append((name, fill if not value and kind in FILL_TYPES else value))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+def extract(html: str, url: str, fill: str = FILL_VALUE) -> dict:
+    """has_form / forms / params / meta / targets of one page (see the module comment)."""
+    params = dict(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+    if not html or "<" not in html:
+        return {"has_form": False, "forms": [], "params": params, "meta": {}, "targets": []}
+    parser = _PageParser(url)
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass        # broken markup: keep what was parsed so far
+    targets = [_target(f, fill) for f in parser.forms if f["method"] == "get" and f["inputs"]]
+    forms = [{k: v for k, v in f.items() if k != "_fields"} for f in parser.forms]
+    return {"has_form": bool(forms), "forms": forms, "params": params, "meta": parser.meta,
+            "targets": targets}
@@ -0,0 +1,259 @@
+# One-process pipeline: [crawl ->] convert [-> dedup] -> tokenize -> kmeans -> representatives -> detect/merge
+#
+# The stages hand DataFrames / arrays to each other in memory instead of going
+# through CSV / NPZ / JSON files, and the imports (pandas, scikit-learn, ...)
+# are paid once. The standalone scripts stay the way to run a single stage.
+#
+# Stage cache: every stage output is stored as <work_dir>/cache/<stage>-<key>.joblib,
+#   key = sha256(input keys, stage parameters, source of the stage's modules)
+# and the first key is the sha256 of the crawl JSONL. A rerun with the same
+# input and parameters loads the stages from the cache; only the stages after
+# the first changed one are recomputed, and cached stages that nothing needs
+# are not even loaded.
+#
+# Usage:
+#   python pipeline.py <crawl.jsonl[.gz|.zst]> <out_seeds.json> --url2vec-path ~/third_party/url2vec
+#                      [--k 12|auto] [--work-dir pipeline/tmp] [--no-cache] [--crawl] [--changed-only]
+#                      [--dedup] [--dedup-threshold 0.8]
+#                      [--top-k 1] [--diverse] [--top-anomalies 20] [--contamination 0.02]
+#                      [--method isolation_forest|centroid|lof] [--per-cluster]
+#                      [--metrics m.json] [--prometheus m.prom] [--profile profiles/]
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import joblib
+
+import metrics
+from metrics import stage
+
+HERE = Path(__file__).resolve().parent
+
+Stage = namedtuple("Stage", "name deps params sources fn")
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Run the whole seed pipeline in one process")
+    p.add_argument("input", nargs="?", help="Crawl JSONL (.jsonl, .jsonl.gz, .jsonl.zst); "
+                                            "default with --crawl: the crawler's output")
+    p.add_argument("output", help="Output JSON (final seeds)")
+    p.add_argument("--url2vec-path", required=True, help="Path to the url2vec package")
+    p.add_argument("--crawl", action="store_true", help="Run crawling.py first (its config constants)")
+    p.add_argument("--work-dir", default="pipeline/tmp", help="Stage cache and side outputs (kcurve.json)")
+    p.add_argument("--no-cache", action="store_true", help="Recompute every stage (the cache is still refreshed)")
+    p.add_argument("--metrics", default=None, help="Per-stage metrics JSON (see metrics.py)")
+    p.add_argument("--prometheus", default=None, help="Same metrics in Prometheus text format")
+    p.add_argument("--profile", default=None, help="Directory for a cProfile dump of each stage")
+    p.add_argument("--changed-only", action="store_true",
+                   help="Skip the pages a recrawl marked unchanged (only the delta)")
+    # dedup
+    p.add_argument("--dedup", action="store_true",
+                   help="Collapse near-duplicate pages before tokenizing (MinHash LSH, see near_dup.py)")
+    p.add_argument("--dedup-threshold", type=float, default=0.8, help="Estimated Jaccard of a near-duplicate")
+    # tokenize
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Tokenizer processes")
+    p.add_argument("--cache-size", type=int, default=200_000, help="LRU size of the host / path-segment token cache")
+    # kmeans
+    p.add_argument("--k", default="auto", help="Number of clusters, or 'auto'")
+    p.add_argument("--k-min", type=int, default=2)
+    p.add_argument("--k-max", type=int, default=50)
+    p.add_argument("--k-step", type=int, default=0)
+    p.add_argument("--k-sample", type=int, default=20_000)
+    p.add_argument("--k-criterion", choices=["elbow", "silhouette"], default="elbow")
+    p.add_argument("--sparse", action="store_true", help="Cluster the sparse TF-IDF (no SVD)")
+    # representatives
+    p.add_argument("--top-k", type=int, default=1, help="Representatives per cluster")
+    p.add_argument("--diverse", action="store_true", help="Farthest-point representatives")
+    # detect / merge
+    p.add_argument("--top-anomalies", type=int, default=20)
+    p.add_argument("--contamination", type=float, default=0.02)
+    p.add_argument("--method", default="isolation_forest", help="Anomaly detector")
+    p.add_argument("--per-cluster", action="store_true", help="One detector per cluster")
+    p.add_argument("--fit-sample", type=int, default=100_000)
+    p.add_argument("--jobs", type=int, default=-1, help="Parallel jobs (auto k, anomaly scoring)")
+    args = p.parse_args()
+    if args.k != "auto":
+        try:
+            args.k = int(args.k)
+        except ValueError:
+            p.error(f"--k must be an integer or 'auto', got {args.k!r}")
+    if not 0.0 < args.dedup_threshold <= 1.0:
+        p.error("--dedup-threshold must be in (0, 1]")
+    if args.input is None and not args.crawl:
+        p.error("an input JSONL is required without --crawl")
+    return args
+
+# ---- cache ----
+def file_sha256(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with Path(path).open("rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def stage_key(name: str, input_keys, params: dict, sources) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps([name, list(input_keys), params], sort_keys=True, default=str).encode("utf-8"))
+    for src in sources:
+        h.update((HERE / src).read_bytes())
+    return h.hexdigest()[:20]
+
+class StageCache:
+    def __init__(self, root: Path, enabled: bool = True):
+        self.root = Path(root)
+        self.enabled = enabled
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, name: str, key: str) -> Path:
+        return self.root / f"{name}-{key}.joblib"
+
+    def get(self, name: str, key: str):
+        """(hit, value)"""
+        p = self.path(name, key)
+        if not self.enabled or not p.exists():
+            return False, None
+        return True, joblib.load(p)
+
+    def put(self, name: str, key: str, value):
+        p = self.path(name, key)
+        tmp = p.with_suffix(".tmp")
+        joblib.dump(value, tmp)
+        os.replace(tmp, p)
+
+def _rows(value):
+    if isinstance(value, dict):
+        value = value.get("labels", ())
+    return len(value)
+
+def run_stages(stages, source_key: str, cache: StageCache):
+    """Output of the last stage; each stage is loaded from the cache or computed from its deps."""
+    by_name = {st.name: st for st in stages}
+    keys = {}
+    for st in stages:
+        keys[st.name] = stage_key(st.name, [keys[d] for d in st.deps] or [source_key], st.params, st.sources)
+    results = {}
+
+    def get(name):
+        if name not in results:
+            st = by_name[name]
+            hit, value = cache.get(name, keys[name])
+            if hit:
+                print(f"[CACHE] {name}: unchanged ({keys[name]})")
+                metrics.inc("stage_cache_hits")
+            else:
+                inputs = [get(d) for d in st.deps]
+                t0 = time.perf_counter()
+                print(f"[STEP] {name} ...")
+                with stage(name, rows_in=_rows(inputs[0]) if inputs else None) as run:
+                    value = st.fn(*inputs)
+                    run.rows_out = _rows(value)
+                cache.put(name, keys[name], value)
+                metrics.inc("stage_cache_misses")
+                print(f"[OK] {name} done in {time.perf_counter() - t0:.1f}s ({keys[name]})")
+            results[name] = value
+        return results[name]
+
+    return get(stages[-1].name)
+
+# ---- stages ----
+def build_stages(args, in_path: Path, work_dir: Path):
+    def convert():
+        from crawl_records import records_frame
+        df = records_frame(in_path, changed_only=args.changed_only)
+        dropped = df.attrs.pop("dropped", {})
+        print(f"[INFO] {len(df)} rows from {in_path} (dropped {sum(dropped.values())} lines)")
+        return df
+
+    def dedup(df):
+        from near_dup import COUNT_COLUMN, collapse
+        kept, _ = collapse(df, threshold=args.dedup_threshold)
+        print(f"[INFO] {len(df) - len(kept)} near-duplicates collapsed into "
+              f"{int((kept[COUNT_COLUMN] > 1).sum())} groups, {len(kept)} rows left")
+        return kept
+
+    def tokenize(df):
+        from url_tokenizer import TokenizerEngine
+        engine = TokenizerEngine(Path(args.url2vec_path).expanduser().resolve(),
+                                 workers=args.workers, cache_size=args.cache_size)
+        try:
+            df = df.copy()
+            df["tokens"] = engine.tokenize(df["url"].fillna("").astype(str)).to_numpy()
+        finally:
+            engine.close()
+        print(f"[INFO] Tokenized {len(df)} URLs (mode: {engine.mode})")
+        return df
+
+    def kmeans(df):
+        from run_kmeans_sklearn import fit_in_memory
+        X_red, labels, centers, model, _ = fit_in_memory(
+            df["tokens"].fillna("").astype(str).tolist(), args.k, args, work_dir / "kcurve.json",
+            sparse=args.sparse)
+        return {"X": X_red, "labels": labels, "centers": centers, "k": model.k}
+
+    def representatives(df, km):
+        from representatives import representative_records, select
+        picks = select(km["X"], km["labels"], km["centers"], top_k=max(1, args.top_k), diverse=args.diverse)
+        return representative_records(df, km["labels"], picks, ranked=args.top_k > 1 or args.diverse)
+
+    def detect(df, km, reps):
+        from detect_and_merge_git import merge_seeds
+        return merge_seeds(df.copy(deep=False), km["X"], km["labels"], km["centers"], reps,
+                           top_anomalies=args.top_anomalies, contamination=args.contamination,
+                           method=args.method, per_cluster=args.per_cluster,
+                           fit_sample=args.fit_sample, jobs=args.jobs)
+
+    k_params = {"k": args.k, "sparse": args.sparse}
+    if args.k == "auto":
+        k_params.update(k_min=args.k_min, k_max=args.k_max, k_step=args.k_step,
+                        k_sample=args.k_sample, k_criterion=args.k_criterion)
+    pages = "dedup" if args.dedup else "convert"
+    dedup_stages = [Stage("dedup", ["convert"], {"threshold": args.dedup_threshold},
+                          ["near_dup.py"], dedup)] if args.dedup else []
+    return [
+        Stage("convert", [], {"changed_only": args.changed_only}, ["crawl_records.py"], convert),
+        *dedup_stages,
+        Stage("tokenize", [pages], {"url2vec": str(Path(args.url2vec_path).expanduser().resolve())},
+              ["url_tokenizer.py"], tokenize),
+        Stage("kmeans", ["tokenize"], k_params, ["run_kmeans_sklearn.py", "cluster_model.py"], kmeans),
+        Stage("representatives", ["tokenize", "kmeans"], {"top_k": args.top_k, "diverse": args.diverse},
+              ["representatives.py"], representatives),
+        Stage("detect", ["tokenize", "kmeans", "representatives"],
+              {"top_anomalies": args.top_anomalies, "contamination": args.contamination,
+               "method": args.method, "per_cluster": args.per_cluster, "fit_sample": args.fit_sample},
+              ["detect_and_merge_git.py", "anomaly_engine.py"], detect),
+    ]
+
+def main():
+    args = parse_args()
+    metrics.configure(args.metrics, args.prometheus, args.profile)
+    t0 = time.perf_counter()
+    if args.crawl:
+        import crawling
+        from jsonl_writer import compressed_path
+        asyncio.run(crawling.main())
+        if args.input is None:
+            args.input = str(compressed_path(crawling.OUT_JSONL, crawling.OUT_COMPRESSION))
+    in_path = Path(args.input)
+    out_path = Path(args.output)
+    if not in_path.exists():
+        print(f"[ERR] File not found: {in_path}")
+        sys.exit(2)
+    work_dir = Path(args.work_dir)
+    cache = StageCache(work_dir / "cache", enabled=not args.no_cache)
+
+    print(f"[INIT] {in_path} → {out_path} (cache: {cache.root}{', disabled' if args.no_cache else ''})")
+    seeds = run_stages(build_stages(args, in_path, work_dir), file_sha256(in_path), cache)
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with out_path.open("w", encoding="utf-8") as fh:
+        json.dump(seeds, fh, ensure_ascii=False, indent=2)
+    print(f"[OK] {len(seeds)} final seeds written → {out_path}  ({time.perf_counter() - t0:.1f}s)")
+
+if __name__ == "__main__":
+    main()
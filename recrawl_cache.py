@@ -0,0 +1,181 @@
+# Conditional recrawl cache (SQLite), used by crawling.py when RECRAWL_CACHE = True
+#
+# One row per canonical URL written by a previous crawl: its JSONL line, its
+# links, and the validators of the response (ETag, Last-Modified, sha256 of the
+# raw HTTP body). On the next crawl a known URL is first revalidated with a
+# conditional GET through the HTTP client:
+#   304 Not Modified, or 200 with the same body hash   -> the cached line is
+#       written again with "unchanged": true and its cached links are followed
+#   anything else                                       -> normal fetch
+# so downstream stages can keep only the changed pages (--changed-only).
+#
+# Unlike crawl_state.py this file is kept across crawls (RESUME = False too).
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from fetchers import HybridFetcher
+from metrics import inc, observe
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url           TEXT PRIMARY KEY,
+    mode          TEXT NOT NULL,
+    status        INTEGER,
+    etag          TEXT,
+    last_modified TEXT,
+    body_sha256   TEXT,
+    line          TEXT NOT NULL,
+    links         TEXT NOT NULL,
+    fetched_at    REAL NOT NULL
+);
+"""
+
+Entry = namedtuple("Entry", "url status etag last_modified body_sha256 line links")
+
+def body_sha256(html) -> str:
+    if not html:
+        return None
+    if isinstance(html, str):
+        html = html.encode("utf-8", errors="replace")
+    return hashlib.sha256(html).hexdigest()
+
+def _header(headers, name: str):
+    if not headers:
+        return None
+    for k, v in dict(headers).items():
+        if k.lower() == name:
+            return v
+    return None
+
+class RecrawlCache:
+    """Validators and JSONL line of every page written, keyed by canonical URL.
+
+    `mode` is the crawler's OUTPUT_MODE: lines written in another mode are not reused.
+    """
+
+    def __init__(self, path: Path, mode: str = "full", commit_every: int = 50):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.lock = threading.RLock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.mode = mode
+        self.commit_every = commit_every
+        self._pending = 0
+        self._validators = {}       # url -> (status, etag, last_modified, body_sha256) of the last fetch
+
+    def get(self, url: str):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT url, status, etag, last_modified, body_sha256, line, links FROM responses "
+                "WHERE url=? AND mode=?", (url, self.mode)).fetchone()
+        if row is None:
+            return None
+        return Entry(*row[:6], json.loads(row[6]))
+
+    def validators(self, url: str, status, headers, sha256):
+        """Remember the response validators of `url` until its line is written (put) or not (discard)."""
+        self._validators[url] = (status, _header(headers, "etag"), _header(headers, "last-modified"), sha256)
+
+    def discard(self, url: str):
+        """Forget the validators of `url` when its line is not written (write error, skipped)."""
+        self._validators.pop(url, None)
+
+    def put(self, url: str, line: str, links):
+        status, etag, last_modified, sha = self._validators.pop(url, (None, None, None, None))
+        if status is not None and status >= 400:
+            return
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses(url, mode, status, etag, last_modified, body_sha256, "
+                "line, links, fetched_at) VALUES (?,?,?,?,?,?,?,?,?)",
+                (url, self.mode, status, etag, last_modified, sha, line, json.dumps(sorted(links)), time.time()),
+            )
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self.commit()
+
+    def count(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM responses WHERE mode=?", (self.mode,)).fetchone()[0]
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+            self._pending = 0
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+class CachedPage:
+    """A page revalidated as unchanged: its cached JSONL line and links."""
+    unchanged = True
+    fetched_with = "cache"
+
+    def __init__(self, entry: Entry):
+        self.url = entry.url
+        self.status_code = entry.status
+        self.html = None
+        self.links = {"internal": [{"href": h} for h in entry.links], "external": []}
+        obj = json.loads(entry.line)
+        obj["unchanged"] = True
+        self.line = json.dumps(obj, ensure_ascii=False)
+
+class ConditionalFetcher:
+    """Wraps a crawler / HybridFetcher: known URLs are revalidated over HTTP before a real fetch.
+    `key` maps the fetched URL to its cache key (the crawl passes normalize_url)."""
+    def __init__(self, fetcher, http, cache: RecrawlCache, key=None):
+        self.fetcher = fetcher
+        self.http = http
+        self.cache = cache
+        self.key = key or (lambda url: url)
+
+    async def _revalidate(self, url: str, entry: Entry):
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        t0 = time.perf_counter()
+        try:
+            resp = await self.http.fetch(url, headers=headers)
+        except Exception:
+            inc("crawl_revalidate_errors")
+            return None
+        observe("crawl_revalidate_latency_ms", (time.perf_counter() - t0) * 1000.0)
+        return resp
+
+    async def arun(self, url: str, config=None):
+        key = self.key(url)
+        entry = self.cache.get(key)
+        probe = None
+        if entry is not None and self.http is not None and self.http.has_cookies:
+            probe = await self._revalidate(url, entry)
+            if probe is not None:
+                if probe.status_code == 304 or (probe.status_code == entry.status and entry.body_sha256
+                                                and body_sha256(probe.html) == entry.body_sha256):
+                    inc("crawl_pages_unchanged")
+                    return CachedPage(entry)
+                inc("crawl_pages_changed")
+
+        if isinstance(self.fetcher, HybridFetcher):
+            result = await self.fetcher.arun(url, config, prefetched=probe)
+        else:
+            result = await self.fetcher.arun(url, config=config)
+        # the raw body hash is only known for pages fetched over HTTP; a browser
+        # page gets it from its first revalidation probe
+        raw = probe if probe is not None else result
+        self.cache.validators(key, getattr(result, "status_code", None),
+                              getattr(raw, "response_headers", None),
+                              body_sha256(raw.html) if getattr(raw, "fetched_with", None) == "http" else None)
+        return result
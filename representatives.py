@@ -0,0 +1,114 @@
+# Representative selection used by select_representatives_git.py
+#
+# Distances are computed within each cluster only (each row against its own
+# center), reading X in row chunks, so X can be a memmap and the cost is
+# O(cluster size) per cluster instead of O(k x n) for a centers-vs-all argmin.
+#
+#   nearest   the top_k rows closest to the cluster center
+#   diverse   farthest-point sampling: start from the row closest to the
+#             center, then repeatedly add the row farthest from all picks
+#
+# X may also be a scipy.sparse CSR matrix (run_kmeans_sklearn.py --sparse): the
+# distances are then ||x||^2 - 2 x.p + ||p||^2 on the sparse rows, never densified.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+CHUNK_ROWS = 65_536
+
+def cluster_rows(labels) -> dict:
+    """{cluster: sorted row indices}, one stable sort over the labels."""
+    labels = np.asarray(labels)
+    order = np.argsort(labels, kind="stable")
+    clusters, starts = np.unique(labels[order], return_index=True)
+    return dict(zip(clusters.tolist(), np.split(order, starts[1:]))) if len(order) else {}
+
+def _sq_dist(X, rows, point, chunk_rows: int):
+    """Squared distance of X[rows] to `point`, computed chunk by chunk."""
+    out = np.empty(len(rows), dtype=np.float64)
+    for a in range(0, len(rows), chunk_rows):
+        if sp.issparse(X):
+            block = X[rows[a:a + chunk_rows]]
+            sq = np.asarray(block.multiply(block).sum(axis=1), dtype=np.float64).ravel()
+            d = sq - 2.0 * np.asarray(block @ point, dtype=np.float64).ravel() + point @ point
+            out[a:a + chunk_rows] = np.maximum(d, 0.0)     # rounding can go slightly below 0
+            continue
+        block = np.asarray(X[rows[a:a + chunk_rows]], dtype=np.float64)
+        out[a:a + chunk_rows] = ((block - point) ** 2).sum(axis=1)
+    return out
+
+def _row(X, i) -> np.ndarray:
+    """Row i of X as a dense float64 vector."""
+    r = X[i]
+    return (r.toarray().ravel() if sp.issparse(r) else np.asarray(r)).astype(np.float64)
+
+def nearest(X, rows, center, top_k: int = 1, chunk_rows: int = CHUNK_ROWS):
+    """(rows, distances) of the top_k rows closest to `center`, ties broken by row index."""
+    center = np.asarray(center, dtype=np.float64)
+    best_rows = np.empty(0, dtype=np.int64)
+    best_d = np.empty(0, dtype=np.float64)
+    for a in range(0, len(rows), chunk_rows):
+        r = rows[a:a + chunk_rows]
+        d = _sq_dist(X, r, center, chunk_rows)
+        cand_rows = np.concatenate([best_rows, r])
+        cand_d = np.concatenate([best_d, d])
+        keep = np.lexsort((cand_rows, cand_d))[:top_k]
+        best_rows, best_d = cand_rows[keep], cand_d[keep]
+    return best_rows, np.sqrt(best_d)
+
+def farthest_point(X, rows, center, top_k: int = 1, chunk_rows: int = CHUNK_ROWS):
+    """(rows, distance to the center) of top_k spread-out rows (farthest-point sampling)."""
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    center = np.asarray(center, dtype=np.float64)
+    d_center = _sq_dist(X, rows, center, chunk_rows)
+    first = int(np.lexsort((rows, d_center))[0])
+    picks = [first]
+    min_d = _sq_dist(X, rows, _row(X, rows[first]), chunk_rows)
+    while len(picks) < min(top_k, len(rows)):
+        nxt = int(np.argmax(min_d))
+        if min_d[nxt] <= 0:          # only duplicates of the picks are left
+            break
+        picks.append(nxt)
+        min_d = np.minimum(min_d, _sq_dist(X, rows, _row(X, rows[nxt]), chunk_rows))
+    picks = np.asarray(picks)
+    return rows[picks], np.sqrt(d_center[picks])
+
+def select(X, labels, centers, top_k: int = 1, diverse: bool = False, chunk_rows: int = CHUNK_ROWS):
+    """[(cluster, rank, row, distance to center)] for every cluster that has rows."""
+    pick = farthest_point if diverse else nearest
+    out = []
+    for c, rows in cluster_rows(labels).items():
+        if not 0 <= c < len(centers):
+            continue
+        sel, dist = pick(X, rows, centers[c], top_k, chunk_rows)
+        out.extend((c, rank, int(r), float(d)) for rank, (r, d) in enumerate(zip(sel, dist)))
+    return out
+
+def token_column(df):
+    return 'url_tokens' if 'url_tokens' in df.columns else ('tokens' if 'tokens' in df.columns else None)
+
+def representative_records(df, labels, picks, ranked: bool = False) -> list:
+    """JSON entries (cluster, id, url, tokens, _cluster_size[, _rank, _distance][, _dup_count])
+    for `picks`. After dedup_near_duplicates.py, sizes count the collapsed pages too."""
+    tok_col = token_column(df)
+    dups = pd.to_numeric(df['dup_count'], errors='coerce').fillna(1).to_numpy() if 'dup_count' in df.columns else None
+    sizes = pd.Series(np.ones(len(labels)) if dups is None else dups).groupby(np.asarray(labels)).sum().to_dict()
+    selected = []
+    for cluster_id, rank, idx, dist in picks:
+        row = df.iloc[idx]
+        rep = {
+            "cluster": int(cluster_id),
+            "id": int(row.get('id', -1)) if 'id' in row else None,
+            "url": row.get('url', ''),
+            "tokens": row.get(tok_col, ''),
+            "_cluster_size": int(sizes.get(cluster_id, 0)),
+        }
+        if ranked:
+            rep["_rank"] = rank
+            rep["_distance"] = round(dist, 6)
+        if dups is not None:
+            rep["_dup_count"] = int(dups[idx])
+        selected.append(rep)
+    return selected
@@ -1,55 +1,412 @@
 # Vectorisation (TF-IDF)/ Reduction (SVD) /Clustering (K-means)
 # Use scikit-learnpen-source
+#
+# --streaming : out-of-core variant for inputs that do not fit in memory.
+#   HashingVectorizer + IDF over chunks, randomized SVD accumulated over chunks,
+#   MiniBatchKMeans.partial_fit over a memory-mapped X. Peak memory depends on
+#   --chunksize / --n-features, not on the number of rows.
+#
+# --save-model DIR : keep the fitted vectorizer / reducer / KMeans as a versioned
+#   artifact (see cluster_model.py). New URLs are then labelled without refitting:
+#   python run_kmeans_sklearn.py assign <input> <model_dir> <out_features.npz|dataset_dir>
+#                                       [--drift-report drift.json]
+#
+# --sparse : keep the L2-normalized TF-IDF as a CSR matrix (no SVD) and run
+#   MiniBatchKMeans on it directly (on unit rows: spherical k-means up to the
+#   center norms). X is written as a scipy.sparse CSR .npz (dataset: X.npz,
+#   legacy: data / indices / indptr / shape keys next to labels / centers, so
+#   scipy.sparse.load_npz(features.npz) reads it); the next stages accept it as is.
+#
+# k = auto : evaluate --k-min..--k-max in parallel on a subsample of the reduced
+#   features (inertia elbow + sampled silhouette), fit once with the chosen k and
+#   write the evaluation curve next to the output (<out>.kcurve.json / <dir>/kcurve.json).
 
+import argparse
+import json
+import shutil
 import sys
+import tempfile
 from pathlib import Path
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
 from sklearn.decomposition import TruncatedSVD
 from sklearn.cluster import MiniBatchKMeans  # scalable
+from sklearn.metrics import silhouette_score
+from joblib import Parallel, delayed
 # from sklearn.cluster import KMeans
 
-def main():
-    if len(sys.argv) < 4:
-        print("Usage: python run_kmeans_sklearn.py <input_tokens.csv> <k> <out_features.npz>")
-        sys.exit(1)
+from dataset import Dataset, is_dataset, load_frame, iter_frames
+from metrics import stage
+from cluster_model import (ClusterModel, HashingTfidf, Projection, cluster_stats,
+                           drift_report, save_model, load_model)
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        usage="python run_kmeans_sklearn.py <input_tokens.csv|dataset_dir> <k|auto> <out_features.npz|dataset_dir> [--streaming]")
+    p.add_argument("input", help="Tokenised CSV / parquet or dataset dir (needs a 'tokens' column)")
+    p.add_argument("k", type=parse_k, help="Number of clusters, or 'auto'")
+    p.add_argument("output", help="features.npz or dataset dir")
+    p.add_argument("--streaming", action="store_true", help="Out-of-core mode (bounded memory)")
+    p.add_argument("--sparse", action="store_true", help="Cluster the sparse TF-IDF, no SVD (in-memory mode)")
+    p.add_argument("--chunksize", type=int, default=50_000, help="Rows per chunk (streaming)")
+    p.add_argument("--n-features", type=int, default=2 ** 16, help="Hashing space (streaming)")
+    p.add_argument("--epochs", type=int, default=3, help="partial_fit passes over X (streaming)")
+    p.add_argument("--save-model", default=None, help="Model dir: save the fitted pipeline as a new version")
+    p.add_argument("--k-min", type=int, default=2, help="auto k: smallest candidate")
+    p.add_argument("--k-max", type=int, default=50, help="auto k: largest candidate")
+    p.add_argument("--k-step", type=int, default=0, help="auto k: candidate step (0 = at most 25 candidates)")
+    p.add_argument("--k-sample", type=int, default=20_000, help="auto k: rows used to evaluate each k")
+    p.add_argument("--k-criterion", choices=["elbow", "silhouette"], default="elbow",
+                   help="auto k: pick the inertia elbow or the best sampled silhouette")
+    p.add_argument("--jobs", type=int, default=-1, help="auto k: parallel candidates (-1 = all cores)")
+    args = p.parse_args()
+    if args.sparse and args.streaming:
+        p.error("--sparse is an in-memory mode, it cannot be combined with --streaming")
+    return args
+
+def parse_k(s: str):
+    if s == "auto":
+        return s
+    try:
+        return int(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"k must be an integer or 'auto', got {s!r}")
+
+def parse_assign_args(argv):
+    p = argparse.ArgumentParser(
+        usage="python run_kmeans_sklearn.py assign <input_tokens.csv|dataset_dir> <model_dir> <out_features.npz|dataset_dir>")
+    p.add_argument("input", help="Tokenised CSV / parquet or dataset dir (needs a 'tokens' column)")
+    p.add_argument("model", help="Model dir (LATEST version) or a version dir (model_dir/v0003)")
+    p.add_argument("output", help="features.npz or dataset dir")
+    p.add_argument("--chunksize", type=int, default=50_000, help="Rows per chunk")
+    p.add_argument("--drift-report", default=None, help="Drift JSON (default: next to the output)")
+    return p.parse_args(argv)
+
+# --------- AUTO K ---------
+def eval_k(Xs, k: int, sil_size: int) -> dict:
+    km = MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=1024).fit(Xs)
+    sil = None
+    n = Xs.shape[0]
+    if 1 < k < n:
+        sil = float(silhouette_score(Xs, km.labels_, sample_size=min(sil_size, n), random_state=42))
+    return {"k": k, "inertia": float(km.inertia_), "silhouette": sil}
+
+def elbow(ks, inertias) -> int:
+    """Kneedle: candidate farthest below the chord of the normalized inertia curve."""
+    ks = np.asarray(ks, dtype=float)
+    y = np.asarray(inertias, dtype=float)
+    if len(ks) < 3 or y.max() == y.min():
+        return int(ks[0])
+    xn = (ks - ks[0]) / (ks[-1] - ks[0])
+    yn = (y - y.min()) / (y.max() - y.min())
+    chord = 1.0 - xn                    # straight line from (0, 1) to (1, 0)
+    return int(ks[np.argmax(chord - yn)])
+
+def kcurve_path(out_path: Path) -> Path:
+    return out_path / "kcurve.json" if is_dataset(out_path) else out_path.with_suffix(".kcurve.json")
+
+def select_k(X_red, curve_path: Path, args) -> int:
+    """Evaluate candidate k values on a subsample of the (already reduced) features."""
+    n = X_red.shape[0]
+    k_max = max(args.k_min, min(args.k_max, n - 1))
+    step = args.k_step or max(1, -(-(k_max - args.k_min + 1) // 25))
+    ks = list(range(args.k_min, k_max + 1, step))
+    rng = np.random.default_rng(42)
+    idx = np.sort(rng.choice(n, size=min(n, args.k_sample), replace=False))
+    Xs = X_red[idx] if sp.issparse(X_red) else np.asarray(X_red[idx])   # one read of the (memory-mapped) rows
+    print(f"[STEP] auto k: {len(ks)} candidates in [{ks[0]}, {ks[-1]}] on {len(idx)} rows ...")
+    with stage("auto_k", rows_in=len(idx)):
+        curve = Parallel(n_jobs=args.jobs)(delayed(eval_k)(Xs, k, 5000) for k in ks)
+
+    if args.k_criterion == "silhouette" and any(c["silhouette"] is not None for c in curve):
+        best = max((c for c in curve if c["silhouette"] is not None), key=lambda c: c["silhouette"])["k"]
+    else:
+        best = elbow([c["k"] for c in curve], [c["inertia"] for c in curve])
+
+    curve_path.parent.mkdir(parents=True, exist_ok=True)
+    curve_path.write_text(json.dumps({"criterion": args.k_criterion, "chosen_k": best,
+                                      "sample": int(len(idx)), "candidates": curve}, indent=2),
+                          encoding="utf-8")
+    print(f"[OK] auto k = {best} ({args.k_criterion}); curve → {curve_path}")
+    return best
+
+# --------- STREAMING ---------
+def iter_texts(path: Path, chunksize: int):
+    for chunk in iter_frames(path, ["tokens"], chunksize):
+        if "tokens" not in chunk.columns:
+            print("[ERR] Missing 'url_tokens' column in input CSV")
+            sys.exit(3)
+        yield chunk.get("id"), chunk["tokens"].fillna("").astype(str).tolist()
+
+def iter_rows(n: int, step: int):
+    for start in range(0, n, step):
+        yield start, min(n, start + step)
+
+def streaming_fit(csv_path: Path, k, out_path: Path, chunksize: int, n_features: int, epochs: int,
+                  model_dir=None, k_args=None):
+    hasher = HashingVectorizer(n_features=n_features, ngram_range=(1, 2),
+                               alternate_sign=False, norm=None)
+
+    # pass 1: document frequencies -> IDF (same smoothing as TfidfVectorizer)
+    print(f"[STEP] Hashing TF-IDF (2^{int(np.log2(n_features))} features), pass 1/3: IDF ...")
+    to_dataset = is_dataset(out_path)
+    # every n-row array lives in tmp_dir (memmaps), removed whatever happens
+    tmp_dir = Path(tempfile.mkdtemp(dir=out_path.parent if out_path.parent.exists() else None))
+    try:
+        dfreq = np.zeros(n_features, dtype=np.int64)
+        n = n_empty = 0
+        # ids only for the legacy .npz (a dataset checks rows with its manifest), appended to a file
+        ids_path = tmp_dir / "ids.bin"
+        with stage("idf_pass") as st, open(ids_path, "wb") as ids_out:
+            for chunk_ids, texts in iter_texts(csv_path, chunksize):
+                Xc = hasher.transform(texts)
+                dfreq += np.bincount(Xc.indices, minlength=n_features)
+                n_empty += int((Xc.getnnz(axis=1) == 0).sum())
+                if not to_dataset:
+                    chunk_ids = chunk_ids.to_numpy() if chunk_ids is not None else np.arange(n, n + len(texts))
+                    np.asarray(chunk_ids, dtype=np.int64).tofile(ids_out)
+                n += len(texts)
+            st.rows_in = n
+        if n == 0:
+            print("[ERR] Empty input")
+            sys.exit(3)
+        idf = (np.log((1.0 + n) / (1.0 + dfreq)) + 1.0).astype(np.float32)
+        used = int((dfreq > 0).sum())
+        vectorizer = HashingTfidf(hasher, idf)
+        tfidf = vectorizer.transform
+
+        # pass 2: randomized range finder for X^T, B = X^T X Omega (one power iteration)
+        n_comp = min(100, max(2, used - 1))
+        l = min(n_features, n_comp + 10)
+        rng = np.random.default_rng(42)
+        omega = rng.standard_normal((n_features, l), dtype=np.float32)
+        print(f"[STEP] Randomized SVD to {n_comp} dims, pass 2/3 ...")
+        B = np.zeros((n_features, l), dtype=np.float32)
+        with stage("svd_pass", rows_in=n):
+            for _, texts in iter_texts(csv_path, chunksize):
+                Xc = tfidf(texts)
+                B += Xc.T @ (Xc @ omega)
+            del omega
+            Q, _ = np.linalg.qr(B)
+            del B
+
+        # pass 3: XQ (n, l) to a temporary memmap + G = (XQ)^T (XQ)
+        print("[STEP] Projection, pass 3/3 ...")
+        XQ = np.lib.format.open_memmap(tmp_dir / "XQ.npy", mode="w+", dtype=np.float32, shape=(n, l))
+        G = np.zeros((l, l), dtype=np.float64)
+        start = 0
+        with stage("projection_pass", rows_in=n) as st:
+            for _, texts in iter_texts(csv_path, chunksize):
+                Yc = tfidf(texts) @ Q
+                XQ[start:start + len(texts)] = Yc
+                G += Yc.T.astype(np.float64) @ Yc
+                start += len(texts)
+            evals, evecs = np.linalg.eigh(G)
+            W = evecs[:, np.argsort(evals)[::-1][:n_comp]].astype(np.float32)
+            st.rows_out = start
+
+        # output arrays (memmaps): X_red = XQ W, labels
+        if to_dataset:
+            ds = Dataset(out_path)
+            X_red = ds.create_array("X", (n, n_comp), np.float32)
+            labels = ds.create_array("labels", (n,), np.int32)
+        else:
+            ds = None
+            X_red = np.lib.format.open_memmap(tmp_dir / "X.npy", mode="w+", dtype=np.float32, shape=(n, n_comp))
+            labels = np.lib.format.open_memmap(tmp_dir / "labels.npy", mode="w+", dtype=np.int32, shape=(n,))
+        for a, b in iter_rows(n, chunksize):
+            X_red[a:b] = XQ[a:b] @ W
+        del XQ
+        if k == "auto":
+            k = select_k(X_red, kcurve_path(out_path), k_args)
 
-    csv_path = Path(sys.argv[1])
-    k = int(sys.argv[2])
-    out_path = Path(sys.argv[3])
+        # Clustering: partial_fit over memory-mapped X
+        print(f"[STEP] MiniBatchKMeans.partial_fit with k={k} ({epochs} epochs) ...")
+        batch = max(1024, 3 * k)
+        kmeans = MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=batch)
+        order = np.random.default_rng(42)
+        with stage("partial_fit", rows_in=n * max(1, epochs)):
+            for _ in range(max(1, epochs)):
+                for a, b in iter_rows(n, chunksize):
+                    Xc = np.asarray(X_red[a:b])
+                    perm = order.permutation(len(Xc))
+                    for s, e in iter_rows(len(Xc), batch):
+                        if e - s >= k or hasattr(kmeans, "cluster_centers_"):   # init needs >= k rows
+                            kmeans.partial_fit(Xc[perm[s:e]])
+        model = ClusterModel(vectorizer, Projection(Q @ W), kmeans)
+        dist = np.lib.format.open_memmap(tmp_dir / "dist.npy", mode="w+", dtype=np.float32, shape=(n,)) \
+            if model_dir else None
+        with stage("predict", rows_in=n) as st:
+            for a, b in iter_rows(n, chunksize):
+                lab, d = model.predict(np.asarray(X_red[a:b]))
+                labels[a:b] = lab
+                if dist is not None:
+                    dist[a:b] = d
+            st.rows_out = n
+        centers = kmeans.cluster_centers_
+        if model_dir:
+            vdir = save_model(model_dir, model, cluster_stats(labels, dist, k, n_empty),
+                              {"mode": "streaming", "n_features": n_features, "n_components": n_comp,
+                               "epochs": epochs, "n_rows": n})
+            print(f"[OK] Model saved: {vdir}")
+
+        if ds is not None:
+            X_red.flush(); labels.flush()
+            ds.write_array("centers", centers, row_aligned=False)
+        else:
+            # np.savez streams memmaps into the archive chunk by chunk
+            ids = np.memmap(ids_path, dtype=np.int64, mode="r", shape=(n,))
+            np.savez(out_path, X=X_red, labels=labels, centers=centers, ids=ids)
+            del ids
+        shape = X_red.shape
+        del X_red, labels, dist
+        print(f"[OK] Saved: {out_path}  (X:{shape}, k:{k}, streaming)")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# --------- IN MEMORY ---------
+def main():
+    args = parse_args()
+    csv_path = Path(args.input)
+    k = args.k
+    out_path = Path(args.output)
 
     if not csv_path.exists():
         print(f"[ERR] File not found: {csv_path}")
         sys.exit(2)
 
-    df = pd.read_csv(csv_path)
-    if "tokens" not in df.columns:
-        print("[ERR] Missing 'url_tokens' column in input CSV")
-        sys.exit(3)
+    with stage("kmeans") as st:
+        if args.streaming:
+            streaming_fit(csv_path, k, out_path, args.chunksize, args.n_features, args.epochs,
+                          model_dir=args.save_model, k_args=args)
+            return
+
+        df = load_frame(csv_path, columns=["tokens"])
+        if "tokens" not in df.columns:
+            print("[ERR] Missing 'url_tokens' column in input CSV")
+            sys.exit(3)
+
+        texts = df["tokens"].fillna("").astype(str).tolist()
+        X_red, labels, centers, model, n_empty = fit_in_memory(texts, k, args, kcurve_path(out_path),
+                                                               sparse=args.sparse)
+        k = model.k
+        st.rows_in, st.rows_out = len(texts), len(labels)
+
+        # 4) back up (ids let the next stages check that their rows match X)
+        save_features(out_path, X_red, labels, centers, df)
+        print(f"[OK] Saved: {out_path}  (X:{X_red.shape}{', sparse nnz:%d' % X_red.nnz if args.sparse else ''}, k:{k})")
 
-    # TF-IDF on URL's tokens 
-    texts = df["tokens"].fillna("").astype(str).tolist()
+        if args.save_model:
+            _, dist = model.predict(X_red)
+            vdir = save_model(args.save_model, model, cluster_stats(labels, dist, k, n_empty),
+                              {"mode": "tfidf_sparse" if args.sparse else "tfidf", "max_features": 10000,
+                               "n_components": int(X_red.shape[1]), "n_rows": len(df)})
+            print(f"[OK] Model saved: {vdir}")
+
+def fit_in_memory(texts, k, k_args=None, curve_path: Path = None, sparse: bool = False):
+    """TF-IDF -> TruncatedSVD -> MiniBatchKMeans on a list of token strings
+    (sparse=True: no SVD, X_red is the CSR TF-IDF matrix).
+    Returns (X_red, labels, centers, ClusterModel, number of empty TF-IDF rows)."""
+    # TF-IDF on URL's tokens
     print("[STEP] TF-IDF vectorization ...")
-    vec = TfidfVectorizer(max_features=10000, ngram_range=(1,2))
-    X = vec.fit_transform(texts)  # matrice sparse
+    vec = TfidfVectorizer(max_features=10000, ngram_range=(1,2), dtype=np.float32 if sparse else np.float64)
+    with stage("tfidf", rows_in=len(texts)) as st:
+        X = vec.fit_transform(texts)  # matrice sparse
+        st.rows_out = X.shape[0]
 
-    # Reduction 
-    n_comp = min(100, max(2, X.shape[1] - 1))
-    print(f"[STEP] TruncatedSVD to {n_comp} dims ...")
-    svd = TruncatedSVD(n_components=n_comp, random_state=42)
-    X_red = svd.fit_transform(X)  # dense (n_samples, n_comp)
+    # Reduction (sparse: none, rows are already L2-normalized)
+    if sparse:
+        svd = None
+        X_red = X.tocsr()
+    else:
+        n_comp = min(100, max(2, X.shape[1] - 1))
+        print(f"[STEP] TruncatedSVD to {n_comp} dims ...")
+        svd = TruncatedSVD(n_components=n_comp, random_state=42)
+        with stage("svd", rows_in=X.shape[0]):
+            X_red = svd.fit_transform(X)  # dense (n_samples, n_comp)
+    if k == "auto":
+        k = select_k(X_red, curve_path, k_args)
 
     # Clustering (MiniBatchKMean)
     print(f"[STEP] MiniBatchKMeans with k={k} ...")
     kmeans = MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=1024)
-    labels = kmeans.fit_predict(X_red)
+    with stage("minibatch_kmeans", rows_in=X_red.shape[0]):
+        labels = kmeans.fit_predict(X_red)
     centers = kmeans.cluster_centers_
+    n_empty = int((X.getnnz(axis=1) == 0).sum())
+    return X_red, labels, centers, ClusterModel(vec, svd, kmeans), n_empty
+
+def save_features(out_path: Path, X_red, labels, centers, df):
+    if is_dataset(out_path):
+        ds = Dataset(out_path)
+        ds.write_array("X", X_red)
+        ds.write_array("labels", labels)
+        ds.write_array("centers", centers, row_aligned=False)
+    else:
+        ids = df["id"].to_numpy() if "id" in df.columns else np.arange(len(df))
+        if sp.issparse(X_red):
+            # scipy.sparse.save_npz layout, so load_npz() reads X back from the same file
+            X_red = X_red.tocsr()
+            np.savez(out_path, format=np.array(b"csr"), shape=np.array(X_red.shape), data=X_red.data,
+                     indices=X_red.indices, indptr=X_red.indptr, labels=labels, centers=centers, ids=ids)
+        else:
+            np.savez(out_path, X=X_red, labels=labels, centers=centers, ids=ids)
+
+# --------- ASSIGN (no refit) ---------
+def assign_main(argv):
+    args = parse_assign_args(argv)
+    csv_path = Path(args.input)
+    out_path = Path(args.output)
+    if not csv_path.exists():
+        print(f"[ERR] File not found: {csv_path}")
+        sys.exit(2)
+    model, meta = load_model(Path(args.model))
+    k = model.k
+    print(f"[STEP] Assigning with model v{meta['version']:04d} (k={k}, fitted {meta['created_at']}) ...")
+
+    X_parts, label_parts, dist_parts, id_parts = [], [], [], []
+    n = n_empty = 0
+    with stage("assign") as st:
+        for chunk_ids, texts in iter_texts(csv_path, args.chunksize):
+            Xc, e = model.transform(texts)
+            lab, d = model.predict(Xc)
+            X_parts.append(Xc.astype(np.float32))   # sparse for a --sparse model
+            label_parts.append(lab)
+            dist_parts.append(d)
+            id_parts.append(chunk_ids.to_numpy() if chunk_ids is not None else np.arange(n, n + len(lab)))
+            n += len(lab)
+            n_empty += e
+        st.rows_in = st.rows_out = n
+    if not label_parts:
+        print("[ERR] Empty input")
+        sys.exit(3)
+    X_red = sp.vstack(X_parts, format="csr") if sp.issparse(X_parts[0]) else np.concatenate(X_parts)
+    labels = np.concatenate(label_parts)
+    dist = np.concatenate(dist_parts)
+    df = pd.DataFrame({"id": np.concatenate(id_parts)})
+    save_features(out_path, X_red, labels, model.kmeans.cluster_centers_, df)
+    print(f"[OK] Saved: {out_path}  (X:{X_red.shape}, k:{k}, model v{meta['version']:04d})")
 
-    # 4) back up
-    np.savez(out_path, X=X_red, labels=labels, centers=centers)
-    print(f"[OK] Saved: {out_path}  (X:{X_red.shape}, k:{k})")
+    # Drift against the statistics recorded at fit time
+    report = drift_report(meta["baseline"], labels, dist, k, n_empty)
+    report["model_version"] = meta["version"]
+    drift_path = Path(args.drift_report) if args.drift_report else \
+        (out_path / "drift.json" if is_dataset(out_path) else out_path.with_suffix(".drift.json"))
+    drift_path.parent.mkdir(parents=True, exist_ok=True)
+    drift_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"[DRIFT] PSI={report['psi']:.3f}  far={report['far_share']:.1%}  "
+          f"empty={report['empty_share']:.1%}  distance x{report['mean_distance_ratio']:.2f}  → {drift_path}")
+    if report["refit_recommended"]:
+        print("[DRIFT] Refit recommended: " + "; ".join(report["reasons"]))
+    else:
+        print("[DRIFT] No refit needed.")
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "assign":
+        assign_main(sys.argv[2:])
+    else:
+        main()
@@ -1,58 +1,63 @@
-# Selection of 1 representative seed per cluster
+# Selection of representative seeds per cluster (1 by default, --top-k N)
 # Input : CSV (id,url, url_tokens|tokens), NPZ (X, labels, centers)
+#         (or a pipeline dataset directory for either / both, see dataset.py)
 # Output: JSON 
+#
+# Usage: python select_representatives_git.py <data_tokens_csv> <features_npz> <out_json>
+#          [--top-k 1] [--diverse] [--chunk-rows 65536]
 
 import sys, json
+import argparse
 from pathlib import Path
-import numpy as np
-import pandas as pd
-from sklearn.metrics import pairwise_distances_argmin_min  
 
+from dataset import AlignmentError, load_frame, load_features
+from metrics import stage
+from representatives import CHUNK_ROWS, representative_records, select, token_column
+
+ap = argparse.ArgumentParser()
+ap.add_argument("csv", help="Tokenised CSV or dataset dir")
+ap.add_argument("npz", help="features.npz (X, labels, centers) or dataset dir")
+ap.add_argument("out", help="Output JSON")
+ap.add_argument("--top-k", type=int, default=1, help="Representatives per cluster")
+ap.add_argument("--diverse", action="store_true",
+                help="Spread-out representatives (farthest-point sampling) instead of the k nearest")
+ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows of X read at a time")
 if len(sys.argv) < 4:
-    print("Usage: python select_representatives_git.py <data_tokens_csv> <features_npz> <out_json>")
+    print("Usage: python select_representatives_git.py <data_tokens_csv> <features_npz> <out_json> "
+          "[--top-k N] [--diverse]")
     sys.exit(1)
+args = ap.parse_args()
 
-csv_path = Path(sys.argv[1])
-npz_path = Path(sys.argv[2])
-out_path = Path(sys.argv[3])
+csv_path = Path(args.csv)
+npz_path = Path(args.npz)
+out_path = Path(args.out)
 
-# Load data
-df = pd.read_csv(csv_path)
-arr = np.load(npz_path, allow_pickle=True)
+# Load data (only the needed columns; rows of X / labels must match the table)
+df = load_frame(csv_path, columns=['url', 'url_tokens', 'tokens', 'dup_count'])
+try:
+    arr = load_features(npz_path, ['X', 'labels', 'centers'], df=df)
+except AlignmentError as e:
+    print(f"[ERR] {e}")
+    sys.exit(3)
 X = arr['X']             # (n_samples, n_features)
 labels = arr['labels']   # (n_samples,)
 centers = arr['centers'] # (k, n_features)
 
-# Synchronize sizes if needed
-if len(df) != len(labels):
-    n = min(len(df), len(labels))
-    df = df.iloc[:n].reset_index(drop=True)
-    X = X[:n]
-    labels = labels[:n]
-
 # Tokens column 
-tok_col = 'url_tokens' if 'url_tokens' in df.columns else ('tokens' if 'tokens' in df.columns else None)
-if tok_col is None:
+if token_column(df) is None:
     print("[ERR] CSV must have 'url_tokens' or 'tokens'")
     sys.exit(2)
 
-df['cluster'] = labels
-
-# “closest-to-centroid” selection via scikit-learn
-closest_idx, _ = pairwise_distances_argmin_min(centers, X)  # index du point le + proche par centroïde
+# “closest-to-centroid” selection, each cluster against its own center only
+with stage("representatives", rows_in=len(labels)) as st:
+    picks = select(X, labels, centers, top_k=max(1, args.top_k), diverse=args.diverse, chunk_rows=args.chunk_rows)
+    st.rows_out = len(picks)
+empty = len(centers) - len({c for c, *_ in picks})
+if empty:
+    print(f"[WARN] {empty} cluster(s) without any point, no representative")
 
 # Output building
-sizes = df.groupby('cluster').size().to_dict()
-selected = []
-for cluster_id, idx in enumerate(closest_idx):
-    row = df.iloc[int(idx)]
-    selected.append({
-        "cluster": int(cluster_id),
-        "id": int(row.get('id', -1)) if 'id' in row else None,
-        "url": row.get('url', ''),
-        "tokens": row.get(tok_col, ''),
-        "_cluster_size": int(sizes.get(cluster_id, 0)),
-    })
+selected = representative_records(df, labels, picks, ranked=args.top_k > 1 or args.diverse)
 
 # JSON writing
 out_path.parent.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,90 @@
+# URL canonicalization pipeline used by the crawl frontier (crawling.py)
+# Two links to the same page must map to the same string, otherwise each variant
+# costs one page of the MAX_PAGES budget.
+
+import posixpath
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, quote_plus, unquote_plus, urlencode
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Volatile query params: nonces, cache busters, tracking
+DROP_PARAMS = frozenset({
+    "_wpnonce", "_wp_http_referer", "ver", "_", "doing_wp_cron",
+    "fbclid", "gclid", "phpsessid",
+})
+DROP_PREFIXES = ("utm_",)
+
+def _clean_path(path: str, strip_trailing_slash: bool) -> str:
+    if not path:
+        return "/"
+    had_slash = path.endswith("/")
+    # resolve "." / ".." and duplicate slashes
+    path = posixpath.normpath(path)
+    if path.startswith("//"):
+        path = "/" + path.lstrip("/")
+    if path == ".":
+        path = "/"
+    if had_slash and not strip_trailing_slash and path != "/":
+        path += "/"
+    return path
+
+def _clean_query(query: str, drop_params, drop_prefixes, sort_query: bool) -> str:
+    if not query:
+        return ""
+    pairs = []
+    for part in query.split("&"):
+        if not part:
+            continue
+        k, eq, v = part.partition("=")
+        k, v = unquote_plus(k), unquote_plus(v)
+        kl = k.lower()
+        if kl in drop_params or kl.startswith(drop_prefixes):
+            continue
+        # "?flag" stays "?flag" (a key without "=" is not the same request as "?flag=")
+        pairs.append((k, urlencode([(k, v)]) if eq else quote_plus(k)))
+    if sort_query:
+        pairs.sort(key=lambda kv: kv[0])   # stable: repeated keys keep their order
+    return "&".join(p for _, p in pairs)
+
+def make_canonicalizer(drop_params=DROP_PARAMS, drop_prefixes=DROP_PREFIXES,
+                       sort_query: bool = True, strip_trailing_slash: bool = True,
+                       cache_size: int = 65536):
+    """Build a memoized `canonicalize(url) -> str` with the given rules.
+
+    Steps: drop fragment, fold scheme/host case, drop default port, resolve dot
+    segments, drop volatile params, sort query keys, fold the trailing slash.
+    """
+    drop_params = frozenset(p.lower() for p in drop_params)
+    drop_prefixes = tuple(p.lower() for p in drop_prefixes)
+
+    @lru_cache(maxsize=cache_size)
+    def canonicalize(u: str) -> str:
+        if not u:
+            return ""
+        try:
+            p = urlsplit(u.strip())
+            port = p.port
+        except ValueError:
+            return u.strip()
+        scheme = p.scheme.lower()
+        host = (p.hostname or "").lower()
+        if ":" in host:
+            host = f"[{host}]"      # IPv6 literal: hostname drops the brackets
+        if port is not None and port != DEFAULT_PORTS.get(scheme):
+            host = f"{host}:{port}"
+        if p.username or p.password:
+            auth = p.username or ""
+            if p.password:
+                auth += f":{p.password}"
+            host = f"{auth}@{host}"
+        if not scheme or not host:
+            # relative / opaque URL: only drop the fragment
+            return urlunsplit(p._replace(fragment=""))
+        path = _clean_path(p.path, strip_trailing_slash)
+        query = _clean_query(p.query, drop_params, drop_prefixes, sort_query)
+        return urlunsplit((scheme, host, path, query, ""))
+
+    return canonicalize
+
+canonicalize = make_canonicalizer()
@@ -0,0 +1,197 @@
+# Batched URL tokenizer engine used by tokenise_with_url2vec.py
+#
+# Mode choice (decided on the first batch, then kept for the whole input):
+#   1. url2vec get_sequences(file)      -> per task, through a temporary file
+#   2. url2vec tokenize_* per URL part  -> scheme://host and each "/segment" tokenized
+#                                          separately, the host and path prefixes
+#                                          memoized in an LRU cache
+#   3. url2vec tokenize_* per URL       -> no cache (crawled URLs are all distinct)
+#   4. regex split on / ? = & - _ . :   -> vectorized pandas string op, no pool
+# Modes 1-3 run on a process pool, in tasks of `task_size` URLs.
+# Mode 2 is used when the tokens of the parts, joined, give the tokens of the
+# whole URL for every URL of the first batch; the host and the path prefixes
+# repeat across URLs, so most parts are cache hits. Otherwise mode 3.
+
+import re
+import sys
+import tempfile
+from functools import lru_cache
+from multiprocessing import Pool
+from pathlib import Path
+
+import pandas as pd
+
+SPLIT_RE = re.compile(r'[\/\?\=\&\-\_\.\:]+')
+
+MODE_GET_SEQUENCES = "get_sequences(file)"
+MODE_TOKENIZE_PARTS = "url2vec.tokenize_* per URL part (memoized)"
+MODE_TOKENIZE = "url2vec.tokenize_* per-url"
+_HOST_RE = re.compile(r"[^:/?#]+://[^/?#]*")
+MODE_REGEX = "fallback-regex"
+
+def load_url2vec(u2v_root: Path, quiet: bool = False):
+    """(get_sequences, tokenize_fn) from a url2vec checkout; None for what is missing."""
+    u2v_root = Path(u2v_root)
+    candidates = []
+    if (u2v_root / "url2vec").is_dir():
+        candidates += [u2v_root, u2v_root / "url2vec"]
+    else:
+        candidates += [u2v_root]
+    for c in candidates:
+        if str(c) not in sys.path:
+            sys.path.append(str(c))
+
+    get_sequences = None
+    tokenize_fn = None
+    try:
+        import url2vec.util.seqmanager as seq_mod  # type: ignore
+        # available functions depending on repository version
+        get_sequences = getattr(seq_mod, "get_sequences", None)
+        # some versions provide tokenize / tokenize_url / tokens_from_url, etc.
+        for name in ("tokenize", "tokenize_url", "tokens_from_url"):
+            if hasattr(seq_mod, name):
+                tokenize_fn = getattr(seq_mod, name)
+                break
+    except Exception as e:
+        if not quiet:
+            print("[WARN] Failed to import url2vec.util.seqmanager:", e)
+            print("→ A local fallback will be used if necessary.")
+    return get_sequences, tokenize_fn
+
+def as_text(seq) -> str:
+    """Token sequence (list / str / None) -> space-joined tokens."""
+    if seq is None:
+        return ""
+    if isinstance(seq, str):
+        return " ".join(seq.split())
+    return " ".join(str(t) for t in seq)
+
+def regex_tokens(urls: pd.Series) -> pd.Series:
+    """Vectorized fallback: same output as " ".join(p for p in SPLIT_RE.split(u) if p)."""
+    return urls.astype(str).str.replace(SPLIT_RE.pattern, " ", regex=True).str.strip()
+
+def url_parts(u: str):
+    """scheme://host, then the path split before each "/" (the query stays in the last part)."""
+    m = _HOST_RE.match(u)
+    head = m.group(0) if m else ""
+    return ([head] if head else []) + [p for p in re.split(r"(?=/)", u[len(head):]) if p]
+
+def tokens_of_parts(tok, u: str, last=None) -> str:
+    """Space-joined tokens of `u`, from tok(part) -> text for each URL part
+    (`last` for the last part, which holds the query and rarely repeats)."""
+    parts = url_parts(u)
+    texts = [tok(p) for p in parts[:-1]] + [(last or tok)(p) for p in parts[-1:]]
+    return " ".join(t for t in texts if t)
+
+def sequences_from_file(get_sequences, url_list):
+    """Write a temporary file of URLs and call get_sequences(path)"""
+    with tempfile.NamedTemporaryFile("w", delete=False, encoding="utf-8") as tmpf:
+        tmp_path = Path(tmpf.name)
+        for u in url_list:
+            tmpf.write(u.strip() + "\n")
+    try:
+        return list(get_sequences(str(tmp_path)))  # force full reading
+    finally:
+        try:
+            tmp_path.unlink(missing_ok=True)
+        except Exception:
+            pass
+
+# ---- pool workers (state set once per process by _init_worker) ----
+_W = {}
+
+def _init_worker(u2v_root, mode: str, cache_size: int):
+    get_sequences, tokenize_fn = load_url2vec(u2v_root, quiet=True)
+    _W["mode"] = mode
+    _W["get_sequences"] = get_sequences
+
+    def tokenize(u: str) -> str:
+        try:
+            return as_text(tokenize_fn(u))
+        except Exception:
+            return ""
+    if mode == MODE_TOKENIZE_PARTS:
+        cached = lru_cache(maxsize=cache_size)(tokenize)
+        _W["tokenize"] = lambda u: tokens_of_parts(cached, u, last=tokenize)
+    else:
+        _W["tokenize"] = tokenize
+
+def _tokenize_task(urls):
+    if _W["mode"] == MODE_GET_SEQUENCES:
+        seqs = sequences_from_file(_W["get_sequences"], urls)
+        if len(seqs) != len(urls):
+            raise ValueError(f"get_sequences returned {len(seqs)} sequences for {len(urls)} URLs")
+        return [as_text(s) for s in seqs]
+    tok = _W["tokenize"]
+    return [tok(u) for u in urls]
+
+class TokenizerEngine:
+    def __init__(self, u2v_root: Path, workers: int = 1, cache_size: int = 200_000,
+                 task_size: int = 5000):
+        self.u2v_root = Path(u2v_root)
+        self.workers = max(1, workers)
+        self.cache_size = cache_size
+        self.task_size = task_size
+        self.get_sequences, self.tokenize_fn = load_url2vec(self.u2v_root)
+        self.mode = None
+        self._pool = None
+
+    def _choose_mode(self, sample):
+        if callable(self.get_sequences):
+            try:
+                print("[INFO] Tokenization via get_sequences(<tmp file>) ...")
+                seqs = sequences_from_file(self.get_sequences, sample)
+                if len(seqs) == len(sample) and len(seqs) > 0:
+                    return MODE_GET_SEQUENCES
+                print(f"[WARN] get_sequences returned {len(seqs)} sequences for {len(sample)} URLs.")
+            except Exception as e:
+                print("[WARN] get_sequences(file) failed:", e)
+        if callable(self.tokenize_fn):
+            print("[INFO] Switching to URL-by-URL tokenization via url2vec.util.seqmanager …")
+            if self._parts_compose(sample):
+                print("[INFO] Tokens compose over host / path segments: memoizing the parts")
+                return MODE_TOKENIZE_PARTS
+            return MODE_TOKENIZE
+        print("[INFO] Local fallback: regex split on / ? = & - _ . :")
+        return MODE_REGEX
+
+    def _parts_compose(self, sample) -> bool:
+        """tokens(url) == tokens of its parts joined, for every URL of `sample`."""
+        def tok(u):
+            try:
+                return as_text(self.tokenize_fn(u))
+            except Exception:
+                return ""
+        try:
+            return all(tok(u) == tokens_of_parts(tok, u) for u in sample)
+        except Exception:
+            return False
+
+    def _start(self):
+        init_args = (str(self.u2v_root), self.mode, self.cache_size)
+        if self.workers > 1:
+            self._pool = Pool(self.workers, initializer=_init_worker, initargs=init_args)
+        else:
+            _init_worker(*init_args)
+
+    def tokenize(self, urls: pd.Series) -> pd.Series:
+        """Space-joined tokens for each URL, same index as `urls`."""
+        if self.mode is None:
+            self.mode = self._choose_mode(urls.astype(str).head(self.task_size).tolist())
+            if self.mode != MODE_REGEX:
+                self._start()
+        if self.mode == MODE_REGEX:
+            return regex_tokens(urls)
+        lst = urls.astype(str).tolist()
+        tasks = [lst[i:i + self.task_size] for i in range(0, len(lst), self.task_size)]
+        run = self._pool.imap if self._pool is not None else map
+        out = []
+        for toks in run(_tokenize_task, tasks):
+            out.extend(toks)
+        return pd.Series(out, index=urls.index, dtype=object)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None